@@ -1,110 +1,196 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, Person, User, EditHistory
+from models import db, Person, PeopleStat, User
 from config import Config
-from sqlalchemy import or_, and_, func
+from sqlalchemy import func
+import csv
+import io
+import json
+import os
+from datetime import datetime
+import counts
+import user_cache
+import stats
+import locations
+import db_tuning
+import repository
+import audit_log
+import perf
+import history_partitions
+import columnar
+from pagination import keyset_paginate, encode_cursor
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
+# Per-request timing and the slow-query log; the engine has to open its
+# connections with the monitor's sqlite3 connection class
+perf_monitor = None
+if app.config['PERF_MONITORING']:
+    perf_monitor = perf.PerfMonitor(slow_ms=app.config['PERF_SLOW_QUERY_MS'],
+                                    log_path=app.config['PERF_SLOW_QUERY_LOG'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = perf_monitor.engine_options(
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'], app.config['SQLALCHEMY_DATABASE_URI'])
+    perf_monitor.init_app(app)
+
 db.init_app(app)
+counts.configure(ttl=app.config['COUNT_CACHE_TTL'])
+user_cache.configure(ttl=app.config['USER_CACHE_TTL'])
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# SQLite performance optimizations
-@app.before_request
-def before_request():
-    """Optimize SQLite for better performance"""
-    if 'sqlite' in app.config['SQLALCHEMY_DATABASE_URI']:
-        db.session.execute(db.text('PRAGMA journal_mode=WAL'))
-        db.session.execute(db.text('PRAGMA synchronous=NORMAL'))
-        db.session.execute(db.text('PRAGMA cache_size=10000'))
-        db.session.execute(db.text('PRAGMA temp_store=MEMORY'))
+# SQLite performance optimizations, applied once per pooled connection
+with app.app_context():
+    db_tuning.install(db.engine, app.config['SQLITE_PRAGMAS'])
+    people_repository = repository.PeopleRepository(repository.SQLAlchemyBackend(db.engine))
+    if perf_monitor is not None:
+        perf_monitor.database = db.engine.url.database
+
+# edit_history rows are written in batches off the request path
+audit = audit_log.AuditWriter(people_repository.backend,
+                              batch_size=app.config['AUDIT_BATCH_SIZE'],
+                              flush_interval=app.config['AUDIT_FLUSH_SECONDS'])
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Served from an in-process cache; see user_cache.py
+    return user_cache.load_user(User, user_id)
+
+def stats_available():
+    """True once people_stats has been built (python stats.py)"""
+    connection = db.session.connection().connection
+    return stats.has_stats(connection, cache_key=str(db.engine.url))
+
+def aggregate_count(filters):
+    """Exact search count from people_stats for location/gender/age-only filters"""
+    if not stats_available():
+        return None
+    query = db.session.query(func.coalesce(func.sum(PeopleStat.count), 0))
+    if filters.get('manager_province'):
+        query = query.filter(PeopleStat.province == filters['manager_province'])
+    if filters.get('gender'):
+        query = query.filter(PeopleStat.gender == filters['gender'])
+    if filters.get('age') is not None:
+        query = query.filter(PeopleStat.age == filters['age'])
+    # Same substring semantics as build_search_query()
+    for field in ('province', 'district', 'commune', 'village'):
+        if filters.get(field):
+            query = query.filter(getattr(PeopleStat, field).ilike(f"%{filters[field]}%"))
+    return query.scalar()
+
+counts.set_aggregate_source(aggregate_count)
 
 def log_action(action, person_id=None, details=None):
-    """Log user actions to edit history"""
+    """Log user actions to edit history (queued, see audit_log.py)"""
     if current_user.is_authenticated:
-        history = EditHistory(
-            user_id=current_user.id,
-            person_id=person_id,
-            action=action,
-            details=details
-        )
-        db.session.add(history)
-        db.session.commit()
+        audit.log(current_user.id, action, person_id=person_id, details=details)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def search_filters(args):
+    """Parse the search filters from request arguments into a normalized dict"""
+    # Province managers can only see their province
+    manager_province = current_user.province if current_user.role == 'manager' else None
+    return repository.normalize_filters(args, manager_province=manager_province)
+
+def build_search_query(filters):
+    """Build the people query for a filter dict from search_filters()"""
+    # The same conditions the desktop GUIs use (see repository.py)
+    where, params = people_repository.where(
+        filters, Person.__tablename__, conn=db.session.connection().connection
+    )
+    return Person.query.filter(db.text(where).bindparams(**params))
+
 @app.route('/search')
 @login_required
 def search():
     page = request.args.get('page', 1, type=int)
-    person_id = request.args.get('id', '').strip()
-    name = request.args.get('name', '').strip()
-    gender = request.args.get('gender', '').strip()
-    age_str = request.args.get('age', '').strip()
-    province = request.args.get('province', '').strip()
-    district = request.args.get('district', '').strip()
-    commune = request.args.get('commune', '').strip()
-    village = request.args.get('village', '').strip()
+    cursor = request.args.get('cursor', '').strip()
+    after_id = request.args.get('after_id', type=int)
     
-    # Build query with optimized filters
-    query = Person.query
-    
-    # Province managers can only see their province
-    if current_user.role == 'manager' and current_user.province:
-        query = query.filter(Person.province == current_user.province)
+    filters = search_filters(request.args)
+    query = build_search_query(filters)
     
-    if person_id:
-        try:
-            pid = int(person_id)
-            query = query.filter(Person.id == pid)
-        except ValueError:
-            pass
-    if name:
-        # Search in both first_name, last_name, and full name
-        query = query.filter(
-            or_(
-                Person.first_name.ilike(f'%{name}%'),
-                Person.last_name.ilike(f'%{name}%'),
-                Person.name.ilike(f'%{name}%')
-            )
-        )
-    if gender:
-        query = query.filter(Person.gender == gender)
-    if age_str:
-        try:
-            age = int(age_str)
-            query = query.filter(Person.age == age)
-        except ValueError:
-            pass
-    if province:
-        query = query.filter(Person.province.ilike(f'%{province}%'))
-    if district:
-        query = query.filter(Person.district.ilike(f'%{district}%'))
-    if commune:
-        query = query.filter(Person.commune.ilike(f'%{commune}%'))
-    if village:
-        query = query.filter(Person.village.ilike(f'%{village}%'))
+    # Cached, aggregate-backed or estimated count - never a blocking COUNT(*)
+    count = counts.count_results(
+        query, filters, Person.id,
+        estimate_threshold=app.config['COUNT_ESTIMATE_THRESHOLD']
+    )
     
-    # Use count with optimization - only count if needed
-    total = query.count()
+    # Seek on the primary key instead of OFFSET so deep pages stay fast
+    if not cursor and after_id is not None:
+        cursor = encode_cursor({'k': [after_id], 'd': 'n', 'p': None})
+    pagination = keyset_paginate(query, [Person.id], per_page=100,
+                                 cursor=cursor, page=page, total=count.value)
     
-    # Paginate with optimized query
-    pagination = query.paginate(page=page, per_page=100, error_out=False)
+    # Current filters, carried through the next/prev links
+    filter_args = {key: value for key, value in request.args.items()
+                   if key not in ('page', 'cursor', 'after_id') and value}
     
     return render_template('search.html', 
                          people=pagination.items,
                          pagination=pagination,
-                         total=total)
+                         filter_args=filter_args,
+                         total=count.value,
+                         total_exact=count.exact)
+
+# Export formats: (mimetype, file extension)
+EXPORT_FORMATS = {'csv': ('text/csv', 'csv'), 'jsonl': ('application/x-ndjson', 'jsonl')}
+
+def export_chunks(rows, fmt, rows_per_chunk=1000):
+    """Encode result rows as CSV or JSON Lines, yielding text in chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(repository.RESULT_COLUMNS)
+    pending = 0
+    for row in rows:
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(repository.RESULT_COLUMNS, row)), ensure_ascii=False))
+            buffer.write('\n')
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.route('/search/export')
+@login_required
+def export_search():
+    """Stream every result of a search as CSV or JSON Lines (?format=csv|jsonl)"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format: {fmt}"}), 400
+    
+    # Same filters and province restriction as search()
+    filters = search_filters(request.args)
+    log_action('export', details=f"Exported search results as {fmt}: "
+                                 f"{dict(counts.filter_key(filters))}")
+    
+    # Rows come in keyset batches on a connection of their own, held only
+    # while the response streams; nothing is loaded into the ORM
+    rows = people_repository.iter_rows(filters, batch_size=app.config['EXPORT_BATCH_SIZE'])
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"people_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return Response(export_chunks(rows, fmt), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/search/count')
+@login_required
+def search_count():
+    """Exact result count for a search, fetched lazily when /search shows an estimate"""
+    filters = search_filters(request.args)
+    count = counts.count_results(build_search_query(filters), filters, Person.id, exact=True)
+    return jsonify({'count': count.value, 'exact': count.exact})
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -184,6 +270,8 @@ def create_user():
     )
     db.session.add(user)
     db.session.commit()
+    # SQLite may hand out the id of a deleted user again
+    user_cache.invalidate(user.id)
     log_action('create_user', details=f'Created user: {username} (role: {role}, province: {province})')
     flash('User created successfully')
     return redirect(url_for('users'))
@@ -202,6 +290,7 @@ def delete_user(user_id):
     username = user.username
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user_id)
     log_action('delete_user', details=f'Deleted user: {username}')
     flash('User deleted')
     return redirect(url_for('users'))
@@ -210,57 +299,190 @@ def delete_user(user_id):
 @login_required
 def history():
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '').strip()
     
-    # Use joinedload to avoid N+1 queries
-    query = EditHistory.query.order_by(EditHistory.timestamp.desc())
+    # Include actions still waiting in the audit queue
+    audit.flush(timeout=5)
     
     # Super admin sees all, managers see only their own
-    if current_user.role == 'manager':
-        query = query.filter_by(user_id=current_user.id)
+    user_id = current_user.id if current_user.role == 'manager' else None
     
-    # The relationship is already set to lazy='joined' in the model
-    pagination = query.paginate(page=page, per_page=50, error_out=False)
+    # Newest first, seeking on (timestamp, id) through only the monthly
+    # partitions the page falls in
+    pagination = history_partitions.paginate(db.session.connection().connection,
+                                             per_page=50, cursor=cursor, page=page,
+                                             user_id=user_id)
     return render_template('history.html', history=pagination.items, pagination=pagination)
 
+def compressed_response(payload):
+    """Serve a precompressed payload in the best encoding the client accepts"""
+    encoding = next((e for e in ('br', 'gzip')
+                     if e in payload.encodings and request.accept_encodings.quality(e) > 0), None)
+    if encoding:
+        response = app.response_class(payload.encodings[encoding], mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f'{payload.etag}-{encoding}')
+    else:
+        response = app.response_class(payload.body, mimetype='application/json')
+        response.set_etag(payload.etag)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response.make_conditional(request)
+
 @app.route('/api/locations')
 @login_required
 def get_locations():
     """API endpoint to get location data for cascading dropdowns"""
-    import json
-    try:
-        with open('cambodia_locations_real.json', 'r', encoding='utf-8') as f:
-            locations = json.load(f)
-        return jsonify(locations)
-    except FileNotFoundError:
+    payload = locations.gazetteer.get()
+    if payload is None:
         return jsonify({})
+    return compressed_response(payload)
+
+@app.route('/api/locations/<province>')
+@login_required
+def get_province_locations(province):
+    """Location subtree for one province, so a dropdown needn't load the whole country"""
+    payload = locations.gazetteer.get(province)
+    if payload is None:
+        return jsonify({}), 404
+    return compressed_response(payload)
+
+def location_response(*path):
+    """Serve one level of the in-memory location tree with a strong ETag"""
+    tree = locations.get_tree(lambda: db.session.connection().connection)
+    body, etag = tree.payload(*path)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+_snapshot = None
+
+def columnar_snapshot():
+    """The columnar snapshot, reopened after columnar.py rewrites it; None without pyarrow or a snapshot"""
+    global _snapshot
+    path = app.config['COLUMNAR_SNAPSHOT_DIR']
+    if columnar.pa is None or not columnar.has_snapshot(path):
+        return None
+    mtime = os.path.getmtime(os.path.join(path, columnar.MANIFEST))
+    if _snapshot is None or _snapshot[0] != mtime:
+        _snapshot = (mtime, columnar.Snapshot(path))
+    return _snapshot[1]
+
+@app.route('/api/stats')
+@login_required
+def get_stats():
+    """
+    Head counts from people_stats, optionally grouped (e.g. ?group_by=province,gender).
+    ?source=columnar reads the Parquet snapshot instead (columnar.py), which
+    is also the fallback when people_stats has not been built.
+    """
+    source = request.args.get('source', 'auto')
+    snapshot = None
+    if source == 'columnar' or (source == 'auto' and not stats_available()):
+        snapshot = columnar_snapshot()
+        if snapshot is None:
+            if source == 'columnar':
+                return jsonify({'error': 'No columnar snapshot. Run: python columnar.py'}), 503
+            return jsonify({'error': 'Statistics not built. Run: python stats.py'}), 503
+    
+    group_by = [c.strip() for c in request.args.get('group_by', '').split(',') if c.strip()]
+    invalid = [c for c in group_by if c not in stats.KEY_COLUMNS]
+    if invalid:
+        return jsonify({'error': f"Cannot group by: {', '.join(invalid)}"}), 400
+    
+    if snapshot is not None:
+        filters = {field: request.args.get(field, '').strip()
+                   for field in ('province', 'district', 'commune', 'village', 'gender')}
+        filters['age'] = request.args.get('age', type=int)
+        # Province managers only see their own province
+        if current_user.role == 'manager' and current_user.province:
+            if filters['province'] and filters['province'] != current_user.province:
+                return jsonify({'total': 0, 'groups': []})
+            filters['province'] = current_user.province
+        total, groups = snapshot.aggregate(group_by, filters,
+                                           min_age=request.args.get('min_age', type=int),
+                                           max_age=request.args.get('max_age', type=int))
+        return jsonify({'total': total, 'groups': groups})
+    
+    columns = [getattr(PeopleStat, c) for c in group_by]
+    query = db.session.query(*columns, func.sum(PeopleStat.count))
+    
+    # Province managers only see their own province
+    if current_user.role == 'manager' and current_user.province:
+        query = query.filter(PeopleStat.province == current_user.province)
+    for field in ('province', 'district', 'commune', 'village', 'gender'):
+        value = request.args.get(field, '').strip()
+        if value:
+            query = query.filter(getattr(PeopleStat, field) == value)
+    age = request.args.get('age', type=int)
+    min_age = request.args.get('min_age', type=int)
+    max_age = request.args.get('max_age', type=int)
+    if age is not None:
+        query = query.filter(PeopleStat.age == age)
+    if min_age is not None:
+        query = query.filter(PeopleStat.age >= min_age)
+    if max_age is not None:
+        query = query.filter(PeopleStat.age <= max_age)
+    
+    if columns:
+        query = query.group_by(*columns).having(func.sum(PeopleStat.count) > 0).order_by(*columns)
+        groups = [dict(zip(group_by, row[:-1]), count=row[-1]) for row in query.all()]
+        total = sum(group['count'] for group in groups)
+    else:
+        groups = []
+        total = query.scalar() or 0
+    return jsonify({'total': total, 'groups': groups})
+
+@app.route('/api/cache-stats')
+@login_required
+def get_cache_stats():
+    """Hit rates of the in-process caches (super admins only)"""
+    if current_user.role != 'super_admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify({'users': user_cache.cache_stats(), 'counts': counts.cache_stats()})
+
+@app.route('/admin/perf')
+@login_required
+def admin_perf():
+    """Request latency percentiles and SQL load per endpoint (super admins only)"""
+    if current_user.role != 'super_admin':
+        flash('Super Admin access required')
+        return redirect(url_for('index'))
+    if perf_monitor is None:
+        flash('Performance monitoring is disabled (PERF_MONITORING=0)')
+        return redirect(url_for('index'))
+    if request.args.get('reset'):
+        perf_monitor.reset()
+        return redirect(url_for('admin_perf'))
+    return render_template('perf.html', endpoints=perf_monitor.summary(),
+                           slow_ms=app.config['PERF_SLOW_QUERY_MS'],
+                           slow_log=app.config['PERF_SLOW_QUERY_LOG'],
+                           caches={'users': user_cache.cache_stats(), 'counts': counts.cache_stats()})
 
 @app.route('/api/provinces')
 @login_required
 def get_provinces():
-    """Get list of provinces from database"""
-    provinces = db.session.query(Person.province).distinct().order_by(Person.province).all()
-    return jsonify([p[0] for p in provinces])
+    """Get list of provinces"""
+    return location_response()
 
 @app.route('/api/districts/<province>')
 @login_required
 def get_districts(province):
     """Get districts for a specific province"""
-    districts = db.session.query(Person.district).filter_by(province=province).distinct().order_by(Person.district).all()
-    return jsonify([d[0] for d in districts])
+    return location_response(province)
 
 @app.route('/api/communes/<province>/<district>')
 @login_required
 def get_communes(province, district):
     """Get communes for a specific province and district"""
-    communes = db.session.query(Person.commune).filter_by(province=province, district=district).distinct().order_by(Person.commune).all()
-    return jsonify([c[0] for c in communes])
+    return location_response(province, district)
 
 @app.route('/api/villages/<province>/<district>/<commune>')
 @login_required
 def get_villages(province, district, commune):
     """Get villages for a specific province, district, and commune"""
-    villages = db.session.query(Person.village).filter_by(province=province, district=district, commune=commune).distinct().order_by(Person.village).all()
-    return jsonify([v[0] for v in villages])
+    return location_response(province, district, commune)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,186 @@
+"""
+Buffered audit log writer
+log_action() used to insert and commit one edit_history row per event, so
+every login, logout and search paid for a synchronous commit. AuditWriter
+queues the rows instead and a background thread inserts them in batches:
+when `batch_size` rows are waiting or `flush_interval` seconds after the
+first one arrived, whichever comes first. Whatever is still queued is
+written on close() and at interpreter exit. Rows go to the monthly
+partitions of history_partitions.py
+"""
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+import history_partitions
+
+# Same text format SQLAlchemy uses for DateTime columns on SQLite
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Attempts at writing a batch before it is given up
+MAX_ATTEMPTS = 3
+
+_FLUSH = object()
+_STOP = object()
+
+
+class _FlushRequest:
+    """A flush() call waiting for the writer thread"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+
+
+class AuditWriter:
+    """
+    Batches edit_history inserts on a background thread.
+
+    `backend` is a repository backend (SQLiteBackend or SQLAlchemyBackend);
+    a connection is borrowed from it for each batch. log() only blocks when
+    `max_queue` rows are already waiting.
+    """
+
+    def __init__(self, backend, batch_size=100, flush_interval=1.0, max_queue=10000):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closing = False
+        self._exit_hook = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def log(self, user_id, action, person_id=None, details=None, timestamp=None):
+        """Queue one edit_history row (timestamp defaults to utcnow)"""
+        if timestamp is None:
+            timestamp = datetime.utcnow()
+        self._start()
+        self._queue.put((user_id, person_id, action, details, timestamp.strftime(TIMESTAMP_FORMAT)))
+
+    def flush(self, timeout=None):
+        """
+        Write everything queued so far. Returns False if `timeout` ran out
+        first or the rows could not be written.
+        """
+        if self._thread is None:
+            return True
+        request = _FlushRequest()
+        self._queue.put((_FLUSH, request))
+        return request.done.wait(timeout) and request.ok
+
+    def close(self, timeout=10):
+        """
+        Write the remaining rows and stop the background thread. Returns
+        False if the thread is still writing after `timeout` seconds; it
+        stays the only writer, and close() can be called again.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return True
+            self._closing = True
+        self._queue.put((_STOP, None))
+        thread.join(timeout)
+        if thread.is_alive():
+            print(f"⚠️  Audit log: writer still busy after {timeout}s")
+            return False
+
+        # Rows logged while the thread was stopping are written here
+        self._drain()
+        with self._lock:
+            self._thread = None
+            self._closing = False
+        return True
+
+    def _drain(self):
+        rows, requests = [], []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[0] is _FLUSH:
+                requests.append(item[1])
+            elif item[0] is not _STOP:
+                rows.append(item)
+        ok = not rows or self._write(rows)
+        if not ok:
+            self._give_up(rows)
+        for request in requests:
+            request.ok = ok
+            request.done.set()
+
+    def _give_up(self, rows):
+        print(f"⚠️  Audit log: giving up on {len(rows)} rows")
+        self.dropped += len(rows)
+
+    def _start(self):
+        with self._lock:
+            # While closing, rows only queue up: close() writes them once
+            # the stopping thread is gone, so there is never a second reader
+            if self._thread is None and not self._closing:
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+                # Once per writer, however often the thread is restarted
+                if not self._exit_hook:
+                    atexit.register(self.close)
+                    self._exit_hook = True
+
+    def _run(self):
+        pending = []
+        attempts = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            marker = item[0] if item is not None else None
+            if marker is not _FLUSH and marker is not _STOP and item is not None:
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(pending) < self.batch_size:
+                    continue
+
+            # Batch full, interval over, or an explicit flush/stop
+            written = True
+            while pending:
+                written = self._write(pending)
+                if written:
+                    pending, attempts = [], 0
+                    break
+                attempts += 1
+                if attempts >= MAX_ATTEMPTS:
+                    self._give_up(pending)
+                    pending, attempts = [], 0
+                # Retried on the next pass, unless the thread is stopping
+                elif marker is not _STOP:
+                    break
+            deadline = time.monotonic() + self.flush_interval if pending else None
+
+            if marker is _FLUSH:
+                item[1].ok = written
+                item[1].done.set()
+            elif marker is _STOP:
+                return
+
+    def _write(self, rows):
+        try:
+            with self.backend.connection() as conn:
+                history_partitions.insert_entries(conn, rows)
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️  Audit log write failed ({len(rows)} rows): {e}")
+            return False
+        self.written += len(rows)
+        self.batches += 1
+        return True
@@ -0,0 +1,160 @@
+"""
+Resumable batch migrations
+Walks a table by primary-key ranges (id > a AND id <= b) instead of
+LIMIT/OFFSET, records a checkpoint after every batch so an interrupted
+run resumes where it stopped, and sizes batches to hit a target commit
+latency
+"""
+import time
+from datetime import datetime
+
+CHECKPOINT_TABLE = 'migration_checkpoints'
+
+CREATE_CHECKPOINT_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+        name VARCHAR(100) NOT NULL PRIMARY KEY,
+        last_id INTEGER NOT NULL,
+        max_id INTEGER NOT NULL,
+        rows_done INTEGER NOT NULL DEFAULT 0,
+        batch_size INTEGER NOT NULL,
+        started_at DATETIME,
+        updated_at DATETIME,
+        finished_at DATETIME
+    )
+"""
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class BatchMigration:
+    """
+    Run `process(cursor, rows)` over a table in primary-key order.
+
+    `rows` are the selected `columns` (id first) for one id range. The
+    batch and its checkpoint commit together, so a batch is either fully
+    applied and recorded or not at all. Re-running a migration with the
+    same name continues after the last committed batch.
+
+    A finished migration is recorded and not run again, unless it is
+    `repeatable`: then its checkpoint is dropped once it finishes, so an
+    interrupted run still resumes but a completed one starts over (for
+    rewrites such as new random names, which should cover rows added since).
+    """
+
+    def __init__(self, conn, name, process, table='people', columns=('id',),
+                 batch_size=10000, target_seconds=0.5, min_batch=1000, max_batch=500000,
+                 report_every=5.0, repeatable=False):
+        self.conn = conn
+        self.name = name
+        self.process = process
+        self.table = table
+        self.columns = columns
+        self.batch_size = batch_size
+        self.target_seconds = target_seconds
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.report_every = report_every
+        self.repeatable = repeatable
+
+    def checkpoint(self):
+        """The saved (last_id, max_id, rows_done, batch_size, finished_at), or None"""
+        cursor = self.conn.cursor()
+        cursor.execute(CREATE_CHECKPOINT_SQL)
+        cursor.execute(
+            f"SELECT last_id, max_id, rows_done, batch_size, finished_at FROM {CHECKPOINT_TABLE} WHERE name = ?",
+            (self.name,)
+        )
+        return cursor.fetchone()
+
+    def reset(self):
+        """Forget the checkpoint so the next run starts from the beginning"""
+        cursor = self.conn.cursor()
+        cursor.execute(CREATE_CHECKPOINT_SQL)
+        cursor.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE name = ?", (self.name,))
+        self.conn.commit()
+
+    def _next_batch_size(self, size, elapsed):
+        """Scale toward the target latency, at most 2x up or down per batch"""
+        if elapsed <= 0:
+            return min(size * 2, self.max_batch)
+        factor = min(2.0, max(0.5, self.target_seconds / elapsed))
+        return int(min(self.max_batch, max(self.min_batch, size * factor)))
+
+    def run(self):
+        """Process every remaining id range; returns the rows processed by this run"""
+        cursor = self.conn.cursor()
+        saved = self.checkpoint()
+        now = datetime.utcnow()
+
+        if saved is not None and saved[4] is not None and self.repeatable:
+            # Recorded as finished before the migration was repeatable
+            self.reset()
+            saved = None
+        if saved is not None and saved[4] is not None:
+            print(f"✅ Migration '{self.name}' already finished on {saved[4]} ({saved[2]:,} rows)")
+            return 0
+        if saved is None:
+            cursor.execute(f"SELECT COALESCE(MIN(id), 1) - 1, COALESCE(MAX(id), 0) FROM {self.table}")
+            last_id, max_id = cursor.fetchone()
+            rows_done, size = 0, self.batch_size
+            cursor.execute(
+                f"INSERT INTO {CHECKPOINT_TABLE} (name, last_id, max_id, rows_done, batch_size, started_at, updated_at) "
+                f"VALUES (?, ?, ?, 0, ?, ?, ?)",
+                (self.name, last_id, max_id, size, now, now)
+            )
+            self.conn.commit()
+        else:
+            last_id, max_id, rows_done, size, _ = saved
+            print(f"🔄 Resuming '{self.name}' after id {last_id:,} ({rows_done:,} rows already done)")
+
+        first_id = last_id
+        select_sql = (
+            f"SELECT {', '.join(self.columns)} FROM {self.table} "
+            f"WHERE id > ? AND id <= ? ORDER BY id"
+        )
+        start = reported = time.perf_counter()
+        processed = 0
+
+        while last_id < max_id:
+            upper = min(last_id + size, max_id)
+            began = time.perf_counter()
+            cursor.execute(select_sql, (last_id, upper))
+            rows = cursor.fetchall()
+            if rows:
+                self.process(cursor, rows)
+            rows_done += len(rows)
+            cursor.execute(
+                f"UPDATE {CHECKPOINT_TABLE} SET last_id = ?, rows_done = ?, batch_size = ?, updated_at = ? "
+                f"WHERE name = ?",
+                (upper, rows_done, size, datetime.utcnow(), self.name)
+            )
+            self.conn.commit()
+            elapsed = time.perf_counter() - began
+
+            processed += len(rows)
+            last_id = upper
+            size = self._next_batch_size(size, elapsed)
+
+            now_seconds = time.perf_counter()
+            if now_seconds - reported >= self.report_every or last_id >= max_id:
+                reported = now_seconds
+                run_time = now_seconds - start
+                fraction = (last_id - first_id) / max(max_id - first_id, 1)
+                eta = run_time * (1 - fraction) / fraction if fraction else 0
+                print(f"   Progress: {rows_done:,} rows, id {last_id:,} / {max_id:,} "
+                      f"({processed / max(run_time, 1e-9):,.0f} rows/s, batch {size:,}, "
+                      f"ETA {_format_duration(eta)})")
+
+        if self.repeatable:
+            self.reset()
+        else:
+            cursor.execute(
+                f"UPDATE {CHECKPOINT_TABLE} SET finished_at = ? WHERE name = ?",
+                (datetime.utcnow(), self.name)
+            )
+            self.conn.commit()
+        return processed
@@ -0,0 +1,74 @@
+"""
+Benchmark: Python vs. set-based SQL name rewrite
+Fills a throwaway database, then rewrites every name twice with
+fast_update_khmer_names.py: once by drawing names in Python and sending
+them back in batched UPDATEs, once with the temp-table UPDATE ... FROM
+statements that never leave SQLite
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Khmer name rewrite paths")
+    parser.add_argument('--rows', type=int, default=500000, help="People in the test database")
+    parser.add_argument('--search-index', action='store_true',
+                        help="Build the FTS5 name index first, so its triggers fire on every update")
+    args = parser.parse_args()
+
+    # Point the app at a throwaway database before importing it
+    workdir = tempfile.mkdtemp(prefix='bench_names_')
+    os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'people.db')}"
+
+    import search_index
+    from app import app
+    from data_generator import generate_people_fast
+    from fast_update_khmer_names import generate_khmer_name_sql, update_names_python, update_names_sql
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+        generate_people_fast(args.rows, seed=1)
+        pools = generate_khmer_name_sql()
+        connection = db.engine.raw_connection()
+        if args.search_index:
+            search_index.create_search_index(connection)
+
+        def run(label, rewrite):
+            start = time.perf_counter()
+            updated = rewrite()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<22} {updated:>10,} rows in {elapsed:7.2f}s   {updated / elapsed:>12,.0f} rows/s")
+            return elapsed
+
+        print("=" * 60)
+        print(f"NAME REWRITE BENCHMARK: {args.rows:,} people"
+              f"{' (with FTS5 triggers)' if args.search_index else ''}")
+        print("=" * 60)
+        python_time = run("Python batches", lambda: update_names_python(connection, *pools, restart=True))
+        sql_time = run("SQL UPDATE ... FROM", lambda: update_names_sql(connection, *pools, seed=1))
+
+        # Every name must come from the pool for its gender
+        male_names, female_names, surnames = pools
+        cursor = connection.cursor()
+        cursor.execute("SELECT gender, name FROM people")
+        wrong = sum(1 for gender, name in cursor.fetchall()
+                    if name.split(' ')[0] not in (male_names if gender == 'male' else female_names)
+                    or name.split(' ')[1] not in surnames)
+        cursor.execute("SELECT COUNT(DISTINCT name) FROM people")
+        distinct = cursor.fetchone()[0]
+
+        print("-" * 60)
+        print(f"SQL path is {python_time / sql_time:.1f}x faster; "
+              f"{distinct:,} distinct names, {wrong} from the wrong pool")
+
+        connection.close()
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: per-request PRAGMAs vs. per-connection tuning
+Times authenticated requests through the Flask test client, first with
+the old before_request hook that re-ran four PRAGMAs on every request,
+then with only the connect-event tuning from db_tuning.py
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite PRAGMA placement")
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per mode")
+    parser.add_argument('--path', default='/api/provinces', help="Endpoint to request")
+    args = parser.parse_args()
+
+    # Point the app at a throwaway database before importing it
+    workdir = tempfile.mkdtemp(prefix='bench_pragmas_')
+    os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'people.db')}"
+
+    from sqlalchemy import event
+    from werkzeug.security import generate_password_hash
+    from app import app
+    from models import db, User
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='bench', password=generate_password_hash('bench'), role='super_admin'))
+        db.session.commit()
+        engine = db.engine
+
+    statements = [0]
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements[0] += 1
+
+    def legacy_pragmas():
+        """The hook app.py used to run before every request"""
+        db.session.execute(db.text('PRAGMA journal_mode=WAL'))
+        db.session.execute(db.text('PRAGMA synchronous=NORMAL'))
+        db.session.execute(db.text('PRAGMA cache_size=10000'))
+        db.session.execute(db.text('PRAGMA temp_store=MEMORY'))
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'bench', 'password': 'bench'})
+    if response.status_code != 302:
+        print("❌ Could not log in to the benchmark app")
+        sys.exit(1)
+
+    def run(label):
+        for _ in range(50):  # warm up
+            client.get(args.path)
+        statements[0] = 0
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            client.get(args.path)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        result = {
+            'mean': statistics.mean(timings),
+            'p50': timings[len(timings) // 2],
+            'p95': timings[int(len(timings) * 0.95)],
+            'statements': statements[0] / args.requests,
+        }
+        print(f"{label:<24} mean {result['mean']:.3f} ms   p50 {result['p50']:.3f} ms   "
+              f"p95 {result['p95']:.3f} ms   {result['statements']:.1f} SQL/request")
+        return result
+
+    print("=" * 60)
+    print(f"PRAGMA BENCHMARK: {args.requests:,} x GET {args.path}")
+    print("=" * 60)
+
+    app.before_request_funcs.setdefault(None, []).insert(0, legacy_pragmas)
+    before = run("per-request PRAGMAs")
+    app.before_request_funcs[None].remove(legacy_pragmas)
+    after = run("connect-event tuning")
+
+    saved = before['mean'] - after['mean']
+    print("-" * 60)
+    print(f"Saved {saved:.3f} ms/request ({saved / before['mean'] * 100:.1f}%), "
+          f"{before['statements'] - after['statements']:.1f} fewer statements per request")
+
+    engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
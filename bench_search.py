@@ -0,0 +1,331 @@
+"""
+Benchmark: search workloads on a reproducible dataset
+Generates (or reuses) a database of N people with data_generator.py and a
+fixed seed, builds the FTS5 name index and people_stats, then times a
+catalog of realistic searches two ways: GET /search through the Flask
+test client as an admin or a province manager, and the same filters
+straight through repository.PeopleRepository (one page plus an exact
+count). Results are written as JSON; pass an earlier file to --compare to
+see which cases got slower between two commits.
+
+    python bench_search.py --rows 1000000
+    python bench_search.py --rows 1000000 --compare bench_data/bench_search_1000000.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_PASSWORD = 'bench'
+
+# (case name, user, filters); values in <angle brackets> are picked from
+# the dataset by resolve_catalog(), the same way for every run
+CATALOG = [
+    ('all_first_page', 'admin', {}),
+    ('name_substring', 'admin', {'name': '<surname>'}),
+    ('name_partial', 'admin', {'name': '<name_part>'}),
+    ('name_gender', 'admin', {'name': '<first_name>', 'gender': 'female'}),
+    ('province_gender', 'admin', {'province': '<province>', 'gender': 'male'}),
+    ('age', 'admin', {'age': '35'}),
+    ('age_gender', 'admin', {'age': '55', 'gender': 'female'}),
+    ('village', 'admin', {'village': '<village>'}),
+    ('district_name', 'admin', {'district': '<district>', 'name': '<surname>'}),
+    ('no_match', 'admin', {'name': 'zzqx'}),
+    ('manager_all', 'manager', {}),
+    ('manager_name', 'manager', {'name': '<first_name>'}),
+    ('manager_age_gender', 'manager', {'age': '35', 'gender': 'male'}),
+    ('deep_page_all', 'admin', {'after_id': '<deep_id>'}),
+    ('deep_page_gender', 'admin', {'gender': 'female', 'after_id': '<deep_id>'}),
+    ('deep_page_manager', 'manager', {'after_id': '<deep_id>'}),
+]
+
+PAGE_SIZE = 100
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def prepare_dataset(db_path, rows, seed, fresh=False):
+    """Create the benchmark database unless an identical one is already there"""
+    from werkzeug.security import generate_password_hash
+    import search_index
+    import stats
+    from app import app
+    from data_generator import generate_people_fast
+    from models import db, User
+
+    with app.app_context():
+        db.create_all()
+        have = db.session.execute(db.text("SELECT COUNT(*) FROM people")).scalar()
+        if have != rows or fresh:
+            if have:
+                print(f"Dataset has {have:,} people, expected {rows:,}; regenerating")
+                db.session.execute(db.text("DELETE FROM people"))
+                db.session.commit()
+            generate_people_fast(rows, seed=seed)
+            connection = db.engine.raw_connection()
+            try:
+                search_index.create_search_index(connection, rebuild=True)
+                stats.build_stats(connection)
+            finally:
+                connection.close()
+
+        connection = db.engine.raw_connection()
+        try:
+            # Managers get the largest province, so their searches do real work
+            manager_province = connection.execute(
+                "SELECT province FROM locations GROUP BY province ORDER BY COUNT(*) DESC, province LIMIT 1"
+            ).fetchone()[0]
+        finally:
+            connection.close()
+
+        for username, role, province in (('bench_admin', 'super_admin', None),
+                                         ('bench_manager', 'manager', manager_province)):
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                db.session.add(User(username=username, password=generate_password_hash(BENCH_PASSWORD),
+                                    role=role, province=province))
+        db.session.commit()
+    return manager_province
+
+
+def resolve_catalog(db_path):
+    """Replace the <placeholders> in CATALOG with values from the dataset"""
+    from khmer_names import FEMALE_FIRST_NAMES, KHMER_SURNAMES
+
+    conn = sqlite3.connect(db_path)
+    try:
+        village, district, province = conn.execute(
+            "SELECT village, district, province FROM locations ORDER BY id LIMIT 1 OFFSET 100"
+        ).fetchone()
+        max_id = conn.execute("SELECT MAX(id) FROM people").fetchone()[0] or 0
+    finally:
+        conn.close()
+    values = {
+        'surname': KHMER_SURNAMES[0],
+        'name_part': KHMER_SURNAMES[1][:3].lower(),
+        'first_name': FEMALE_FIRST_NAMES[0],
+        'province': province,
+        'district': district,
+        'village': village,
+        'deep_id': str(int(max_id * 0.9)),
+    }
+    catalog = []
+    for name, user, filters in CATALOG:
+        resolved = {key: values[value[1:-1]] if value.startswith('<') else value
+                    for key, value in filters.items()}
+        catalog.append((name, user, resolved))
+    return catalog
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'min_ms': round(timings[0], 3),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+    }
+
+
+def server_timing(header):
+    """(db ms, statements) from the Server-Timing header perf.py sets, if any"""
+    db_ms = statements = None
+    for part in (header or '').split(','):
+        fields = [field.strip() for field in part.split(';')]
+        if fields[0] == 'db':
+            for field in fields[1:]:
+                if field.startswith('dur='):
+                    db_ms = float(field[4:])
+                elif field.startswith('desc='):
+                    statements = int(field[5:].strip('"').split()[0])
+    return db_ms, statements
+
+
+def bench_client(app, catalog, repeat):
+    """Time GET /search for every case through the Flask test client"""
+    import counts
+
+    clients = {}
+    for user, username in (('admin', 'bench_admin'), ('manager', 'bench_manager')):
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+        if response.status_code != 302:
+            print(f"❌ Could not log in as {username}")
+            sys.exit(1)
+        clients[user] = client
+
+    results = {}
+    for name, user, filters in catalog:
+        client = clients[user]
+        client.get('/search', query_string=filters)  # warm up
+        timings, db_times, statements = [], [], None
+        for _ in range(repeat):
+            # Every request pays for its own count, as a new search would
+            counts.invalidate()
+            start = time.perf_counter()
+            response = client.get('/search', query_string=filters)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                print(f"❌ {name}: HTTP {response.status_code}")
+                sys.exit(1)
+            db_ms, statements = server_timing(response.headers.get('Server-Timing'))
+            if db_ms is not None:
+                db_times.append(db_ms)
+        result = summarize(timings)
+        if db_times:
+            result['db_p50_ms'] = round(statistics.median(db_times), 3)
+            result['statements'] = statements
+        results[name] = result
+        print(f"  client {name:<22} p50 {result['p50_ms']:9.2f} ms   p95 {result['p95_ms']:9.2f} ms")
+    return results
+
+
+def bench_sql(db_path, catalog, manager_province, repeat):
+    """Time the same searches through PeopleRepository on a read-only connection"""
+    import counts
+    import repository
+
+    # A zero TTL makes every count() run its query
+    people = repository.PeopleRepository(repository.SQLiteBackend(db_path, read_only=True, pool_size=1),
+                                         counts.CountCache(ttl=0))
+    results = {}
+    with people.backend.connection() as conn:
+        for name, user, filters in catalog:
+            args = dict(filters)
+            after_id = int(args.pop('after_id')) if 'after_id' in args else None
+            parsed = repository.normalize_filters(
+                args, manager_province=manager_province if user == 'manager' else None)
+
+            def run():
+                rows = people.page(parsed, after_id=after_id, limit=PAGE_SIZE, conn=conn)
+                return len(rows), people.count(parsed, conn=conn)
+
+            run()  # warm up
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                page_rows, matches = run()
+                timings.append((time.perf_counter() - start) * 1000)
+            result = summarize(timings)
+            result.update(page_rows=page_rows, matches=matches)
+            results[name] = result
+            print(f"  sql    {name:<22} p50 {result['p50_ms']:9.2f} ms   p95 {result['p95_ms']:9.2f} ms   "
+                  f"{matches:>10,} matches")
+    people.backend.close()
+    return results
+
+
+def compare(current, baseline_path, threshold):
+    """Print p50 changes against an earlier result file; returns the number of regressions"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print("-" * 72)
+    print(f"Compared with {baseline_path} ({baseline['meta'].get('revision') or 'unknown revision'}, "
+          f"{baseline['meta']['rows']:,} rows)")
+    regressions = 0
+    for path in ('client', 'sql'):
+        for name, result in current.get(path, {}).items():
+            before = baseline.get(path, {}).get(name)
+            if not before:
+                continue
+            if baseline.get('cases', {}).get(name) != current['cases'][name]:
+                print(f"  {path:<6} {name:<22} (case changed, not compared)")
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / max(before['p50_ms'], 1e-9) * 100
+            flag = ''
+            if change > threshold:
+                flag = '  ⚠️  slower'
+                regressions += 1
+            if 'matches' in before and before.get('matches') != result.get('matches'):
+                flag += f"  ❌ matches {before['matches']:,} -> {result['matches']:,}"
+                regressions += 1
+            print(f"  {path:<6} {name:<22} {before['p50_ms']:9.2f} -> {result['p50_ms']:9.2f} ms "
+                  f"({change:+6.1f}%){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search workloads on a reproducible dataset")
+    parser.add_argument('--rows', type=int, default=1000000, help="People in the benchmark database")
+    parser.add_argument('--seed', type=int, default=42, help="data_generator seed")
+    parser.add_argument('--data-dir', default='bench_data', help="Where benchmark databases are kept between runs")
+    parser.add_argument('--fresh', action='store_true', help="Regenerate the dataset even if it exists")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per case")
+    parser.add_argument('--only', default='', help="Comma-separated case names to run")
+    parser.add_argument('--skip-client', action='store_true', help="Only time the raw SQL path")
+    parser.add_argument('--skip-sql', action='store_true', help="Only time the Flask path")
+    parser.add_argument('--output', default=None, help="JSON file for the results (default <data-dir>/bench_search_<rows>.json)")
+    parser.add_argument('--compare', default=None, help="Earlier JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help="p50 slowdown in percent reported as a regression by --compare")
+    args = parser.parse_args()
+
+    # One database per size and seed, reused by later runs; point the app
+    # at it before importing it, with the slow-query log out of the way
+    os.makedirs(args.data_dir, exist_ok=True)
+    db_path = os.path.abspath(os.path.join(args.data_dir, f"people_{args.rows}_{args.seed}.db"))
+    os.environ['DATABASE_URI'] = f"sqlite:///{db_path}"
+    os.environ['PERF_SLOW_QUERY_MS'] = str(10 ** 9)
+    os.environ['PERF_SLOW_QUERY_LOG'] = os.path.join(args.data_dir, 'slow_queries.log')
+
+    print("=" * 72)
+    print(f"SEARCH BENCHMARK: {args.rows:,} people (seed {args.seed}), {args.repeat} runs per case")
+    print("=" * 72)
+    start = time.perf_counter()
+    manager_province = prepare_dataset(db_path, args.rows, args.seed, fresh=args.fresh)
+    print(f"Dataset ready in {time.perf_counter() - start:.1f}s: {db_path}")
+
+    catalog = resolve_catalog(db_path)
+    if args.only:
+        wanted = {name.strip() for name in args.only.split(',')}
+        catalog = [case for case in catalog if case[0] in wanted]
+
+    results = {
+        'meta': {
+            'rows': args.rows,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'revision': git_revision(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'manager_province': manager_province,
+        },
+        'cases': {name: {'user': user, 'filters': filters} for name, user, filters in catalog},
+    }
+    if not args.skip_client:
+        from app import app
+        print("\nFlask test client (GET /search):")
+        results['client'] = bench_client(app, catalog, args.repeat)
+    if not args.skip_sql:
+        print("\nRaw SQL (PeopleRepository page + exact count):")
+        results['sql'] = bench_sql(db_path, catalog, manager_province, args.repeat)
+
+    output = args.output or os.path.join(args.data_dir, f"bench_search_{args.rows}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"\n✅ Results written to {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"❌ {regressions} regression(s)")
+            sys.exit(1)
+        print("✅ No regressions")
+
+
+if __name__ == '__main__':
+    main()
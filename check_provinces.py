@@ -9,7 +9,7 @@ for row in c.fetchall():
     print(f"  {row[0]}: {row[1]}")
 
 print("\nPeople provinces:")
-c.execute('SELECT DISTINCT province FROM people LIMIT 5')
+c.execute('SELECT DISTINCT province FROM people_view LIMIT 5')
 for row in c.fetchall():
     print(f"  {row[0]}")
 
@@ -3,6 +3,8 @@ System status checker - verify database and users
 """
 import sqlite3
 import os
+import stats
+import history_partitions
 
 def check_system():
     """Check database and user setup"""
@@ -39,12 +41,20 @@ def check_system():
         
         # Check people count
         if 'people' in tables:
-            cursor.execute("SELECT COUNT(*) FROM people")
-            people_count = cursor.fetchone()[0]
+            # Use the precomputed aggregates when they have been built
+            use_stats = stats.has_stats(conn)
+            if use_stats:
+                people_count = stats.total_people(conn)
+            else:
+                cursor.execute("SELECT COUNT(*) FROM people")
+                people_count = cursor.fetchone()[0]
             print(f"👥 Total People: {people_count:,}")
             
             # Count by province
-            cursor.execute("SELECT province, COUNT(*) FROM people GROUP BY province ORDER BY COUNT(*) DESC LIMIT 5")
+            if use_stats:
+                cursor.execute("SELECT province, SUM(count) FROM people_stats GROUP BY province ORDER BY SUM(count) DESC LIMIT 5")
+            else:
+                cursor.execute("SELECT province, COUNT(*) FROM people_view GROUP BY province ORDER BY COUNT(*) DESC LIMIT 5")
             print("\n   Top 5 Provinces:")
             for province, count in cursor.fetchall():
                 print(f"   - {province}: {count:,}")
@@ -79,16 +89,18 @@ def check_system():
                     print(f"   ... and {len(assigned) - 5} more")
         print()
         
-        # Check history
-        if 'edit_history' in tables:
-            cursor.execute("SELECT COUNT(*) FROM edit_history")
+        # Check history (monthly partitions still in the database)
+        history_tables = [source for month, kind, source in history_partitions.segments(conn) if kind == 'table']
+        if history_tables:
+            history_sql = " UNION ALL ".join(f"SELECT action FROM {table}" for table in history_tables)
+            cursor.execute(f"SELECT COUNT(*) FROM ({history_sql})")
             history_count = cursor.fetchone()[0]
-            print(f"📜 Action History Records: {history_count:,}")
+            print(f"📜 Action History Records: {history_count:,} in {len(history_tables)} partition(s)")
             
             if history_count > 0:
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT action, COUNT(*) 
-                    FROM edit_history 
+                    FROM ({history_sql}) 
                     GROUP BY action 
                     ORDER BY COUNT(*) DESC 
                     LIMIT 5
@@ -0,0 +1,353 @@
+"""
+Columnar snapshots of people for analytics
+Dumps people (with its location names) into one Parquet file per
+province, with the location, name and gender columns dictionary-encoded,
+so aggregate queries - age pyramids, gender ratios per commune - scan a
+few compressed integer columns instead of every row of the SQLite table.
+A snapshot is a point-in-time copy: rebuild it after bulk loads.
+
+Queries go through DuckDB when it is installed and otherwise through
+pyarrow's dataset scanner; both read only the columns a query needs and
+only the files of the provinces it filters on. pyarrow (and optionally
+duckdb) must be installed:
+
+    pip install pyarrow duckdb
+"""
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for snapshots
+    pa = None
+
+try:
+    import duckdb
+except ImportError:  # optional: faster aggregate queries
+    duckdb = None
+
+SNAPSHOT_DIR = os.path.join('instance', 'people_snapshot')
+MANIFEST = 'manifest.json'
+
+LOCATION_COLUMNS = ('province', 'district', 'commune', 'village')
+
+# Columns a snapshot query can group or filter on
+KEY_COLUMNS = ('province', 'district', 'commune', 'village', 'gender', 'age')
+
+# Rows read from SQLite per batch, and buffered per province before a
+# Parquet row group is written
+BATCH_SIZE = 200000
+ROW_GROUP_SIZE = 256000
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed (pip install pyarrow)")
+
+
+def _file_name(province):
+    """A safe file name for a province"""
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', province).strip('_').lower()
+    return f"{slug or 'unknown'}.parquet"
+
+
+def _schema():
+    string_dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('id', pa.int64()),
+        ('name', string_dictionary),
+        ('first_name', string_dictionary),
+        ('last_name', string_dictionary),
+        ('gender', pa.dictionary(pa.int8(), pa.string())),
+        ('age', pa.int16()),
+        ('village_id', pa.int32()),
+        ('province', string_dictionary),
+        ('district', string_dictionary),
+        ('commune', string_dictionary),
+        ('village', string_dictionary),
+    ])
+
+
+def _load_locations(conn):
+    """
+    Locations as dictionary-encoded Arrow columns, plus a village_id ->
+    row lookup. Taking from these arrays keeps one dictionary per column
+    for the whole snapshot.
+    """
+    rows = conn.execute(f"SELECT id, {', '.join(LOCATION_COLUMNS)} FROM locations ORDER BY id").fetchall()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    position = np.full(int(ids.max()) + 1 if len(ids) else 1, -1, dtype=np.int64)
+    position[ids] = np.arange(len(ids))
+    columns = {name: pa.array([row[i + 1] for row in rows]).dictionary_encode()
+               for i, name in enumerate(LOCATION_COLUMNS)}
+    return position, columns
+
+
+def _batch_table(rows, position, locations):
+    """An Arrow table (snapshot schema) for rows of (id, name, first_name, last_name, gender, age, village_id)"""
+    ids, names, first_names, last_names, genders, ages, village_ids = zip(*rows)
+    village_ids = np.array(village_ids, dtype=np.int64)
+    rows_in_locations = pa.array(position[village_ids])
+    arrays = [
+        pa.array(ids, type=pa.int64()),
+        pa.array(names, type=pa.string()).dictionary_encode(),
+        pa.array(first_names, type=pa.string()).dictionary_encode(),
+        pa.array(last_names, type=pa.string()).dictionary_encode(),
+        pa.array(genders, type=pa.string()).dictionary_encode().cast(pa.dictionary(pa.int8(), pa.string())),
+        pa.array(ages, type=pa.int16()),
+        pa.array(village_ids, type=pa.int32()),
+    ]
+    arrays += [locations[name].take(rows_in_locations) for name in LOCATION_COLUMNS]
+    return pa.Table.from_arrays(arrays, schema=_schema())
+
+
+def build_snapshot(db_path, out_dir=SNAPSHOT_DIR, batch_size=BATCH_SIZE, row_group_size=ROW_GROUP_SIZE,
+                   compression='zstd'):
+    """
+    Write a snapshot of people to `out_dir`, one Parquet file per
+    province. It is written next to `out_dir` and swapped in at the end,
+    so readers never see a half-written snapshot. Returns the manifest.
+    """
+    require_pyarrow()
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    tmp_dir = out_dir.rstrip('/\\') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    writers, pending, counts = {}, {}, {}
+    schema = _schema()
+
+    def write(province):
+        tables = pending.pop(province, [])
+        if not tables:
+            return
+        table = pa.concat_tables(tables)
+        if province not in writers:
+            writers[province] = pq.ParquetWriter(os.path.join(tmp_dir, _file_name(province)), schema,
+                                                 compression=compression)
+        writers[province].write_table(table, row_group_size=row_group_size)
+
+    start = time.perf_counter()
+    try:
+        position, locations = _load_locations(conn)
+        cursor = conn.execute("SELECT id, name, first_name, last_name, gender, age, village_id "
+                              "FROM people ORDER BY id")
+        total = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            table = _batch_table(rows, position, locations)
+            # Route each province's rows to its own file
+            provinces = table['province'].combine_chunks()
+            for code in pc.unique(provinces.indices).to_pylist():
+                province = provinces.dictionary[code].as_py()
+                part = table.filter(pc.equal(provinces.indices, code))
+                pending.setdefault(province, []).append(part)
+                counts[province] = counts.get(province, 0) + part.num_rows
+                if sum(t.num_rows for t in pending[province]) >= row_group_size:
+                    write(province)
+            total += len(rows)
+            if total // 1000000 != (total - len(rows)) // 1000000:
+                print(f"  {total:,} people ({total / (time.perf_counter() - start):,.0f} rows/s)")
+        for province in list(pending):
+            write(province)
+        max_id = conn.execute("SELECT MAX(id) FROM people").fetchone()[0]
+    finally:
+        for writer in writers.values():
+            writer.close()
+        conn.close()
+
+    manifest = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'source': os.path.abspath(db_path),
+        'rows': sum(counts.values()),
+        'max_id': max_id,
+        'files': {province: {'file': _file_name(province), 'rows': rows}
+                  for province, rows in sorted(counts.items())},
+    }
+    with open(os.path.join(tmp_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    # Swap the new snapshot in
+    old_dir = out_dir.rstrip('/\\') + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def has_snapshot(path=SNAPSHOT_DIR):
+    return os.path.exists(os.path.join(path, MANIFEST))
+
+
+class Snapshot:
+    """
+    Aggregate queries over a snapshot directory.
+
+    aggregate() answers the same questions as /api/stats: an optional
+    GROUP BY over KEY_COLUMNS with exact-match filters and an age range.
+    """
+
+    def __init__(self, path=SNAPSHOT_DIR, engine='auto'):
+        require_pyarrow()
+        self.path = path
+        with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if engine == 'auto':
+            engine = 'duckdb' if duckdb is not None else 'pyarrow'
+        if engine == 'duckdb' and duckdb is None:
+            raise RuntimeError("duckdb is not installed (pip install duckdb)")
+        self.engine = engine
+        self._duckdb = duckdb.connect() if engine == 'duckdb' else None
+        self._lock = threading.Lock()
+
+    def files(self, province=None):
+        """Parquet files to scan: one province's, or all of them"""
+        entries = self.manifest['files']
+        if province is not None:
+            entries = {province: entries[province]} if province in entries else {}
+        return [os.path.join(self.path, entry['file']) for entry in entries.values()]
+
+    def aggregate(self, group_by=(), filters=None, min_age=None, max_age=None):
+        """Return (total, groups): head counts, optionally grouped, as /api/stats does"""
+        invalid = [column for column in group_by if column not in KEY_COLUMNS]
+        if invalid:
+            raise ValueError(f"Cannot group by: {', '.join(invalid)}")
+        filters = {key: value for key, value in (filters or {}).items() if value not in (None, '')}
+        files = self.files(filters.get('province'))
+        if not files:
+            return 0, []
+        if self.engine == 'duckdb':
+            rows = self._aggregate_duckdb(files, list(group_by), filters, min_age, max_age)
+        else:
+            rows = self._aggregate_pyarrow(files, list(group_by), filters, min_age, max_age)
+        if not group_by:
+            return (rows[0][0] if rows else 0), []
+        groups = [dict(zip(group_by, row[:-1]), count=row[-1]) for row in rows]
+        return sum(group['count'] for group in groups), groups
+
+    def _aggregate_duckdb(self, files, group_by, filters, min_age, max_age):
+        conditions, params = [], []
+        for key, value in filters.items():
+            conditions.append(f"{key} = ?")
+            params.append(value)
+        if min_age is not None:
+            conditions.append("age >= ?")
+            params.append(min_age)
+        if max_age is not None:
+            conditions.append("age <= ?")
+            params.append(max_age)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        columns = ', '.join(group_by)
+        source = f"read_parquet([{', '.join('?' for _ in files)}])"
+        if group_by:
+            sql = (f"SELECT {columns}, COUNT(*) FROM {source} {where} "
+                   f"GROUP BY {columns} ORDER BY {columns}")
+        else:
+            sql = f"SELECT COUNT(*) FROM {source} {where}"
+        # One connection, one query at a time; DuckDB parallelises the scan itself
+        with self._lock:
+            return self._duckdb.execute(sql, list(files) + params).fetchall()
+
+    def _aggregate_pyarrow(self, files, group_by, filters, min_age, max_age):
+        expression = None
+        for key, value in filters.items():
+            condition = pc.field(key) == value
+            expression = condition if expression is None else expression & condition
+        for bound, op in ((min_age, '>='), (max_age, '<=')):
+            if bound is not None:
+                condition = pc.field('age') >= bound if op == '>=' else pc.field('age') <= bound
+                expression = condition if expression is None else expression & condition
+
+        dataset = ds.dataset(files, format='parquet')
+        if not group_by:
+            return [(dataset.count_rows(filter=expression),)]
+        # Each file has its own dictionaries: unify them, group on the
+        # indices, then decode only the groups
+        table = dataset.to_table(columns=group_by, filter=expression).unify_dictionaries()
+        result = table.group_by(group_by).aggregate([([], 'count_all')])
+        result = pa.table({column: result[column].cast(pa.string()) if pa.types.is_dictionary(result[column].type)
+                           else result[column] for column in group_by + ['count_all']})
+        result = result.sort_by([(column, 'ascending') for column in group_by])
+        columns = [result[column].to_pylist() for column in group_by] + [result['count_all'].to_pylist()]
+        return list(zip(*columns))
+
+
+def _benchmark(db_path, snapshot):
+    """Time a few analytical queries on SQLite and on the snapshot"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    queries = [
+        ('age pyramid (age x gender)', ('age', 'gender'), {},
+         "SELECT p.age, p.gender, COUNT(*) FROM people p GROUP BY p.age, p.gender"),
+        ('gender per commune', ('province', 'district', 'commune', 'gender'), {},
+         "SELECT l.province, l.district, l.commune, p.gender, COUNT(*) FROM people p "
+         "JOIN locations l ON l.id = p.village_id GROUP BY 1, 2, 3, 4"),
+        ('one province by age', ('age',), {'province': next(iter(snapshot.manifest['files']), '')},
+         "SELECT p.age, COUNT(*) FROM people p JOIN locations l ON l.id = p.village_id "
+         "WHERE l.province = :province GROUP BY p.age"),
+    ]
+    print(f"\n{'query':<30} {'sqlite':>10} {snapshot.engine:>10}")
+    try:
+        for label, group_by, filters, sql in queries:
+            start = time.perf_counter()
+            expected = conn.execute(sql, filters).fetchall()
+            sqlite_time = time.perf_counter() - start
+            start = time.perf_counter()
+            total, groups = snapshot.aggregate(group_by, filters)
+            snapshot_time = time.perf_counter() - start
+            same = total == sum(row[-1] for row in expected) and len(groups) == len(expected)
+            print(f"{label:<30} {sqlite_time:>9.3f}s {snapshot_time:>9.3f}s  "
+                  f"{sqlite_time / max(snapshot_time, 1e-9):5.1f}x{'' if same else '  ❌ results differ'}")
+    finally:
+        conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a columnar (Parquet) snapshot of people")
+    parser.add_argument('--db', default='instance/people.db', help="SQLite database path")
+    parser.add_argument('--out', default=SNAPSHOT_DIR, help="Snapshot directory")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rows read from SQLite per batch")
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE, help="Rows per Parquet row group")
+    parser.add_argument('--compression', default='zstd', help="Parquet compression codec")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="Compare aggregate queries on SQLite and the snapshot afterwards")
+    parser.add_argument('--engine', default='auto', choices=('auto', 'duckdb', 'pyarrow'),
+                        help="Query engine for --benchmark")
+    parser.add_argument('--skip-build', action='store_true', help="Use the existing snapshot (with --benchmark)")
+    args = parser.parse_args()
+
+    if pa is None:
+        print("❌ pyarrow is not installed (pip install pyarrow)")
+        return
+
+    if not args.skip_build:
+        print(f"📦 Writing snapshot of {args.db} to {args.out}...")
+        start = time.perf_counter()
+        manifest = build_snapshot(args.db, args.out, batch_size=args.batch_size,
+                                  row_group_size=args.row_group_size, compression=args.compression)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(args.out, entry['file'])) for entry in manifest['files'].values())
+        print(f"✅ {manifest['rows']:,} people in {len(manifest['files'])} province files, "
+              f"{size / 1024 / 1024:.1f} MB, in {elapsed:.1f}s")
+
+    if args.benchmark:
+        _benchmark(args.db, Snapshot(args.out, engine=args.engine))
+
+
+if __name__ == '__main__':
+    main()
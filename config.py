@@ -18,3 +18,39 @@ class Config:
     
     # SQLite specific optimizations
     SQLALCHEMY_ECHO = False  # Disable SQL logging in production
+    
+    # PRAGMAs applied once per pooled connection (see db_tuning.py).
+    # page_size only takes effect on a new database or after VACUUM.
+    SQLITE_PRAGMAS = {
+        'page_size': int(os.getenv('SQLITE_PAGE_SIZE', 4096)),
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64000)),  # negative = KiB (64 MB)
+        'temp_store': 'MEMORY',
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 268435456)),  # 256 MB
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),  # ms
+    }
+    
+    # Search result counts: cache lifetime (seconds) and the number of
+    # matches after which /search shows an estimate instead of counting
+    COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', 300))
+    COUNT_ESTIMATE_THRESHOLD = int(os.getenv('COUNT_ESTIMATE_THRESHOLD', 10000))
+    
+    # Audit log batching: rows per insert and the longest a row waits (seconds)
+    AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 100))
+    AUDIT_FLUSH_SECONDS = float(os.getenv('AUDIT_FLUSH_SECONDS', 1.0))
+    
+    # Logged-in users are cached in process for this many seconds
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+    
+    # Request timing and the slow-query log (see perf.py): statements
+    # slower than PERF_SLOW_QUERY_MS are logged with their query plan
+    PERF_MONITORING = os.getenv('PERF_MONITORING', '1') != '0'
+    PERF_SLOW_QUERY_MS = float(os.getenv('PERF_SLOW_QUERY_MS', 100))
+    PERF_SLOW_QUERY_LOG = os.getenv('PERF_SLOW_QUERY_LOG', 'slow_queries.log')
+    
+    # Rows per keyset batch when streaming /search/export
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+    
+    # Parquet snapshot of people for /api/stats?source=columnar (columnar.py)
+    COLUMNAR_SNAPSHOT_DIR = os.getenv('COLUMNAR_SNAPSHOT_DIR', os.path.join('instance', 'people_snapshot'))
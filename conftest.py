@@ -0,0 +1,111 @@
+"""
+Shared pytest fixtures (python -m pytest -q)
+The web app runs against a small generated database in a temporary
+directory, never instance/people.db. Environment variables are set here,
+before any test imports app.py, because config.py reads them at import
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix='people_tests_')
+DB_PATH = os.path.join(TEST_DIR, 'people.db')
+
+os.environ['DATABASE_URI'] = f"sqlite:///{DB_PATH}"
+os.environ['PERF_SLOW_QUERY_LOG'] = os.path.join(TEST_DIR, 'slow_queries.log')
+os.environ['COLUMNAR_SNAPSHOT_DIR'] = os.path.join(TEST_DIR, 'people_snapshot')
+os.environ['AUDIT_FLUSH_SECONDS'] = '0.05'
+
+# Manual scripts that open instance/people.db as soon as they are imported;
+# run them directly (python test_pailin_login.py) against a real database
+if not os.path.exists(os.path.join('instance', 'people.db')):
+    collect_ignore = ['test_cool_login.py', 'test_manager_role.py', 'test_pailin_login.py']
+
+PEOPLE = 3000
+SEED = 20240601
+PASSWORD = 'test-password'
+
+# username -> (role, province)
+USERS = {
+    'admin': ('super_admin', None),
+    'kampong_cham': ('manager', 'Kampong Cham'),
+}
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The Flask app on a freshly generated database (locations, users, people, FTS, stats)"""
+    from werkzeug.security import generate_password_hash
+    from app import app, audit
+    from data_generator import generate_people_fast
+    from models import db, User
+    import locations
+    import search_index
+    import stats
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        connection = db.engine.raw_connection()
+        try:
+            locations.sync_locations(connection)
+        finally:
+            connection.close()
+        for username, (role, province) in USERS.items():
+            db.session.add(User(username=username, password=generate_password_hash(PASSWORD),
+                                role=role, province=province))
+        db.session.commit()
+
+        generate_people_fast(PEOPLE, batch_size=1000, seed=SEED)
+        connection = db.engine.raw_connection()
+        try:
+            search_index.create_search_index(connection)
+            stats.build_stats(connection)
+        finally:
+            connection.close()
+
+    yield app
+
+    audit.close()
+    with app.app_context():
+        db.engine.dispose()
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def db_path(app):
+    """Path of the generated database file"""
+    return DB_PATH
+
+
+@pytest.fixture
+def login(app):
+    """login(username) -> a test client with that user signed in"""
+    def login(username):
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': PASSWORD})
+        assert response.status_code == 302, f"login failed for {username}"
+        return client
+    return login
+
+
+@pytest.fixture
+def db_copy(db_path, tmp_path):
+    """copy() -> path of a private copy of the generated database, safe to modify"""
+    def copy(name='people.db'):
+        path = str(tmp_path / name)
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return path
+    return copy
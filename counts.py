@@ -0,0 +1,163 @@
+"""
+Search result counting
+Serves counts from precomputed aggregates when the filters allow it,
+caches counts per filter combination (TTL + invalidation on writes) and
+falls back to an "about N" estimate instead of an exact COUNT(*) over
+millions of rows
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import func
+
+CountResult = namedtuple('CountResult', ['value', 'exact'])
+
+# Filters a precomputed aggregate can answer (everything except id and name)
+AGGREGATE_FILTERS = ('province', 'district', 'commune', 'village', 'gender', 'age', 'manager_province')
+
+# Below this many matches the count is exact; above it we estimate
+DEFAULT_ESTIMATE_THRESHOLD = 10000
+
+
+# Every live CountCache, so invalidate() reaches the ones owned by a
+# PeopleRepository or the desktop app as well as the module cache
+_caches = weakref.WeakSet()
+
+
+class CountCache:
+    """Thread-safe LRU cache of counts with a time-to-live"""
+
+    def __init__(self, ttl=300, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _caches.add(self)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def invalidate(self):
+        """Drop every cached count (called after writes to people)"""
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = CountCache()
+_aggregate_source = None
+
+
+def configure(ttl=None, max_entries=None):
+    """Apply cache settings from the application config"""
+    if ttl is not None:
+        _cache.ttl = ttl
+    if max_entries is not None:
+        _cache.max_entries = max_entries
+
+
+def set_aggregate_source(source):
+    """
+    Register a callable answering exact counts from precomputed aggregates.
+    It receives the filter dict and returns an int, or None if it cannot.
+    """
+    global _aggregate_source
+    _aggregate_source = source
+
+
+def invalidate():
+    """
+    Forget the counts of every CountCache in this process. Other processes
+    writing to the same database (data_generator.py, the migration scripts)
+    do not reach it: their changes show up once the TTL runs out.
+    """
+    for cache in list(_caches):
+        cache.invalidate()
+
+
+def filter_key(filters):
+    """Hashable, order-independent key for a filter dict"""
+    return tuple(sorted((k, v) for k, v in filters.items() if v not in (None, '')))
+
+
+def is_aggregate_filter(filters):
+    """True when every active filter is one the aggregates are keyed by"""
+    return all(k in AGGREGATE_FILTERS for k, _ in filter_key(filters))
+
+
+def _round_estimate(value):
+    """Round an estimate to two significant figures"""
+    if value < 100:
+        return value
+    magnitude = 10 ** (len(str(value)) - 2)
+    return int(round(value / magnitude) * magnitude)
+
+
+def count_results(query, filters, id_column, exact=False,
+                  estimate_threshold=DEFAULT_ESTIMATE_THRESHOLD):
+    """
+    Count the rows matched by `query` (built from `filters`).
+
+    Returns a CountResult. Exact counts come from the cache, the aggregate
+    source, or - when `exact` is set - a real COUNT(*). Otherwise, once
+    `estimate_threshold` matches are seen, the total is extrapolated from
+    how far into the id range those matches reached.
+    """
+    key = filter_key(filters)
+    cached = _cache.get(key)
+    if cached is not None:
+        return CountResult(cached, True)
+
+    if _aggregate_source is not None and is_aggregate_filter(filters):
+        value = _aggregate_source(filters)
+        if value is not None:
+            _cache.set(key, value)
+            return CountResult(value, True)
+
+    if exact:
+        value = query.order_by(None).count()
+        _cache.set(key, value)
+        return CountResult(value, True)
+
+    ids = [row[0] for row in query.with_entities(id_column)
+           .order_by(id_column).limit(estimate_threshold).all()]
+    if len(ids) < estimate_threshold:
+        _cache.set(key, len(ids))
+        return CountResult(len(ids), True)
+
+    # Matches are spread evenly over the id range, so the density seen in
+    # the first `estimate_threshold` matches extrapolates to the whole table
+    max_id = query.session.query(func.max(id_column)).scalar() or ids[-1]
+    estimate = int(len(ids) * max_id / max(ids[-1], 1))
+    return CountResult(_round_estimate(estimate), False)
+
+
+def cache_stats():
+    """Hit/miss counters for the count cache"""
+    return {'hits': _cache.hits, 'misses': _cache.misses, 'entries': len(_cache._entries)}
@@ -1,45 +1,55 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import queue
 import random
-import json
-from models import db, Person
-from khmer_names import get_random_khmer_name
+import time
+from datetime import datetime
+from functools import lru_cache
+from sqlalchemy import func
+from config import Config
+from models import db, Person, Location
+from khmer_names import get_random_khmer_name, MALE_FIRST_NAMES, FEMALE_FIRST_NAMES, KHMER_SURNAMES
+import counts
+import locations
+import search_index
+import stats
 
-def load_location_data():
-    """Load real Cambodia location data from Excel extraction"""
+try:
+    import numpy as np
+except ImportError:  # optional: only needed by generate_people_fast()
+    np = None
+
+INSERT_PERSON_SQL = """
+    INSERT INTO people (name, first_name, last_name, gender, age, village_id, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+def load_village_ids():
+    """Ids of all villages in the locations table, filling it on first use"""
+    connection = db.engine.raw_connection()
     try:
-        with open('cambodia_locations_real.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("ERROR: cambodia_locations_real.json not found!")
-        print("Please run: python import_cambodia_locations.py first")
-        return None
+        if not locations.has_locations(connection):
+            print("Filling locations table from camboia.xlsx...")
+            added = locations.sync_locations(connection)
+            print(f"Added {added:,} villages")
+    finally:
+        connection.close()
+    return [row[0] for row in db.session.query(Location.id).all()]
 
 def generate_people(count=10000000, batch_size=10000):
     """Generate and insert people with real Khmer names and Cambodia locations"""
     print(f"Loading real Cambodia location data...")
-    locations = load_location_data()
-    
-    if not locations:
-        return
-    
-    # Build a flat list of all location combinations
-    # Structure: {province: {district: {commune: [villages]}}}
-    location_pool = []
-    for province, districts in locations.items():
-        for district, communes in districts.items():
-            for commune, villages in communes.items():
-                for village in villages:
-                    location_pool.append({
-                        'province': province,
-                        'district': district,
-                        'commune': commune,
-                        'village': village
-                    })
+    location_pool = load_village_ids()
     
     if not location_pool:
-        print("ERROR: No location data found in JSON file")
+        print("ERROR: No villages found in the locations table")
+        print("Please run: python import_cambodia_locations.py first")
         return
     
-    print(f"Found {len(location_pool)} real villages across {len(locations)} provinces")
+    province_count = db.session.query(func.count(func.distinct(Location.province))).scalar()
+    print(f"Found {len(location_pool)} real villages across {province_count} provinces")
     print(f"Generating {count:,} people with authentic Khmer names and real Cambodia locations...")
     
     from khmer_names import get_khmer_name_parts
@@ -47,7 +57,6 @@ def generate_people(count=10000000, batch_size=10000):
     for i in range(0, count, batch_size):
         batch = []
         for _ in range(min(batch_size, count - i)):
-            location = random.choice(location_pool)
             gender = random.choice(['male', 'female'])
             
             # Generate authentic Khmer name parts based on gender
@@ -60,10 +69,7 @@ def generate_people(count=10000000, batch_size=10000):
                 last_name=last_name,
                 gender=gender,
                 age=random.randint(15, 60),
-                province=location['province'],
-                district=location['district'],
-                commune=location['commune'],
-                village=location['village']
+                village_id=random.choice(location_pool)
             )
             batch.append(person)
         
@@ -73,5 +79,277 @@ def generate_people(count=10000000, batch_size=10000):
         if (i + batch_size) % 100000 == 0:
             print(f"Inserted {i + batch_size:,} people with Khmer names...")
     
+    # Cached search counts are stale now
+    counts.invalidate()
+    
     print(f"✅ Successfully generated {count:,} people with authentic Khmer names and real Cambodia locations!")
 
+
+@lru_cache(maxsize=None)
+def _name_tables():
+    """
+    NumPy lookup tables: all first names (male ones first), surnames, and
+    every "first last" combination, so a batch is pure array indexing
+    """
+    first_names = np.array(MALE_FIRST_NAMES + FEMALE_FIRST_NAMES, dtype=object)
+    surnames = np.array(KHMER_SURNAMES, dtype=object)
+    full_names = np.array([f"{first} {last}" for first in first_names for last in surnames], dtype=object)
+    return first_names, surnames, full_names
+
+def make_batch(rng, size, village_ids, created_at):
+    """Draw `size` people as INSERT_PERSON_SQL parameter tuples"""
+    first_names, surnames, full_names = _name_tables()
+    male_count = len(MALE_FIRST_NAMES)
+    
+    is_male = rng.random(size) < 0.5
+    first = np.where(is_male,
+                     rng.integers(0, male_count, size),
+                     rng.integers(male_count, len(first_names), size))
+    last = rng.integers(0, len(surnames), size)
+    return list(zip(
+        full_names[first * len(surnames) + last].tolist(),
+        first_names[first].tolist(),
+        surnames[last].tolist(),
+        np.where(is_male, 'male', 'female').tolist(),
+        rng.integers(15, 61, size).tolist(),
+        village_ids[rng.integers(0, len(village_ids), size)].tolist(),
+        itertools.repeat(created_at),
+    ))
+
+def generate_people_fast(count=10000000, batch_size=100000, seed=None):
+    """
+    Same data as generate_people(), drawn as NumPy arrays per batch and
+    inserted with executemany on the raw connection (no ORM objects).
+    Like generate_people_parallel(), the people indexes and the FTS and
+    people_stats triggers are dropped for the load and the new rows are
+    indexed and counted afterwards.
+    """
+    if np is None:
+        print("NumPy is not installed (pip install numpy); using the slower generator")
+        return generate_people(count)
+    
+    village_ids = np.array(load_village_ids(), dtype=np.int64)
+    if not len(village_ids):
+        print("ERROR: No villages found in the locations table")
+        return
+    
+    print(f"Generating {count:,} people from {len(village_ids):,} villages (seed={seed})...")
+    rng = np.random.default_rng(seed)
+    created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
+    
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        start = time.perf_counter()
+        last_id, had_search_index, had_stats, recreate = _suspend_people_indexes(connection)
+        try:
+            reported = 0
+            for i in range(0, count, batch_size):
+                rows = make_batch(rng, min(batch_size, count - i), village_ids, created_at)
+                cursor.executemany(INSERT_PERSON_SQL, rows)
+                connection.commit()
+                
+                done = i + len(rows)
+                if done - reported >= 1000000 or done == count:
+                    reported = done
+                    elapsed = time.perf_counter() - start
+                    print(f"Inserted {done:,} people ({done / elapsed:,.0f} rows/s)")
+        finally:
+            loaded = time.perf_counter()
+            _restore_people_indexes(connection, recreate)
+            _catch_up_people(connection, last_id, had_search_index, had_stats)
+    finally:
+        connection.close()
+    
+    # Cached search counts are stale now
+    counts.invalidate()
+    
+    elapsed = time.perf_counter() - start
+    print(f"Loaded in {loaded - start:.1f}s; indexes, search index and stats rebuilt in "
+          f"{elapsed - (loaded - start):.1f}s")
+    print(f"✅ Generated {count:,} people in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+def _produce(shard, rows, batch_size, seed, village_ids, created_at, batches):
+    """
+    Worker process: generate `rows` people for one shard and put them on
+    the queue. Each shard is seeded from (seed, shard), so a given
+    --rows/--workers/--seed produces the same people (ids may interleave
+    differently between shards).
+    """
+    rng = np.random.default_rng([seed, shard] if seed is not None else None)
+    busy = blocked = 0.0
+    for i in range(0, rows, batch_size):
+        start = time.perf_counter()
+        batch = make_batch(rng, min(batch_size, rows - i), village_ids, created_at)
+        generated = time.perf_counter()
+        batches.put(batch)
+        busy += generated - start
+        blocked += time.perf_counter() - generated
+    batches.put(('done', shard, rows, busy, blocked))
+
+def _drop_people_indexes(cursor):
+    """Drop people's secondary indexes and triggers, returning the SQL to recreate them"""
+    cursor.execute("""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = 'people' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    """)
+    saved = cursor.fetchall()
+    for object_type, name, _ in saved:
+        cursor.execute(f"DROP {object_type.upper()} IF EXISTS {name}")
+    return [sql for _, _, sql in saved]
+
+def _suspend_people_indexes(connection):
+    """
+    Drop people's indexes and triggers for a bulk load. Returns the last id
+    before the load, whether the name search index and people_stats exist,
+    and the SQL to recreate what was dropped.
+    """
+    cursor = connection.cursor()
+    had_search_index = search_index.has_search_index(connection)
+    had_stats = stats.has_stats(connection)
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM people")
+    last_id = cursor.fetchone()[0]
+    recreate = _drop_people_indexes(cursor)
+    connection.commit()
+    cursor.execute("PRAGMA synchronous=OFF")
+    return last_id, had_search_index, had_stats, recreate
+
+def _restore_people_indexes(connection, recreate):
+    print("Rebuilding indexes...")
+    cursor = connection.cursor()
+    cursor.execute(f"PRAGMA synchronous={Config.SQLITE_PRAGMAS['synchronous']}")
+    for sql in recreate:
+        cursor.execute(sql)
+    connection.commit()
+
+def _catch_up_people(connection, last_id, had_search_index, had_stats):
+    """The triggers were off during the load, so index and count the new rows"""
+    if had_search_index:
+        print("Indexing new names...")
+        search_index.index_people_after(connection, last_id)
+    if had_stats:
+        print("Updating people_stats...")
+        stats.add_people_after(connection, last_id)
+
+def generate_people_parallel(count=10000000, workers=None, batch_size=100000, seed=None, queue_size=None):
+    """
+    Generate people in `workers` processes and insert them from this one.
+    
+    Workers fill a bounded queue with ready-made batches. This process is
+    the only SQLite writer: it drops the people indexes and triggers,
+    inserts every batch, then rebuilds the indexes and brings the name
+    search index and people_stats up to date. Prints throughput per stage.
+    """
+    if np is None:
+        print("NumPy is not installed (pip install numpy); using the slower generator")
+        return generate_people(count)
+    
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    village_ids = np.array(load_village_ids(), dtype=np.int64)
+    if not len(village_ids):
+        print("ERROR: No villages found in the locations table")
+        return
+    
+    print(f"Generating {count:,} people with {workers} worker processes (seed={seed})...")
+    created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
+    batches = multiprocessing.Queue(maxsize=queue_size or 2 * workers)
+    shard_rows = [count // workers + (1 if shard < count % workers else 0) for shard in range(workers)]
+    processes = [
+        multiprocessing.Process(
+            target=_produce,
+            args=(shard, rows, batch_size, seed, village_ids, created_at, batches),
+            daemon=True,
+        )
+        for shard, rows in enumerate(shard_rows)
+    ]
+    
+    connection = db.engine.raw_connection()
+    cursor = connection.cursor()
+    start = time.perf_counter()
+    last_id, had_search_index, had_stats, recreate = _suspend_people_indexes(connection)
+    dropped = time.perf_counter()
+    
+    for process in processes:
+        process.start()
+    
+    inserted = 0
+    insert_time = wait_time = 0.0
+    shard_reports = []
+    try:
+        while len(shard_reports) < workers:
+            waited = time.perf_counter()
+            try:
+                batch = batches.get(timeout=1)
+            except queue.Empty:
+                wait_time += time.perf_counter() - waited
+                failed = [p for p in processes if p.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f"Worker process exited with code {failed[0].exitcode}")
+                continue
+            wait_time += time.perf_counter() - waited
+            
+            if isinstance(batch, tuple):
+                shard_reports.append(batch)
+                continue
+            began = time.perf_counter()
+            cursor.executemany(INSERT_PERSON_SQL, batch)
+            connection.commit()
+            insert_time += time.perf_counter() - began
+            
+            previous, inserted = inserted, inserted + len(batch)
+            if inserted // 1000000 != previous // 1000000:
+                print(f"Inserted {inserted:,} people ({inserted / (time.perf_counter() - dropped):,.0f} rows/s)")
+        loaded = time.perf_counter()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        
+        # Put the indexes back even if the load failed
+        _restore_people_indexes(connection, recreate)
+        indexed = time.perf_counter()
+        _catch_up_people(connection, last_id, had_search_index, had_stats)
+        connection.close()
+        counts.invalidate()
+    finished = time.perf_counter()
+    
+    generate_time = sum(report[3] for report in shard_reports)
+    blocked_time = sum(report[4] for report in shard_reports)
+    load_time = loaded - dropped
+    print("=" * 60)
+    print(f"Generate  {workers} workers   {count / max(generate_time, 1e-9):>12,.0f} rows/s per worker, "
+          f"{blocked_time / workers:.1f}s each blocked on a full queue")
+    print(f"Insert    1 writer    {inserted / max(insert_time, 1e-9):>12,.0f} rows/s, "
+          f"{wait_time:.1f}s waiting for batches")
+    print(f"Load      end-to-end  {inserted / max(load_time, 1e-9):>12,.0f} rows/s ({load_time:.1f}s)")
+    print(f"Indexes   dropped in {dropped - start:.1f}s, rebuilt in {indexed - loaded:.1f}s; "
+          f"search index and stats caught up in {finished - indexed:.1f}s")
+    bottleneck = 'generation' if wait_time > blocked_time / workers else 'insertion'
+    print(f"Bottleneck: {bottleneck}")
+    print(f"✅ Generated {inserted:,} people in {finished - start:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate people with Khmer names and real Cambodia locations")
+    parser.add_argument('--rows', type=int, default=100000, help="Number of people to add")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed, for reproducible data")
+    parser.add_argument('--batch-size', type=int, default=100000, help="Rows per insert transaction")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Generate in this many processes with one writer (0 = single process)")
+    parser.add_argument('--orm', action='store_true', help="Use the original one-object-per-row generator")
+    args = parser.parse_args()
+    
+    from app import app
+    with app.app_context():
+        db.create_all()
+        if args.orm:
+            if args.seed is not None:
+                random.seed(args.seed)
+            generate_people(args.rows, batch_size=args.batch_size)
+        elif args.workers:
+            generate_people_parallel(args.rows, workers=args.workers, batch_size=args.batch_size, seed=args.seed)
+        else:
+            generate_people_fast(args.rows, batch_size=args.batch_size, seed=args.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""
+SQLite connection tuning
+Applies PRAGMAs once per pooled connection through SQLAlchemy's connect
+event, instead of re-running them at the start of every request
+"""
+from sqlalchemy import event
+
+
+def pragma_statements(pragmas):
+    """Render a {name: value} dict as PRAGMA statements, in order"""
+    return [f"PRAGMA {name}={value}" for name, value in pragmas.items() if value is not None]
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run the PRAGMAs on a raw DB-API connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+    finally:
+        cursor.close()
+
+
+def install(engine, pragmas):
+    """Tune every new connection the engine's pool opens (SQLite only)"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def tune_connection(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
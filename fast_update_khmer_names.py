@@ -1,13 +1,30 @@
 """
 Fast SQL-based update of all names to Khmer names
 Uses direct SQL updates for maximum performance
+
+Two modes:
+  python  - random names drawn in Python, sent back in batched UPDATEs
+            (resumable, see batch_migration.py)
+  --sql   - name pools loaded into temp tables and every row rewritten by
+            one UPDATE ... FROM per gender, entirely inside SQLite
 """
+import argparse
+import random
+import time
 from app import app
 from models import db
+from batch_migration import BatchMigration
 from khmer_names import KHMER_MALE_FIRST_NAMES, KHMER_MALE_NAMES_EXTENDED
 from khmer_names import KHMER_FEMALE_FIRST_NAMES, KHMER_FEMALE_NAMES_EXTENDED
 from khmer_names import KHMER_SURNAMES
-import random
+
+# Multiplicative hashes of the id pick the pool entries; the high 16 bits
+# of (id + seed) * K mod 2^32 are well mixed even for consecutive ids.
+# id + seed is first reduced mod 2^31 so the product stays inside SQLite's
+# 64-bit integers (past that it silently turns into a REAL)
+HASH_INPUT_MODULUS = 2 ** 31
+FIRST_NAME_HASH = "((((people.id + :seed) % 2147483648) * 2654435761) % 4294967296) >> 16"
+SURNAME_HASH = "((((people.id + :seed) % 2147483648) * 2246822519) % 4294967296) >> 16"
 
 def generate_khmer_name_sql():
     """Generate SQL CASE statement for random Khmer names"""
@@ -22,7 +39,82 @@ def generate_khmer_name_sql():
     
     return male_names, female_names, KHMER_SURNAMES
 
-def update_names_fast():
+def python_name_setter(male_names, female_names, surnames):
+    """BatchMigration process that gives each (id, gender) row a random name"""
+    def set_names(cursor, rows):
+        updates = []
+        for record_id, gender in rows:
+            # Generate random Khmer name
+            if gender == 'male':
+                first_name = random.choice(male_names)
+            else:
+                first_name = random.choice(female_names)
+            
+            surname = random.choice(surnames)
+            updates.append((f"{first_name} {surname}", record_id))
+        cursor.executemany("UPDATE people SET name = ? WHERE id = ?", updates)
+    return set_names
+
+def update_names_python(connection, male_names, female_names, surnames, restart=False):
+    """Rewrite names from Python in checkpointed id-range batches"""
+    migration = BatchMigration(connection, 'fast_khmer_names',
+                               python_name_setter(male_names, female_names, surnames),
+                               columns=('id', 'gender'), batch_size=50000, repeatable=True)
+    if restart:
+        migration.reset()
+    return migration.run()
+
+def update_names_sql(connection, male_names, female_names, surnames, seed=None):
+    """
+    Rewrite every name with set-based UPDATE ... FROM statements. The pools
+    go into temp tables indexed 0..n-1 and each row's entries are picked
+    by hashing its id, so no row leaves SQLite.
+    """
+    if seed is None:
+        seed = random.randrange(HASH_INPUT_MODULUS)
+    seed %= HASH_INPUT_MODULUS
+    cursor = connection.cursor()
+    for table, names in (('male_first_names', male_names),
+                         ('female_first_names', female_names),
+                         ('surnames', surnames)):
+        cursor.execute(f"DROP TABLE IF EXISTS temp.{table}")
+        cursor.execute(f"CREATE TEMP TABLE {table} (idx INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+        cursor.executemany(f"INSERT INTO temp.{table} (idx, name) VALUES (?, ?)", list(enumerate(names)))
+    
+    # Rebuilding the indexes on name once is far cheaper than updating
+    # them row by row in random order. One transaction, so a failed run
+    # leaves the indexes in place.
+    if not getattr(connection, 'in_transaction', True):
+        cursor.execute("BEGIN")
+    cursor.execute("""
+        SELECT m.name, m.sql FROM sqlite_master m
+        WHERE m.type = 'index' AND m.tbl_name = 'people' AND m.sql IS NOT NULL
+          AND EXISTS (SELECT 1 FROM pragma_index_info(m.name) i WHERE i.name = 'name')
+    """)
+    name_indexes = cursor.fetchall()
+    for index_name, _ in name_indexes:
+        cursor.execute(f"DROP INDEX {index_name}")
+    
+    updated = 0
+    for table, count, gender_sql in (('male_first_names', len(male_names), "people.gender = 'male'"),
+                                     ('female_first_names', len(female_names), "people.gender != 'male'")):
+        cursor.execute(f"""
+            UPDATE people SET name = f.name || ' ' || s.name
+            FROM temp.{table} f, temp.surnames s
+            WHERE {gender_sql}
+              AND f.idx = ({FIRST_NAME_HASH}) % :first_count
+              AND s.idx = ({SURNAME_HASH}) % :surname_count
+        """, {'seed': seed, 'first_count': count, 'surname_count': len(surnames)})
+        updated += cursor.rowcount
+    for _, index_sql in name_indexes:
+        cursor.execute(index_sql)
+    connection.commit()
+    
+    for table in ('male_first_names', 'female_first_names', 'surnames'):
+        cursor.execute(f"DROP TABLE IF EXISTS temp.{table}")
+    return updated
+
+def update_names_fast(restart=False, use_sql=False, seed=None):
     """Fast update using SQL with random Khmer names"""
     with app.app_context():
         print("=" * 60)
@@ -55,45 +147,19 @@ def update_names_fast():
         print("\nUpdating names...")
         print("This may take several minutes for large databases...")
         
-        # Update in batches
-        batch_size = 50000
-        updated = 0
-        
-        # Get all IDs
-        result = db.session.execute(db.text("SELECT id, gender FROM people ORDER BY id"))
-        all_records = result.fetchall()
-        
-        print(f"\nProcessing {len(all_records):,} records in batches of {batch_size:,}...")
-        
-        for i in range(0, len(all_records), batch_size):
-            batch = all_records[i:i + batch_size]
-            
-            # Prepare batch updates
-            updates = []
-            for record_id, gender in batch:
-                # Generate random Khmer name
-                if gender == 'male':
-                    first_name = random.choice(male_names)
-                else:
-                    first_name = random.choice(female_names)
-                
-                surname = random.choice(surnames)
-                full_name = f"{first_name} {surname}"
-                
-                updates.append((full_name, record_id))
-            
-            # Execute batch update
-            db.session.execute(
-                db.text("UPDATE people SET name = :name WHERE id = :id"),
-                [{"name": name, "id": pid} for name, pid in updates]
-            )
-            db.session.commit()
-            
-            updated += len(batch)
-            progress = (updated / total) * 100
-            print(f"  Progress: {updated:,} / {total:,} ({progress:.1f}%)")
+        start = time.perf_counter()
+        connection = db.engine.raw_connection()
+        try:
+            if use_sql:
+                updated = update_names_sql(connection, male_names, female_names, surnames, seed=seed)
+            else:
+                # Walk the table by id ranges, sizing batches to ~0.5s commits
+                updated = update_names_python(connection, male_names, female_names, surnames, restart=restart)
+        finally:
+            connection.close()
+        elapsed = time.perf_counter() - start
         
-        print(f"\n✅ Successfully updated {updated:,} names!")
+        print(f"\n✅ Successfully updated {updated:,} names in {elapsed:.1f}s!")
         print("All people now have authentic Khmer (Cambodian) names.")
         
         # Show sample names
@@ -103,4 +169,9 @@ def update_names_fast():
             print(f"  {name} ({gender})")
 
 if __name__ == '__main__':
-    update_names_fast()
+    parser = argparse.ArgumentParser(description="Rewrite every name with a random Khmer name")
+    parser.add_argument('--sql', action='store_true', help="Set-based rewrite inside SQLite (not resumable)")
+    parser.add_argument('--seed', type=int, default=None, help="Hash seed for --sql")
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint of an interrupted run")
+    args = parser.parse_args()
+    update_names_fast(restart=args.restart, use_sql=args.sql, seed=args.seed)
@@ -7,6 +7,13 @@ from tkinter import font as tkfont
 import sqlite3
 from werkzeug.security import check_password_hash
 from datetime import datetime
+import counts
+import repository
+import audit_log
+import history_partitions
+
+# Result counts per filter set, so paging doesn't re-run COUNT(*)
+COUNT_CACHE = counts.CountCache(ttl=300)
 
 class PeopleDatabaseApp:
     def __init__(self, root):
@@ -17,6 +24,12 @@ class PeopleDatabaseApp:
         
         self.current_user = None
         self.db_path = 'instance/people.db'
+        self.people = repository.PeopleRepository(
+            repository.SQLiteBackend(self.db_path, read_only=True), COUNT_CACHE
+        )
+        self.audit = audit_log.AuditWriter(repository.SQLiteBackend(self.db_path, pool_size=1))
+        # Id each visited page starts after, for keyset paging
+        self.page_starts = [None]
         
         # Show login screen
         self.show_login()
@@ -148,7 +161,7 @@ class PeopleDatabaseApp:
         
         # Search button
         search_btn = tk.Button(search_frame, text="🔍 Search", font=('Arial', 11, 'bold'),
-                              bg='#4CAF50', fg='white', command=self.search_people)
+                              bg='#4CAF50', fg='white', command=self.new_search)
         search_btn.pack(fill='x', pady=10)
         
         # Clear button
@@ -231,71 +244,40 @@ class PeopleDatabaseApp:
         tk.Button(pagination_frame, text="Next ▶", command=self.next_page).pack(side='left', padx=5)
         
         # Initial search
-        self.search_people()
+        self.new_search()
 
     
+    def new_search(self):
+        """Search from the first page"""
+        self.page_var.set(1)
+        self.page_starts = [None]
+        self.search_people()
+    
     def search_people(self):
         """Search people in database"""
         page = self.page_var.get()
         per_page = 100
-        offset = (page - 1) * per_page
-        
-        # Build query
-        query = "SELECT id, name, gender, age, province, district, commune, village FROM people WHERE 1=1"
-        params = []
-        
-        # Province restriction for managers
-        if self.current_user['role'] == 'manager' and self.current_user['province']:
-            query += " AND province = ?"
-            params.append(self.current_user['province'])
-        
-        # Search filters
-        if self.id_entry.get():
-            query += " AND id = ?"
-            params.append(int(self.id_entry.get()))
-        
-        if self.name_entry.get():
-            query += " AND name LIKE ?"
-            params.append(f"%{self.name_entry.get()}%")
-        
-        if self.gender_var.get():
-            query += " AND gender = ?"
-            params.append(self.gender_var.get())
-        
-        if self.age_entry.get():
-            query += " AND age = ?"
-            params.append(int(self.age_entry.get()))
-        
-        if self.province_entry.get():
-            query += " AND province LIKE ?"
-            params.append(f"%{self.province_entry.get()}%")
-        
-        if self.district_entry.get():
-            query += " AND district LIKE ?"
-            params.append(f"%{self.district_entry.get()}%")
-        
-        if self.commune_entry.get():
-            query += " AND commune LIKE ?"
-            params.append(f"%{self.commune_entry.get()}%")
-        
-        if self.village_entry.get():
-            query += " AND village LIKE ?"
-            params.append(f"%{self.village_entry.get()}%")
-        
-        # Get total count
-        count_query = query.replace("SELECT id, name, gender, age, province, district, commune, village", "SELECT COUNT(*)")
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()[0]
-        
-        # Get paginated results
-        query += f" LIMIT {per_page} OFFSET {offset}"
-        cursor.execute(query, params)
-        results = cursor.fetchall()
-        conn.close()
+        manager_province = self.current_user['province'] if self.current_user['role'] == 'manager' else None
+        filters = repository.normalize_filters({
+            'id': self.id_entry.get(),
+            'name': self.name_entry.get(),
+            'gender': self.gender_var.get(),
+            'age': self.age_entry.get(),
+            'province': self.province_entry.get(),
+            'district': self.district_entry.get(),
+            'commune': self.commune_entry.get(),
+            'village': self.village_entry.get(),
+        }, manager_province=manager_province)
+        
+        # Pages are read by keyset: the rows after the last id of the page before
+        with self.people.backend.connection() as conn:
+            total = self.people.count(filters, conn)
+            results = self.people.page(filters, after_id=self.page_starts[page - 1],
+                                       limit=per_page, conn=conn)
+        if len(results) == per_page:
+            del self.page_starts[page:]
+            self.page_starts.append(results[-1][0])
         
         # Update UI
         self.result_count_label.config(text=f"Total: {total:,}")
@@ -322,8 +304,7 @@ class PeopleDatabaseApp:
         self.commune_entry.delete(0, 'end')
         self.village_entry.delete(0, 'end')
         self.gender_var.set('')
-        self.page_var.set(1)
-        self.search_people()
+        self.new_search()
     
     def prev_page(self):
         """Go to previous page"""
@@ -333,7 +314,7 @@ class PeopleDatabaseApp:
     
     def next_page(self):
         """Go to next page"""
-        if self.page_var.get() < self.total_pages_var.get():
+        if self.page_var.get() < min(self.total_pages_var.get(), len(self.page_starts)):
             self.page_var.set(self.page_var.get() + 1)
             self.search_people()
     
@@ -513,6 +494,9 @@ class PeopleDatabaseApp:
     
     def show_history(self):
         """Show action history window"""
+        # Include actions still waiting in the audit queue
+        self.audit.flush(timeout=5)
+        
         history_window = tk.Toplevel(self.root)
         history_window.title("Action History")
         history_window.geometry("800x500")
@@ -542,38 +526,19 @@ class PeopleDatabaseApp:
         vsb.pack(side='right', fill='y')
         history_tree.pack(fill='both', expand=True)
         
-        # Load history
+        # Load history (newest 100, from the latest monthly partitions)
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT h.id, u.username, h.action, h.details, h.timestamp
-            FROM edit_history h
-            JOIN users u ON h.user_id = u.id
-        """
-        
-        if self.current_user['role'] == 'manager':
-            query += " WHERE h.user_id = ?"
-            cursor.execute(query + " ORDER BY h.timestamp DESC LIMIT 100", (self.current_user['id'],))
-        else:
-            cursor.execute(query + " ORDER BY h.timestamp DESC LIMIT 100")
-        
-        history = cursor.fetchall()
+        user_id = self.current_user['id'] if self.current_user['role'] == 'manager' else None
+        history = history_partitions.recent(conn, 100, user_id=user_id)
         conn.close()
         
         for row in history:
             history_tree.insert('', 'end', values=row)
     
     def log_action(self, action, person_id=None, details=None):
-        """Log user action to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO edit_history (user_id, person_id, action, details, timestamp)
-            VALUES (?, ?, ?, ?, ?)
-        """, (self.current_user['id'], person_id, action, details, datetime.now()))
-        conn.commit()
-        conn.close()
+        """Log user action to database (queued, see audit_log.py)"""
+        self.audit.log(self.current_user['id'], action, person_id=person_id,
+                       details=details, timestamp=datetime.now())
     
     def logout(self):
         """Logout current user"""
@@ -7,13 +7,21 @@ import sqlite3
 from datetime import datetime
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem,
+    QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QTableView,
     QComboBox, QFrame, QStackedWidget, QMessageBox, QDialog,
     QFormLayout, QHeaderView, QScrollArea, QGridLayout
 )
 from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QSize
 from PyQt6.QtGui import QFont, QIcon, QPalette, QColor, QLinearGradient
 from werkzeug.security import check_password_hash, generate_password_hash
+import counts
+import repository
+import audit_log
+import history_partitions
+from gui_query import PeopleTableModel, QueryWorker
+
+# Result counts per filter set, so repeated searches don't re-run COUNT(*)
+COUNT_CACHE = counts.CountCache(ttl=300)
 
 
 class ModernButton(QPushButton):
@@ -243,13 +251,25 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.user_data = user_data
         self.db_path = 'instance/people.db'
-        self.current_page = 1
-        self.total_pages = 1
-        self.per_page = 100
         
         self.setWindowTitle("People Database Management System")
         self.setMinimumSize(1400, 800)
         
+        # Searches run on a background thread with a pooled read-only connection
+        self.search_generation = 0
+        self.people = repository.PeopleRepository(
+            repository.SQLiteBackend(self.db_path, read_only=True), COUNT_CACHE
+        )
+        self.query_worker = QueryWorker(self.people, self)
+        self.audit = audit_log.AuditWriter(repository.SQLiteBackend(self.db_path, pool_size=1))
+        self.query_worker.count_ready.connect(self.show_count)
+        self.query_worker.search_failed.connect(self.show_search_error)
+        self.query_worker.start()
+        self.results_model = PeopleTableModel(self.query_worker, [
+            "ID", "Name", "Gender", "Age", "Province", "District", "Commune", "Village"
+        ], parent=self)
+        self.results_model.rowsInserted.connect(self.show_loaded)
+        
         self.setup_ui()
         self.log_action('login')
         self.search_people()
@@ -472,26 +492,23 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(header_layout)
         
-        # Table
-        self.table = QTableWidget()
-        self.table.setColumnCount(8)
-        self.table.setHorizontalHeaderLabels([
-            "ID", "Name", "Gender", "Age", "Province", "District", "Commune", "Village"
-        ])
+        # Table; rows are fetched in blocks as the user scrolls
+        self.table = QTableView()
+        self.table.setModel(self.results_model)
         
         # Table styling
         self.table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 border: 2px solid #E0E0E0;
                 border-radius: 10px;
                 background-color: white;
                 gridline-color: #E0E0E0;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 border-bottom: 1px solid #F0F0F0;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #E3F2FD;
                 color: #1976D2;
             }
@@ -506,8 +523,9 @@ class MainWindow(QMainWindow):
         """)
         
         self.table.setAlternatingRowColors(True)
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
         
         # Set column widths
         header = self.table.horizontalHeader()
@@ -526,17 +544,12 @@ class MainWindow(QMainWindow):
         
         layout.addWidget(self.table)
         
-        # Pagination
+        # Loaded rows
         pagination = QHBoxLayout()
-        
-        self.prev_btn = ModernButton("◀ Previous", "#2196F3", "#1976D2")
-        self.prev_btn.clicked.connect(self.prev_page)
-        pagination.addWidget(self.prev_btn)
-        
         pagination.addStretch()
         
-        self.page_label = QLabel("Page 1 / 1")
-        self.page_label.setStyleSheet("""
+        self.loaded_label = QLabel("0 rows loaded")
+        self.loaded_label.setStyleSheet("""
             font-size: 15px;
             font-weight: bold;
             color: #333;
@@ -544,107 +557,60 @@ class MainWindow(QMainWindow):
             background-color: #F5F5F5;
             border-radius: 8px;
         """)
-        pagination.addWidget(self.page_label)
+        pagination.addWidget(self.loaded_label)
         
         pagination.addStretch()
         
-        self.next_btn = ModernButton("Next ▶", "#2196F3", "#1976D2")
-        self.next_btn.clicked.connect(self.next_page)
-        pagination.addWidget(self.next_btn)
-        
         layout.addLayout(pagination)
         
         parent_layout.addWidget(content)
     
     def search_people(self):
-        """Search people in database"""
-        offset = (self.current_page - 1) * self.per_page
-        
-        # Build query
-        query = "SELECT id, name, gender, age, province, district, commune, village FROM people WHERE 1=1"
-        params = []
-        
-        # Province restriction for managers
-        if self.user_data['role'] == 'manager' and self.user_data['province']:
-            query += " AND province = ?"
-            params.append(self.user_data['province'])
-        
-        # Search filters
-        if self.id_input.text():
-            try:
-                query += " AND id = ?"
-                params.append(int(self.id_input.text()))
-            except ValueError:
-                pass
-        
-        if self.name_input.text():
-            query += " AND name LIKE ?"
-            params.append(f"%{self.name_input.text()}%")
-        
+        """Search people in database (the query runs on the worker thread)"""
+        # Read the filters here; the worker thread must not touch widgets
         gender = self.gender_combo.currentText()
-        if gender and gender != "All Genders":
-            query += " AND gender = ?"
-            params.append(gender)
-        
-        if self.age_input.text():
-            try:
-                query += " AND age = ?"
-                params.append(int(self.age_input.text()))
-            except ValueError:
-                pass
-        
-        if self.province_input.text():
-            query += " AND province LIKE ?"
-            params.append(f"%{self.province_input.text()}%")
-        
-        if self.district_input.text():
-            query += " AND district LIKE ?"
-            params.append(f"%{self.district_input.text()}%")
-        
-        if self.commune_input.text():
-            query += " AND commune LIKE ?"
-            params.append(f"%{self.commune_input.text()}%")
-        
-        if self.village_input.text():
-            query += " AND village LIKE ?"
-            params.append(f"%{self.village_input.text()}%")
-        
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get total count
-            count_query = query.replace("SELECT id, name, gender, age, province, district, commune, village", "SELECT COUNT(*)")
-            cursor.execute(count_query, params)
-            total = cursor.fetchone()[0]
-            
-            # Get paginated results
-            query += f" LIMIT {self.per_page} OFFSET {offset}"
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            conn.close()
-            
-            # Update UI
-            self.count_label.setText(f"Total: {total:,}")
-            self.total_pages = max(1, (total + self.per_page - 1) // self.per_page)
-            self.page_label.setText(f"Page {self.current_page} / {self.total_pages}")
-            
-            # Update table
-            self.table.setRowCount(len(results))
-            for row_idx, row_data in enumerate(results):
-                for col_idx, value in enumerate(row_data):
-                    item = QTableWidgetItem(str(value))
-                    item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                    self.table.setItem(row_idx, col_idx, item)
-            
-            # Update button states
-            self.prev_btn.setEnabled(self.current_page > 1)
-            self.next_btn.setEnabled(self.current_page < self.total_pages)
-            
-            self.log_action('search', details=f"Found {total} results")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Search error:\n{str(e)}")
+        if gender == "All Genders":
+            gender = ''
+        manager_province = self.user_data['province'] if self.user_data['role'] == 'manager' else None
+        filters = repository.normalize_filters({
+            'id': self.id_input.text(),
+            'name': self.name_input.text(),
+            'gender': gender,
+            'age': self.age_input.text(),
+            'province': self.province_input.text(),
+            'district': self.district_input.text(),
+            'commune': self.commune_input.text(),
+            'village': self.village_input.text(),
+        }, manager_province=manager_province)
+        
+        self.count_label.setText("Searching...")
+        self.loaded_label.setText("0 rows loaded")
+        self.search_generation = self.results_model.search(
+            lambda conn: self.people.search_sql(filters, conn)
+        )
+    
+    def show_loaded(self):
+        """Keep the loaded-rows label in step with the table"""
+        self.loaded_label.setText(f"{self.results_model.rowCount():,} rows loaded")
+    
+    def show_count(self, generation, total):
+        """Finish a search once its total is known"""
+        if generation != self.search_generation:
+            return
+        self.count_label.setText(f"Total: {total:,}")
+        self.log_action('search', details=f"Found {total} results")
+    
+    def show_search_error(self, generation, message):
+        if generation != self.search_generation:
+            return
+        self.count_label.setText("Total: 0")
+        QMessageBox.critical(self, "Error", f"Search error:\n{message}")
+    
+    def closeEvent(self, event):
+        """Stop the query worker and write the queued audit rows with the window"""
+        self.query_worker.stop()
+        self.audit.close()
+        super().closeEvent(event)
     
     def clear_filters(self):
         """Clear all search filters"""
@@ -656,20 +622,7 @@ class MainWindow(QMainWindow):
         self.district_input.clear()
         self.commune_input.clear()
         self.village_input.clear()
-        self.current_page = 1
         self.search_people()
-    
-    def prev_page(self):
-        """Go to previous page"""
-        if self.current_page > 1:
-            self.current_page -= 1
-            self.search_people()
-    
-    def next_page(self):
-        """Go to next page"""
-        if self.current_page < self.total_pages:
-            self.current_page += 1
-            self.search_people()
 
     
     def show_users_dialog(self):
@@ -909,6 +862,9 @@ class MainWindow(QMainWindow):
     
     def show_history_dialog(self):
         """Show action history dialog"""
+        # Include actions still waiting in the audit queue
+        self.audit.flush(timeout=5)
+        
         dialog = QDialog(self)
         dialog.setWindowTitle("Action History")
         dialog.setMinimumSize(900, 600)
@@ -974,22 +930,10 @@ class MainWindow(QMainWindow):
         
         # Load history
         try:
+            # Newest 100, from the latest monthly partitions
             conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            query = """
-                SELECT h.id, u.username, h.action, h.details, h.timestamp
-                FROM edit_history h
-                JOIN users u ON h.user_id = u.id
-            """
-            
-            if self.user_data['role'] == 'manager':
-                query += " WHERE h.user_id = ?"
-                cursor.execute(query + " ORDER BY h.timestamp DESC LIMIT 100", (self.user_data['id'],))
-            else:
-                cursor.execute(query + " ORDER BY h.timestamp DESC LIMIT 100")
-            
-            history = cursor.fetchall()
+            user_id = self.user_data['id'] if self.user_data['role'] == 'manager' else None
+            history = history_partitions.recent(conn, 100, user_id=user_id)
             conn.close()
             
             history_table.setRowCount(len(history))
@@ -1006,18 +950,9 @@ class MainWindow(QMainWindow):
         dialog.exec()
     
     def log_action(self, action, person_id=None, details=None):
-        """Log user action to database"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO edit_history (user_id, person_id, action, details, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            """, (self.user_data['id'], person_id, action, details, datetime.now()))
-            conn.commit()
-            conn.close()
-        except:
-            pass
+        """Log user action to database (queued, see audit_log.py)"""
+        self.audit.log(self.user_data['id'], action, person_id=person_id,
+                       details=details, timestamp=datetime.now())
     
     def logout(self):
         """Logout current user"""
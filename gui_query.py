@@ -0,0 +1,271 @@
+"""
+Background searches for the PyQt6 desktop GUIs
+One worker thread holds a read-only SQLite connection from the
+repository's pool, so the window never blocks on a query. Only the newest search matters: submitting
+one aborts the statement in flight with Connection.interrupt(), and
+requests that pile up while a search runs collapse into the latest.
+
+Results are read in blocks of BLOCK_SIZE rows by keyset (id > last id of
+the previous block, ORDER BY id), never LIMIT/OFFSET, and shown through
+PeopleTableModel, which fetches blocks as the view scrolls and keeps only
+the most recently used ones in memory
+"""
+import threading
+from collections import OrderedDict
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt, QThread, pyqtSignal
+
+import repository
+
+# Rows per block fetched from the database
+BLOCK_SIZE = 200
+
+# Blocks kept in memory by each model; older ones are re-read on demand
+MAX_CACHED_BLOCKS = 50
+
+
+class QueryWorker(QThread):
+    """
+    Runs searches submitted from the UI thread.
+
+    submit() takes a `build(conn)` callable returning
+    (query, params, count_query), normally PeopleRepository.search_sql();
+    it runs on the worker thread, so it can consult the connection.
+    `query` must end with its WHERE clause: repository.page_sql() appends
+    the keyset condition, ORDER BY id and LIMIT. The first block is read straight
+    away, later ones when fetch_block() asks for them. Signals carry the
+    generation number submit() returned, so the UI can drop anything from
+    a superseded search.
+    """
+    block_ready = pyqtSignal(int, int, list)    # generation, block number, rows
+    count_ready = pyqtSignal(int, int)          # generation, total matches
+    search_failed = pyqtSignal(int, str)        # generation, error message
+
+    def __init__(self, people, parent=None):
+        super().__init__(parent)
+        self.people = people
+        self._condition = threading.Condition()
+        self._pending = None
+        self._blocks = {}
+        self._generation = 0
+        self._search = None
+        self._busy = False
+        self._stopping = False
+        self._conn = None
+
+    def submit(self, build):
+        """Queue a search, cancelling any older one; returns its generation"""
+        with self._condition:
+            self._generation += 1
+            self._pending = (self._generation, build)
+            self._blocks.clear()
+            if self._busy:
+                self._conn.interrupt()
+            self._condition.notify()
+            return self._generation
+
+    def fetch_block(self, generation, block, after_id):
+        """Queue block number `block`, the rows after id `after_id` (None for the first)"""
+        with self._condition:
+            if generation != self._generation or self._stopping:
+                return
+            # Re-queueing moves it to the front: the latest request is served first
+            self._blocks.pop(block, None)
+            self._blocks[block] = after_id
+            self._condition.notify()
+
+    def stop(self):
+        """Abort the current search and end the thread"""
+        with self._condition:
+            self._stopping = True
+            self._pending = None
+            self._blocks.clear()
+            if self._busy:
+                self._conn.interrupt()
+            self._condition.notify()
+        self.wait()
+
+    def _superseded(self, generation):
+        return self._stopping or generation != self._generation
+
+    def run(self):
+        self._conn = self.people.backend.acquire()
+        try:
+            while True:
+                with self._condition:
+                    while self._pending is None and not self._blocks and not self._stopping:
+                        self._condition.wait()
+                    if self._stopping:
+                        return
+                    if self._pending is not None:
+                        generation, build = self._pending
+                        self._pending = None
+                        job = lambda: self._execute(generation, build)
+                    else:
+                        generation = self._generation
+                        block, after_id = self._blocks.popitem()
+                        job = lambda: self._execute_block(generation, block, after_id)
+                    self._busy = True
+                try:
+                    job()
+                except Exception as e:
+                    # An interrupted statement just means a newer search took over
+                    if not self._superseded(generation):
+                        self.search_failed.emit(generation, str(e))
+                finally:
+                    with self._condition:
+                        self._busy = False
+        finally:
+            self.people.backend.release(self._conn)
+
+    def _read_block(self, after_id):
+        sql, params = repository.page_sql(*self._search[1:], after_id=after_id, limit=BLOCK_SIZE)
+        return self._conn.execute(sql, params).fetchall()
+
+    def _execute_block(self, generation, block, after_id):
+        if self._search is None or self._search[0] != generation:
+            return
+        rows = self._read_block(after_id)
+        if not self._superseded(generation):
+            self.block_ready.emit(generation, block, rows)
+
+    def _execute(self, generation, build):
+        query, params, count_query = build(self._conn)
+        self._search = (generation, query, params)
+
+        rows = self._read_block(None)
+        if self._superseded(generation):
+            return
+        self.block_ready.emit(generation, 0, rows)
+
+        # Count after the first block, so rows appear without waiting for it
+        if len(rows) < BLOCK_SIZE:
+            total = len(rows)
+        else:
+            total = self.people.count_sql(count_query, params, self._conn)
+        if not self._superseded(generation):
+            self.count_ready.emit(generation, total)
+
+
+class PeopleTableModel(QAbstractTableModel):
+    """
+    Search results for a QTableView, read lazily from a QueryWorker.
+
+    The view grows through canFetchMore()/fetchMore() one block at a time
+    as the user scrolls. Loaded blocks sit in an LRU cache keyed by the id
+    each block starts after, so the row count can reach millions while
+    only MAX_CACHED_BLOCKS blocks stay in memory; an evicted block is read
+    again by keyset when its rows scroll back into view. Rows are id
+    ordered, and the first column must be the id.
+    """
+
+    def __init__(self, worker, headers, foreground=None, max_blocks=MAX_CACHED_BLOCKS, parent=None):
+        super().__init__(parent)
+        self.worker = worker
+        self.headers = headers
+        self.foreground = foreground
+        self.max_blocks = max_blocks
+        self.generation = 0
+        self._reset_state()
+        worker.block_ready.connect(self._block_ready)
+
+    def _reset_state(self):
+        self._blocks = OrderedDict()    # after_id -> rows
+        self._boundaries = [None]       # block number -> id it starts after
+        self._requested = {0}
+        self._loaded = 0
+        self._exhausted = False
+
+    def search(self, build):
+        """Start a new search (see QueryWorker.submit); returns its generation"""
+        self.beginResetModel()
+        self._reset_state()
+        self.generation = self.worker.submit(build)
+        self.endResetModel()
+        return self.generation
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return str(section + 1)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return Qt.AlignmentFlag.AlignCenter
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ForegroundRole):
+            return None
+
+        row = self._row(index.row())
+        if row is None or index.column() >= len(row):
+            return None
+        value = row[index.column()]
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return self.foreground(index.column(), value) if self.foreground else None
+        return str(value)
+
+    def _row(self, row_number):
+        block, offset = divmod(row_number, BLOCK_SIZE)
+        rows = self._blocks.get(self._boundaries[block])
+        if rows is None:
+            # Evicted earlier; show blanks until it has been read again
+            self._request(block)
+            return None
+        self._blocks.move_to_end(self._boundaries[block])
+        return rows[offset] if offset < len(rows) else None
+
+    def _request(self, block):
+        if block not in self._requested:
+            self._requested.add(block)
+            self.worker.fetch_block(self.generation, block, self._boundaries[block])
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return False
+        block = self._loaded // BLOCK_SIZE
+        return block < len(self._boundaries) and block not in self._requested
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._request(self._loaded // BLOCK_SIZE)
+
+    def _store(self, block, rows):
+        key = self._boundaries[block]
+        self._blocks[key] = rows
+        self._blocks.move_to_end(key)
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+
+    def _block_ready(self, generation, block, rows):
+        if generation != self.generation:
+            return
+        self._requested.discard(block)
+        first = block * BLOCK_SIZE
+
+        if first < self._loaded:
+            # A block that was evicted and read again
+            self._store(block, rows)
+            if rows:
+                self.dataChanged.emit(self.index(first, 0),
+                                      self.index(first + len(rows) - 1, len(self.headers) - 1))
+            return
+
+        # The next block at the end of the results
+        if len(rows) < BLOCK_SIZE:
+            self._exhausted = True
+        else:
+            self._boundaries.append(rows[-1][0])
+        if rows:
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+            self._store(block, rows)
+            self._loaded = first + len(rows)
+            self.endInsertRows()
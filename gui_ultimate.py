@@ -9,6 +9,13 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 from werkzeug.security import check_password_hash, generate_password_hash
+import counts
+import repository
+import stats
+from gui_query import PeopleTableModel, QueryWorker
+
+# Result counts per filter set, so repeated searches don't re-run COUNT(*)
+COUNT_CACHE = counts.CountCache(ttl=300)
 
 
 class AnimatedButton(QPushButton):
@@ -500,9 +507,6 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.user_data = user_data
         self.db_path = 'instance/people.db'
-        self.current_page = 1
-        self.total_pages = 1
-        self.per_page = 100
         
         self.setWindowTitle("People Database Management System")
         self.setMinimumSize(1500, 850)
@@ -510,6 +514,20 @@ class MainWindow(QMainWindow):
         # Remove title bar for custom design
         self.setWindowFlag(Qt.WindowType.FramelessWindowHint)
         
+        # Searches run on a background thread with a pooled read-only connection
+        self.search_generation = 0
+        self.people = repository.PeopleRepository(
+            repository.SQLiteBackend(self.db_path, read_only=True), COUNT_CACHE
+        )
+        self.query_worker = QueryWorker(self.people, self)
+        self.query_worker.count_ready.connect(self.show_count)
+        self.query_worker.search_failed.connect(self.show_search_error)
+        self.query_worker.start()
+        self.results_model = PeopleTableModel(self.query_worker, [
+            "ID", "Name", "Gender", "Age", "Province", "District", "Commune", "Village"
+        ], foreground=self.cell_color, parent=self)
+        self.results_model.rowsInserted.connect(self.show_loaded)
+        
         self.setup_ui()
         self.log_action('login')
         
@@ -681,9 +699,9 @@ class MainWindow(QMainWindow):
         self.results_stat = StatCard("🔍", "Search Results", "0", "#2196F3")
         stats_layout.addWidget(self.results_stat)
         
-        # Current page stat
-        self.page_stat = StatCard("📄", "Current Page", "1", "#FF9800")
-        stats_layout.addWidget(self.page_stat)
+        # Loaded rows stat
+        self.loaded_stat = StatCard("📄", "Rows Loaded", "0", "#FF9800")
+        stats_layout.addWidget(self.loaded_stat)
         
         # User role stat
         role_icon = "👑" if self.user_data['role'] == 'super_admin' else "👤"
@@ -702,12 +720,19 @@ class MainWindow(QMainWindow):
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
+            province = None
             if self.user_data['role'] == 'manager' and self.user_data['province']:
-                cursor.execute("SELECT COUNT(*) FROM people WHERE province = ?", (self.user_data['province'],))
+                province = self.user_data['province']
+            
+            # Read the precomputed aggregates instead of counting 10M rows
+            if stats.has_stats(conn):
+                total = stats.total_people(conn, province)
+            elif province:
+                cursor.execute("SELECT COUNT(*) FROM people_view WHERE province = ?", (province,))
+                total = cursor.fetchone()[0]
             else:
                 cursor.execute("SELECT COUNT(*) FROM people")
-            
-            total = cursor.fetchone()[0]
+                total = cursor.fetchone()[0]
             conn.close()
             
             self.total_stat.update_value(f"{total:,}")
@@ -794,30 +819,27 @@ class MainWindow(QMainWindow):
         """Create main content with table"""
         content = ModernCard("📊 Search Results")
         
-        # Table
-        self.table = QTableWidget()
-        self.table.setColumnCount(8)
-        self.table.setHorizontalHeaderLabels([
-            "ID", "Name", "Gender", "Age", "Province", "District", "Commune", "Village"
-        ])
+        # Table; rows are fetched in blocks as the user scrolls
+        self.table = QTableView()
+        self.table.setModel(self.results_model)
         
         self.table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 border: none;
                 border-radius: 10px;
                 background-color: #FAFAFA;
                 gridline-color: #E0E0E0;
                 font-size: 13px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 10px;
                 border-bottom: 1px solid #F0F0F0;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #E3F2FD;
                 color: #1976D2;
             }
-            QTableWidget::item:hover {
+            QTableView::item:hover {
                 background-color: #F5F5F5;
             }
             QHeaderView::section {
@@ -846,9 +868,10 @@ class MainWindow(QMainWindow):
         """)
         
         self.table.setAlternatingRowColors(True)
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
         self.table.verticalHeader().setVisible(False)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
         
         # Column widths
         header = self.table.horizontalHeader()
@@ -867,146 +890,70 @@ class MainWindow(QMainWindow):
         
         content.layout.addWidget(self.table)
         
-        # Pagination
-        pagination = QHBoxLayout()
-        pagination.setSpacing(15)
-        
-        self.prev_btn = AnimatedButton("◀ Previous", "", "#2196F3", "#1976D2")
-        self.prev_btn.clicked.connect(self.prev_page)
-        pagination.addWidget(self.prev_btn)
-        
-        pagination.addStretch()
-        
-        self.page_label = QLabel("Page 1 / 1")
-        self.page_label.setStyleSheet("""
-            font-size: 16px;
-            font-weight: bold;
-            color: #333;
-            padding: 12px 24px;
-            background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
-                stop:0 #E3F2FD, stop:1 #F3E5F5);
-            border-radius: 10px;
-        """)
-        pagination.addWidget(self.page_label)
-        
-        pagination.addStretch()
-        
-        self.next_btn = AnimatedButton("Next ▶", "", "#2196F3", "#1976D2")
-        self.next_btn.clicked.connect(self.next_page)
-        pagination.addWidget(self.next_btn)
-        
-        content.layout.addLayout(pagination)
-        
         parent_layout.addWidget(content)
 
     
     def search_people(self):
-        """Search with loading animation"""
-        self.setCursor(Qt.CursorShape.WaitCursor)
-        QApplication.processEvents()
-        
-        offset = (self.current_page - 1) * self.per_page
-        
-        # Build query
-        query = "SELECT id, name, gender, age, province, district, commune, village FROM people WHERE 1=1"
-        params = []
-        
-        # Province restriction
-        if self.user_data['role'] == 'manager' and self.user_data['province']:
-            query += " AND province = ?"
-            params.append(self.user_data['province'])
-        
-        # Filters
-        if self.id_input.text():
-            try:
-                query += " AND id = ?"
-                params.append(int(self.id_input.text()))
-            except ValueError:
-                pass
-        
-        if self.name_input.text():
-            query += " AND name LIKE ?"
-            params.append(f"%{self.name_input.text()}%")
+        """Search with loading animation (the query runs on the worker thread)"""
+        self.setCursor(Qt.CursorShape.BusyCursor)
         
+        # Read the filters here; the worker thread must not touch widgets
         gender = self.gender_combo.currentText()
         if "Male" in gender and "All" not in gender:
-            query += " AND gender = ?"
-            params.append("male")
+            gender = 'male'
         elif "Female" in gender:
-            query += " AND gender = ?"
-            params.append("female")
-        
-        if self.age_input.text():
-            try:
-                query += " AND age = ?"
-                params.append(int(self.age_input.text()))
-            except ValueError:
-                pass
-        
-        if self.province_input.text():
-            query += " AND province LIKE ?"
-            params.append(f"%{self.province_input.text()}%")
-        
-        if self.district_input.text():
-            query += " AND district LIKE ?"
-            params.append(f"%{self.district_input.text()}%")
-        
-        if self.commune_input.text():
-            query += " AND commune LIKE ?"
-            params.append(f"%{self.commune_input.text()}%")
+            gender = 'female'
+        else:
+            gender = ''
+        manager_province = self.user_data['province'] if self.user_data['role'] == 'manager' else None
+        filters = repository.normalize_filters({
+            'id': self.id_input.text(),
+            'name': self.name_input.text(),
+            'gender': gender,
+            'age': self.age_input.text(),
+            'province': self.province_input.text(),
+            'district': self.district_input.text(),
+            'commune': self.commune_input.text(),
+            'village': self.village_input.text(),
+        }, manager_province=manager_province)
+        
+        self.loaded_stat.update_value("0")
+        self.search_generation = self.results_model.search(
+            lambda conn: self.people.search_sql(filters, conn)
+        )
+    
+    def cell_color(self, column, value):
+        """Text color for a result cell"""
+        # Color code gender
+        if column == 2:
+            return QColor("#2196F3") if value == 'male' else QColor("#E91E63")
+        return None
+    
+    def show_loaded(self):
+        """Keep the loaded-rows stat in step with the table"""
+        self.loaded_stat.update_value(f"{self.results_model.rowCount():,}")
+    
+    def show_count(self, generation, total):
+        """Finish a search once its total is known"""
+        if generation != self.search_generation:
+            return
         
-        if self.village_input.text():
-            query += " AND village LIKE ?"
-            params.append(f"%{self.village_input.text()}%")
+        # Update stats
+        self.results_stat.update_value(f"{total:,}")
+        self.setCursor(Qt.CursorShape.ArrowCursor)
         
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Count
-            count_query = query.replace("SELECT id, name, gender, age, province, district, commune, village", "SELECT COUNT(*)")
-            cursor.execute(count_query, params)
-            total = cursor.fetchone()[0]
-            
-            # Results
-            query += f" LIMIT {self.per_page} OFFSET {offset}"
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            conn.close()
-            
-            # Update stats
-            self.results_stat.update_value(f"{total:,}")
-            self.page_stat.update_value(str(self.current_page))
-            
-            self.total_pages = max(1, (total + self.per_page - 1) // self.per_page)
-            self.page_label.setText(f"Page {self.current_page} / {self.total_pages}")
-            
-            # Update table
-            self.table.setRowCount(len(results))
-            for row_idx, row_data in enumerate(results):
-                for col_idx, value in enumerate(row_data):
-                    item = QTableWidgetItem(str(value))
-                    item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                    
-                    # Color code gender
-                    if col_idx == 2:
-                        if value == 'male':
-                            item.setForeground(QColor("#2196F3"))
-                        else:
-                            item.setForeground(QColor("#E91E63"))
-                    
-                    self.table.setItem(row_idx, col_idx, item)
-            
-            # Button states
-            self.prev_btn.setEnabled(self.current_page > 1)
-            self.next_btn.setEnabled(self.current_page < self.total_pages)
-            
-            self.log_action('search', details=f"Found {total} results")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Search error:\n{str(e)}")
-        finally:
-            self.setCursor(Qt.CursorShape.ArrowCursor)
+        self.log_action('search', details=f"Found {total} results")
+    
+    def show_search_error(self, generation, message):
+        if generation != self.search_generation:
+            return
+        self.setCursor(Qt.CursorShape.ArrowCursor)
+        QMessageBox.critical(self, "Error", f"Search error:\n{message}")
+    
+    def closeEvent(self, event):
+        """Stop the query worker with the window"""
+        self.query_worker.stop()
+        super().closeEvent(event)
     
     def clear_filters(self):
         """Clear all with animation"""
@@ -0,0 +1,454 @@
+"""
+Monthly partitions for the audit log
+edit_history rows live in one table per month (edit_history_2026_10, ...)
+instead of one ever-growing table. Ids are unique across partitions: each
+month's AUTOINCREMENT sequence starts at YYYYMM * 10^8. The history views
+read newest first and only open the partitions that cover the requested
+page. Old months can be rolled into gzip-compressed, read-only SQLite
+archive files next to the database and dropped from it; archived months
+stay readable, decompressed on demand into a temp cache.
+
+A legacy edit_history table (from before partitioning) is still read,
+merged by key with the partitions, until --migrate moves its rows into
+monthly partitions.
+"""
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+from itertools import groupby
+
+from pagination import KeysetPage, decode_cursor, encode_cursor
+
+LEGACY_TABLE = 'edit_history'
+PARTITION_PREFIX = 'edit_history_'
+ARCHIVE_DIR_NAME = 'history_archive'
+ARCHIVE_SUFFIX = '.db.gz'
+
+# Each month's ids start at YYYYMM * ID_BLOCK
+ID_BLOCK = 10 ** 8
+
+_PARTITION_RE = re.compile(r'^edit_history_(\d{4})_(\d{2})$')
+_ARCHIVE_RE = re.compile(r'^edit_history_(\d{4})_(\d{2})\.db\.gz$')
+
+HistoryEntry = namedtuple('HistoryEntry', ['id', 'username', 'action', 'details', 'timestamp'])
+
+CREATE_PARTITION_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        person_id INTEGER,
+        action VARCHAR(50) NOT NULL,
+        details TEXT,
+        timestamp DATETIME NOT NULL
+    )
+"""
+
+PARTITION_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table} (user_id, timestamp, id)",
+]
+
+# Archives keep the username, so entries survive the user being deleted
+CREATE_ARCHIVE_SQL = """
+    CREATE TABLE IF NOT EXISTS archive.edit_history (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        username VARCHAR(80),
+        person_id INTEGER,
+        action VARCHAR(50) NOT NULL,
+        details TEXT,
+        timestamp DATETIME NOT NULL
+    )
+"""
+
+ARCHIVE_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_timestamp ON edit_history (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_user ON edit_history (user_id, timestamp, id)",
+]
+
+
+def month_of(timestamp):
+    """'YYYY_MM' for a datetime or a stored timestamp string"""
+    if isinstance(timestamp, datetime):
+        return timestamp.strftime('%Y_%m')
+    return f"{timestamp[:4]}_{timestamp[5:7]}"
+
+
+def partition_table(month):
+    return f"{PARTITION_PREFIX}{month}"
+
+
+def ensure_partition(conn, month):
+    """Create the partition for 'YYYY_MM' (with its id sequence) if needed"""
+    table = partition_table(month)
+    cursor = conn.cursor()
+    cursor.execute(CREATE_PARTITION_SQL.format(table=table))
+    for index_sql in PARTITION_INDEX_SQL:
+        cursor.execute(index_sql.format(table=table))
+    year, mon = month.split('_')
+    cursor.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? "
+        "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+        (table, int(year + mon) * ID_BLOCK, table)
+    )
+    return table
+
+
+def insert_entries(conn, rows):
+    """
+    Insert (user_id, person_id, action, details, timestamp) rows into
+    their monthly partitions; timestamps are strings in SQLAlchemy's
+    DateTime format. The caller commits.
+    """
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(month_of(row[4]), []).append(row)
+    cursor = conn.cursor()
+    for month, month_rows in by_month.items():
+        table = ensure_partition(conn, month)
+        cursor.executemany(
+            f"INSERT INTO {table} (user_id, person_id, action, details, timestamp) VALUES (?, ?, ?, ?, ?)",
+            month_rows
+        )
+
+
+def database_file(conn):
+    """Path of the main database file behind a connection"""
+    for _, name, path in conn.execute("PRAGMA database_list").fetchall():
+        if name == 'main':
+            return path
+    return ''
+
+
+def default_archive_dir(conn):
+    """history_archive/ next to the database file"""
+    return os.path.join(os.path.dirname(os.path.abspath(database_file(conn))), ARCHIVE_DIR_NAME)
+
+
+def segments(conn, archive_dir=None):
+    """
+    Every place history rows live, newest month first, as (month, kind,
+    source) with kind 'table' or 'archive'. A month written to after it
+    was archived has both, the table first. The legacy table comes last,
+    with month None.
+    """
+    if archive_dir is None:
+        archive_dir = default_archive_dir(conn)
+    found = []
+    if os.path.isdir(archive_dir):
+        for name in os.listdir(archive_dir):
+            match = _ARCHIVE_RE.match(name)
+            if match:
+                found.append((f"{match.group(1)}_{match.group(2)}", 'archive', os.path.join(archive_dir, name)))
+    has_legacy = False
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+        match = _PARTITION_RE.match(name)
+        if match:
+            found.append((f"{match.group(1)}_{match.group(2)}", 'table', name))
+        elif name == LEGACY_TABLE:
+            has_legacy = True
+    result = sorted(found, key=lambda segment: (segment[0], segment[1] == 'table'), reverse=True)
+    if has_legacy:
+        result.append((None, 'table', LEGACY_TABLE))
+    return result
+
+
+def _archive_connection(path):
+    """Read-only connection to an archive, decompressed once into a temp cache"""
+    cache_dir = os.path.join(tempfile.gettempdir(), 'people_history_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    info = os.stat(path)
+    stamp = f"{info.st_mtime_ns}.{info.st_size}"
+    cached = os.path.join(cache_dir, f"{os.path.basename(path)[:-len('.gz')]}.{stamp}")
+    if not os.path.exists(cached):
+        partial = cached + '.part'
+        with gzip.open(path, 'rb') as source, open(partial, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.replace(partial, cached)
+    return sqlite3.connect(f"file:{cached}?mode=ro&immutable=1", uri=True)
+
+
+def _read_segment(conn, kind, source, limit, key=None, newer=False, user_id=None):
+    """Up to `limit` rows of one segment, newest first (oldest first when `newer`)"""
+    if kind == 'archive':
+        reader = _archive_connection(source)
+        sql = ("SELECT id, COALESCE(username, '#' || user_id), action, details, timestamp "
+               "FROM edit_history h WHERE 1=1")
+    else:
+        reader = conn
+        sql = (f"SELECT h.id, COALESCE(u.username, '#' || h.user_id), h.action, h.details, h.timestamp "
+               f"FROM {source} h LEFT JOIN users u ON u.id = h.user_id WHERE 1=1")
+    params = []
+    if key is not None:
+        sql += f" AND (h.timestamp, h.id) {'>' if newer else '<'} (?, ?)"
+        params.extend(key)
+    if user_id is not None:
+        sql += " AND h.user_id = ?"
+        params.append(user_id)
+    order = 'ASC' if newer else 'DESC'
+    sql += f" ORDER BY h.timestamp {order}, h.id {order} LIMIT ?"
+    params.append(limit)
+    try:
+        return reader.execute(sql, params).fetchall()
+    finally:
+        if reader is not conn:
+            reader.close()
+
+
+def _entry(row):
+    timestamp = row[4]
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return HistoryEntry(row[0], row[1], row[2], row[3], timestamp)
+
+
+def fetch(conn, limit, key=None, newer=False, user_id=None, archive_dir=None):
+    """
+    Up to `limit` history entries before `key` ((timestamp string, id)),
+    newest first; with `newer`, the entries after it, oldest first.
+    Segments outside the requested range are never opened.
+    """
+    ordered = segments(conn, archive_dir)
+    legacy = ordered and ordered[-1][0] is None
+    if legacy:
+        ordered = ordered[:-1]
+    if newer:
+        ordered = list(reversed(ordered))
+    key_month = month_of(key[0]) if key is not None else None
+
+    rows = []
+    for month, month_segments in groupby(ordered, key=lambda segment: segment[0]):
+        if key_month is not None:
+            # Months entirely on the wrong side of the key hold nothing for us
+            if (month > key_month) if not newer else (month < key_month):
+                continue
+        wanted = limit - len(rows)
+        month_rows = {}
+        for _, kind, source in month_segments:
+            # Ids are unique per month, so a row in both a table and its archive counts once
+            for row in _read_segment(conn, kind, source, wanted, key, newer, user_id):
+                month_rows.setdefault(row[0], row)
+        rows.extend(sorted(month_rows.values(), key=lambda row: (row[4], row[0]), reverse=not newer)[:wanted])
+        if len(rows) >= limit:
+            break
+
+    if legacy:
+        # Its rows may belong to any month, so merge them in by key
+        rows.extend(_read_segment(conn, 'table', LEGACY_TABLE, limit, key, newer, user_id))
+        rows.sort(key=lambda row: (row[4], row[0]), reverse=not newer)
+        rows = rows[:limit]
+    return [_entry(row) for row in rows]
+
+
+def recent(conn, limit=100, user_id=None, archive_dir=None):
+    """The newest `limit` entries (for the desktop history dialogs)"""
+    return fetch(conn, limit, user_id=user_id, archive_dir=archive_dir)
+
+
+def _key(entry):
+    return [entry.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'), entry.id]
+
+
+def paginate(conn, per_page=50, cursor=None, page=1, user_id=None, archive_dir=None):
+    """
+    A KeysetPage of entries, newest first, with the same cursor tokens as
+    pagination.keyset_paginate(); `page` without a cursor serves old
+    page-number links.
+    """
+    data = decode_cursor(cursor)
+    key = None
+    if data and len(data['k']) == 2:
+        key = data['k']
+        page = data.get('p') if isinstance(data.get('p'), int) else None
+        backwards = data.get('d') == 'p'
+    else:
+        page = max(1, page or 1)
+        backwards = False
+
+    if key is not None:
+        items = fetch(conn, per_page + 1, key, backwards, user_id, archive_dir)
+        has_more = len(items) > per_page
+        items = items[:per_page]
+    else:
+        skip = (page - 1) * per_page
+        items = fetch(conn, skip + per_page + 1, user_id=user_id, archive_dir=archive_dir)[skip:]
+        has_more = len(items) > per_page
+        items = items[:per_page]
+
+    if backwards:
+        items.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = key is not None or page > 1, has_more
+
+    prev_cursor = next_cursor = None
+    if items:
+        if has_prev:
+            prev_cursor = encode_cursor({'k': _key(items[0]), 'd': 'p', 'p': page - 1 if page else None})
+        if has_next:
+            next_cursor = encode_cursor({'k': _key(items[-1]), 'd': 'n', 'p': page + 1 if page else None})
+    return KeysetPage(items, page, per_page, has_prev, has_next, prev_cursor, next_cursor)
+
+
+def migrate_legacy(conn):
+    """Move rows of the legacy edit_history table into monthly partitions; returns the count"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (LEGACY_TABLE,))
+    if cursor.fetchone() is None:
+        return 0
+    cursor.execute(f"SELECT DISTINCT substr(timestamp, 1, 7) FROM {LEGACY_TABLE}")
+    months = [row[0].replace('-', '_') for row in cursor.fetchall() if row[0]]
+
+    cursor.execute("BEGIN")
+    moved = 0
+    for month in months:
+        table = ensure_partition(conn, month)
+        # Legacy ids are far below every month's id block, so they stay unique
+        cursor.execute(f"""
+            INSERT INTO {table} (id, user_id, person_id, action, details, timestamp)
+            SELECT id, user_id, person_id, action, details, timestamp FROM {LEGACY_TABLE}
+            WHERE substr(timestamp, 1, 7) = ?
+        """, (month.replace('_', '-'),))
+        moved += cursor.rowcount
+    cursor.execute(f"SELECT COUNT(*) FROM {LEGACY_TABLE}")
+    total = cursor.fetchone()[0]
+    if moved != total:
+        cursor.execute("ROLLBACK")
+        raise RuntimeError(f"Moved {moved:,} of {total:,} rows; nothing was changed")
+    cursor.execute(f"DROP TABLE {LEGACY_TABLE}")
+    cursor.execute("COMMIT")
+    return moved
+
+
+def archive_month(conn, month, archive_dir):
+    """
+    Copy one partition into a compressed, read-only archive file and drop
+    it from the database; returns (rows, archive path). Rows written to
+    the month after an earlier archive are merged into that archive.
+    The new archive only replaces the old one, and the partition is only
+    dropped, once it is complete. The month keeps its id sequence, so a
+    partition recreated by a late write can't reuse archived ids.
+    """
+    table = partition_table(month)
+    os.makedirs(archive_dir, exist_ok=True)
+    target = os.path.join(archive_dir, f"{table}{ARCHIVE_SUFFIX}")
+    plain = target[:-len('.gz')]
+    if os.path.exists(plain):
+        os.remove(plain)
+    if os.path.exists(target):
+        with gzip.open(target, 'rb') as source, open(plain, 'wb') as copy:
+            shutil.copyfileobj(source, copy)
+
+    cursor = conn.cursor()
+    cursor.execute("ATTACH DATABASE ? AS archive", (plain,))
+    try:
+        cursor.execute(CREATE_ARCHIVE_SQL)
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO archive.edit_history (id, user_id, username, person_id, action, details, timestamp)
+            SELECT h.id, h.user_id, u.username, h.person_id, h.action, h.details, h.timestamp
+            FROM main.{table} h LEFT JOIN main.users u ON u.id = h.user_id
+            ORDER BY h.timestamp, h.id
+        """)
+        copied = cursor.rowcount
+        for index_sql in ARCHIVE_INDEX_SQL:
+            cursor.execute(index_sql)
+        conn.commit()
+    finally:
+        cursor.execute("DETACH DATABASE archive")
+
+    with open(plain, 'rb') as source, gzip.open(target + '.part', 'wb') as compressed:
+        shutil.copyfileobj(source, compressed)
+    os.remove(plain)
+
+    # Writers wait from the row count to the drop, so no row slips in between
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        if cursor.fetchone()[0] != copied:
+            raise RuntimeError(f"{table} changed while it was archived; kept it in the database")
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+        sequence = cursor.fetchone()
+        if os.path.exists(target):
+            os.chmod(target, 0o644)
+        os.replace(target + '.part', target)
+        os.chmod(target, 0o444)
+        cursor.execute(f"DROP TABLE {table}")
+        # DROP TABLE deletes the sequence row too; put it back
+        if sequence is not None:
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, sequence[0]))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        if os.path.exists(target + '.part'):
+            os.remove(target + '.part')
+        raise
+    return copied, target
+
+
+def archive_before(conn, cutoff_month, archive_dir=None):
+    """Archive every partition older than 'YYYY_MM'; returns [(month, rows, path)]"""
+    if archive_dir is None:
+        archive_dir = default_archive_dir(conn)
+    done = []
+    for month, kind, _ in reversed(segments(conn, archive_dir)):
+        if kind == 'table' and month is not None and month < cutoff_month:
+            rows, path = archive_month(conn, month, archive_dir)
+            done.append((month, rows, path))
+    return done
+
+
+def cutoff_for(keep_months, today=None):
+    """'YYYY_MM' of the oldest month kept when the last `keep_months` stay live"""
+    today = today or datetime.utcnow()
+    index = today.year * 12 + today.month - 1 - (keep_months - 1)
+    return f"{index // 12:04d}_{index % 12 + 1:02d}"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Monthly audit log partitions and their archives")
+    parser.add_argument('--db', default='instance/people.db', help="SQLite database path")
+    parser.add_argument('--archive-dir', default=None, help=f"Archive directory (default: {ARCHIVE_DIR_NAME}/ next to the database)")
+    parser.add_argument('--migrate', action='store_true', help="Move the legacy edit_history table into partitions")
+    parser.add_argument('--keep-months', type=int, default=None,
+                        help="Archive partitions older than the last N months (including this one)")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM after archiving to shrink the database file")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    archive_dir = args.archive_dir or default_archive_dir(conn)
+
+    if args.migrate:
+        moved = migrate_legacy(conn)
+        print(f"✅ Moved {moved:,} legacy history rows into monthly partitions")
+
+    if args.keep_months is not None:
+        if args.keep_months < 1:
+            parser.error("--keep-months must be at least 1")
+        cutoff = cutoff_for(args.keep_months)
+        archived = archive_before(conn, cutoff, archive_dir)
+        for month, rows, path in archived:
+            print(f"📦 {month}: {rows:,} rows -> {path} ({os.path.getsize(path) / 1024:,.0f} KB)")
+        print(f"✅ Archived {len(archived)} month(s) older than {cutoff.replace('_', '-')}")
+        if archived and args.vacuum:
+            print("🧹 Vacuuming database...")
+            conn.execute("VACUUM")
+
+    print("\nHistory segments (newest first):")
+    for month, kind, source in segments(conn, archive_dir):
+        if kind == 'table':
+            count = conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+            print(f"  {month or 'legacy':<8} table    {source:<26} {count:>10,} rows")
+        else:
+            print(f"  {month:<8} archive  {os.path.basename(source):<26} {os.path.getsize(source) / 1024:>8,.0f} KB")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,83 +1,195 @@
 """
 Import real Cambodia location names from camboia.xlsx
+The workbook is streamed once with openpyxl in read-only mode, one row at
+a time, and a single pass writes both cambodia_locations_real.json and
+the normalized locations table (see locations.py).
+
+Runs are incremental: each sheet's content hash and village rows are kept
+in the binary cache next to the JSON (locations.write_cache), and only
+sheets whose hash changed are parsed again. When none did, the JSON and
+the cache are left as they are
 """
-import pandas as pd
+import argparse
+import hashlib
 import json
+import os
+import posixpath
+import sqlite3
+import time
+import zipfile
+from xml.etree import ElementTree
 
-def read_cambodia_excel():
-    """Read Cambodia locations from Excel file with all 25 provinces"""
-    try:
-        # Read the Excel file
-        print("Reading camboia.xlsx...")
-        xl = pd.ExcelFile('camboia.xlsx')
-        
-        print(f"\nFound {len(xl.sheet_names)} provinces:")
-        for sheet in xl.sheet_names:
-            print(f"  - {sheet}")
-        
-        # Create location structure
-        locations = {}
+from openpyxl import load_workbook
+
+DISTRICT_TYPES = ('ស្រុក', 'ក្រុង')  # District (Khan or Srok)
+COMMUNE_TYPES = ('ឃុំ', 'សង្កាត់')  # Commune (Khum or Sangkat)
+VILLAGE_TYPE = 'ភូមិ'  # Village (Phum)
+
+# Rows above the data on every sheet: title, blank line, column headers
+FIRST_DATA_ROW = 4
+
+def province_name(sheet_name):
+    """Province name from a sheet name (remove number prefix)"""
+    return sheet_name.split('. ', 1)[1] if '. ' in sheet_name else sheet_name
+
+def _cell(value):
+    return str(value).strip() if value is not None else ''
+
+# Namespaces of the workbook parts sheet_hashes() reads
+_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+def sheet_hashes(path='camboia.xlsx'):
+    """
+    {sheet title: sha256} in workbook order, hashed from each worksheet's
+    XML inside the .xlsx package without parsing any cells. Cell text may
+    live in the shared strings part, so it is part of every sheet's hash.
+    """
+    with zipfile.ZipFile(path) as package:
+        workbook = ElementTree.fromstring(package.read('xl/workbook.xml'))
+        rels = ElementTree.fromstring(package.read('xl/_rels/workbook.xml.rels'))
+        targets = {rel.get('Id'): rel.get('Target') for rel in rels.iter(f'{_PKG_REL_NS}Relationship')}
+        names = set(package.namelist())
+        shared = hashlib.sha256(package.read('xl/sharedStrings.xml')).digest() \
+            if 'xl/sharedStrings.xml' in names else b''
         
-        # Process each sheet (province)
-        for sheet_name in xl.sheet_names:
-            print(f"\nProcessing: {sheet_name}")
-            df = pd.read_excel('camboia.xlsx', sheet_name=sheet_name)
-            
-            # Extract province name from sheet name (remove number prefix)
-            province_name = sheet_name.split('. ', 1)[1] if '. ' in sheet_name else sheet_name
-            
-            current_province = province_name
+        hashes = {}
+        for sheet in workbook.iter(f'{_MAIN_NS}sheet'):
+            title = sheet.get('name')
+            target = targets[sheet.get(f'{_REL_NS}id')]
+            member = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+            digest = hashlib.sha256(title.encode('utf-8'))
+            digest.update(shared)
+            digest.update(package.read(member))
+            hashes[title] = digest.hexdigest()
+        return hashes
+
+def iter_villages(path='camboia.xlsx', on_sheet=None, sheets=None):
+    """
+    Yield (code, province, district, commune, village) for every village
+    row, where code is the official gazetteer village code (column 1).
+    `sheets` limits the pass to those sheet titles.
+    `on_sheet(title, province, villages, seconds)` is called after each sheet.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            if sheets is not None and sheet.title not in sheets:
+                continue
+            start = time.perf_counter()
+            province = province_name(sheet.title)
             current_district = None
             current_commune = None
+            villages = 0
             
-            if current_province not in locations:
-                locations[current_province] = {}
-            
-            # Process each row
-            for idx, row in df.iterrows():
-                # Skip header rows
-                if idx < 2:
-                    continue
-                
-                # Get type, code, and names
-                row_type = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else ''
-                code = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else ''
-                name_khmer = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else ''
-                name_latin = str(row.iloc[3]).strip() if pd.notna(row.iloc[3]) else ''
+            # Only the type, code and two name columns are read
+            for row in sheet.iter_rows(min_row=FIRST_DATA_ROW, max_col=4, values_only=True):
+                row_type, code, name_khmer, name_latin = (tuple(row) + (None,) * 4)[:4]
+                row_type = _cell(row_type)
                 
                 # Use Latin name
-                name = name_latin if name_latin and name_latin != 'nan' else name_khmer
-                
-                if not name or name == 'nan':
+                name = _cell(name_latin) or _cell(name_khmer)
+                if not name:
                     continue
                 
-                # Determine location type
-                if row_type == 'ស្រុក' or row_type == 'ក្រុង':  # District (Khan or Srok)
+                if row_type in DISTRICT_TYPES:
                     current_district = name
                     current_commune = None
-                    if current_district not in locations[current_province]:
-                        locations[current_province][current_district] = {}
-                    
-                elif row_type == 'ឃុំ' or row_type == 'សង្កាត់':  # Commune (Khum or Sangkat)
+                elif row_type in COMMUNE_TYPES:
                     if current_district:
                         current_commune = name
-                        if current_commune not in locations[current_province][current_district]:
-                            locations[current_province][current_district][current_commune] = []
-                    
-                elif row_type == 'ភូមិ':  # Village (Phum)
-                    if current_district and current_commune:
-                        if name not in locations[current_province][current_district][current_commune]:
-                            locations[current_province][current_district][current_commune].append(name)
+                elif row_type == VILLAGE_TYPE:
+                    code = _cell(code)
+                    if current_district and current_commune and code.isdigit():
+                        villages += 1
+                        yield int(code), province, current_district, current_commune, name
             
-            # Print stats for this province
-            districts = len(locations[current_province])
-            communes = sum(len(d) for d in locations[current_province].values())
-            villages = sum(len(v) for d in locations[current_province].values() for v in d.values())
-            print(f"  ✓ {districts} districts, {communes} communes, {villages} villages")
+            if on_sheet:
+                on_sheet(sheet.title, province, villages, time.perf_counter() - start)
+    finally:
+        workbook.close()
+
+def read_cambodia_excel(path='camboia.xlsx', json_path='cambodia_locations_real.json', db_path=None,
+                        force=False):
+    """
+    Read Cambodia locations from the Excel file with all 25 provinces, write
+    the nested JSON and, when `db_path` is given, fill its locations table.
+    Sheets unchanged since the last run are taken from the cache unless
+    `force` is set.
+    """
+    try:
+        import locations as location_table
+        
+        print(f"Reading {path}...")
+        start = time.perf_counter()
+        hashes = sheet_hashes(path)
+        cached = None if force else location_table.read_cache(json_path, extra=True)
+        previous = cached['extra'].get('sheets', {}) if cached else {}
+        changed = [title for title, digest in hashes.items()
+                   if title not in previous or previous[title][0] != digest]
+        print(f"  {len(hashes) - len(changed)} of {len(hashes)} sheets unchanged "
+              f"(hashed in {time.perf_counter() - start:.2f}s)")
+        
+        # Village rows per sheet: cached ones, then the re-read sheets
+        sheet_rows = {title: [tuple(row) for row in previous[title][1]]
+                      for title in hashes if title not in changed}
+        parsed = []
+        
+        def report(title, province, villages, seconds):
+            sheet_rows[title] = parsed[:]
+            del parsed[:]
+            print(f"  ✓ {province}: {villages} village rows in {seconds:.2f}s")
+        
+        if changed:
+            for row in iter_villages(path, on_sheet=report, sheets=set(changed)):
+                parsed.append(row)
+        read_time = time.perf_counter() - start
+        
+        if not changed and cached is not None:
+            locations = cached['locations']
+            rows = [row for title in hashes for row in sheet_rows[title]]
+            print(f"✅ No sheet changed; {json_path} is up to date")
+        else:
+            # Create location structure; `seen` replaces a scan of each village list
+            locations = {}
+            seen = set()
+            rows = []
+            for title in hashes:
+                # Every sheet gets a province entry, even one without villages
+                locations.setdefault(province_name(title), {})
+                for row in sheet_rows[title]:
+                    code, province, district, commune, village = row
+                    rows.append(row)
+                    villages = locations.setdefault(province, {}).setdefault(district, {}).setdefault(commune, [])
+                    if (province, district, commune, village) not in seen:
+                        seen.add((province, district, commune, village))
+                        villages.append(village)
+        
+        # Print stats for each province
+        print()
+        for province, province_districts in locations.items():
+            districts = len(province_districts)
+            communes = sum(len(d) for d in province_districts.values())
+            villages = sum(len(v) for d in province_districts.values() for v in d.values())
+            print(f"  {province}: {districts} districts, {communes} communes, {villages} villages")
         
-        # Save to JSON
-        with open('cambodia_locations_real.json', 'w', encoding='utf-8') as f:
-            json.dump(locations, f, ensure_ascii=False, indent=2)
+        # Save to JSON, and the binary cache that loaders read instead
+        if changed or cached is None:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(locations, f, ensure_ascii=False, indent=2)
+            location_table.write_cache(locations, json_path, extra={
+                'sheets': {title: [hashes[title], sheet_rows[title]] for title in hashes}
+            })
+        
+        # Same rows, same pass: the normalized locations table
+        added = None
+        if db_path:
+            conn = sqlite3.connect(db_path)
+            try:
+                added = location_table.sync_locations(conn, rows)
+            finally:
+                conn.close()
         
         print(f"\n{'='*60}")
         print(f"✅ Successfully extracted all Cambodia locations!")
@@ -86,12 +198,15 @@ def read_cambodia_excel():
         
         total_districts = sum(len(districts) for districts in locations.values())
         total_communes = sum(len(communes) for districts in locations.values() for communes in districts.values())
-        total_villages = sum(len(villages) for districts in locations.values() 
+        total_villages = sum(len(villages) for districts in locations.values()
                            for communes in districts.values() for villages in communes.values())
         
         print(f"Total Districts: {total_districts}")
         print(f"Total Communes: {total_communes}")
         print(f"Total Villages: {total_villages}")
+        print(f"Read in {read_time:.1f}s, {time.perf_counter() - start:.1f}s in total")
+        if added is not None:
+            print(f"Locations table in {db_path}: {added:,} villages added")
         
         print("\nSample data:")
         for i, province in enumerate(list(locations.keys())[:3]):
@@ -105,17 +220,36 @@ def read_cambodia_excel():
                     print(f"      └─ {commune}: {', '.join(villages)}...")
         
         return locations
-        
+    
     except Exception as e:
         print(f"❌ Error reading Excel file: {e}")
         import traceback
         traceback.print_exc()
         return None
 
-if __name__ == '__main__':
-    locations = read_cambodia_excel()
+def main():
+    parser = argparse.ArgumentParser(description="Import Cambodia locations from the gazetteer workbook")
+    parser.add_argument('--xlsx', default='camboia.xlsx', help="Gazetteer workbook")
+    parser.add_argument('--json', default='cambodia_locations_real.json', help="Nested JSON output")
+    parser.add_argument('--db', default='instance/people.db',
+                        help="SQLite database whose locations table is filled (skipped if missing)")
+    parser.add_argument('--no-db', action='store_true', help="Only write the JSON")
+    parser.add_argument('--force', action='store_true', help="Re-read every sheet, even unchanged ones")
+    args = parser.parse_args()
+    
+    db_path = None
+    if not args.no_db:
+        if os.path.exists(args.db):
+            db_path = args.db
+        else:
+            print(f"⚠️  {args.db} not found; writing the JSON only")
+    
+    locations = read_cambodia_excel(args.xlsx, args.json, db_path, force=args.force)
     
     if locations:
         print("\n" + "="*60)
-        print("📁 Location data saved to: cambodia_locations_real.json")
+        print(f"📁 Location data saved to: {args.json}")
         print("="*60)
+
+if __name__ == '__main__':
+    main()
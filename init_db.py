@@ -1,7 +1,10 @@
 from app import app
 from models import db, User
 from werkzeug.security import generate_password_hash
-from data_generator import generate_people
+from data_generator import generate_people_fast
+import search_index
+import stats
+import locations
 
 def init_database():
     """Initialize database with tables, super admin, and province managers"""
@@ -9,6 +12,15 @@ def init_database():
         print("Creating database tables...")
         db.create_all()
         
+        # Villages (with their official codes) that people.village_id points at
+        connection = db.engine.raw_connection()
+        try:
+            added = locations.sync_locations(connection)
+        finally:
+            connection.close()
+        if added:
+            print(f"Added {added:,} villages to the locations table")
+        
         # Create super admin user if not exists
         if not User.query.filter_by(username='admin').first():
             super_admin = User(
@@ -57,9 +69,21 @@ def init_database():
         if count == 0:
             print("\nNo people data found. Generating...")
             # Change this number: 100000 for testing, 10000000 for full database
-            generate_people(100000)
+            generate_people_fast(100000)
         else:
             print(f"\nDatabase already has {count:,} people")
+        
+        # Build the FTS5 name search index and the people_stats
+        # aggregates after the bulk load
+        print("\nBuilding name search index and statistics...")
+        connection = db.engine.raw_connection()
+        try:
+            search_index.create_search_index(connection)
+            if not stats.has_stats(connection):
+                stats.build_stats(connection)
+        finally:
+            connection.close()
+        print("Name search index and statistics ready")
 
 if __name__ == '__main__':
     init_database()
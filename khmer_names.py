@@ -75,6 +75,10 @@ KHMER_FEMALE_NAMES_EXTENDED = [
     "Leakhena", "Leakhenavann", "Leakhenavuth", "Leakhenavy", "Leakhenary",
 ]
 
+# Full first-name pools, built once instead of on every call
+MALE_FIRST_NAMES = KHMER_MALE_FIRST_NAMES + KHMER_MALE_NAMES_EXTENDED
+FEMALE_FIRST_NAMES = KHMER_FEMALE_FIRST_NAMES + KHMER_FEMALE_NAMES_EXTENDED
+
 def get_random_khmer_name(gender='male'):
     """
     Generate a random authentic Khmer name
@@ -88,11 +92,9 @@ def get_random_khmer_name(gender='male'):
     import random
     
     if gender.lower() == 'male':
-        first_names = KHMER_MALE_FIRST_NAMES + KHMER_MALE_NAMES_EXTENDED
-        first_name = random.choice(first_names)
+        first_name = random.choice(MALE_FIRST_NAMES)
     else:
-        first_names = KHMER_FEMALE_FIRST_NAMES + KHMER_FEMALE_NAMES_EXTENDED
-        first_name = random.choice(first_names)
+        first_name = random.choice(FEMALE_FIRST_NAMES)
     
     surname = random.choice(KHMER_SURNAMES)
     
@@ -111,11 +113,9 @@ def get_khmer_name_parts(gender='male'):
     import random
     
     if gender.lower() == 'male':
-        first_names = KHMER_MALE_FIRST_NAMES + KHMER_MALE_NAMES_EXTENDED
-        first_name = random.choice(first_names)
+        first_name = random.choice(MALE_FIRST_NAMES)
     else:
-        first_names = KHMER_FEMALE_FIRST_NAMES + KHMER_FEMALE_NAMES_EXTENDED
-        first_name = random.choice(first_names)
+        first_name = random.choice(FEMALE_FIRST_NAMES)
     
     surname = random.choice(KHMER_SURNAMES)
     
@@ -0,0 +1,451 @@
+"""
+In-memory location hierarchy
+A process-wide, immutable province -> district -> commune -> village tree
+that answers the cascading dropdown APIs without touching the people
+table. It is loaded once (from cambodia_locations_real.json, or from a
+DISTINCT pass over the database when the file is missing) and swapped
+for a new tree when people appear in a village it doesn't know yet.
+
+It also keeps the serialized gazetteer for /api/locations, precompressed
+with gzip (and brotli, if the optional brotli package is installed), and
+maintains the locations dimension table that people.village_id points at.
+import_cambodia_locations.py writes a binary cache next to the JSON (the
+parsed tree plus the compressed /api/locations body), which is used
+instead of the JSON while the JSON is unchanged
+"""
+import gzip
+import hashlib
+import json
+import marshal
+import os
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # optional: only used to precompress /api/locations
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # optional: the binary cache falls back to marshal
+    msgpack = None
+
+LOCATIONS_FILE = 'cambodia_locations_real.json'
+GAZETTEER_FILE = 'camboia.xlsx'
+
+# Binary cache next to LOCATIONS_FILE: magic, format (m = msgpack,
+# r = marshal), length of the head section, head, tail
+CACHE_SUFFIX = '.cache'
+CACHE_MAGIC = b'GAZC1'
+
+LOCATIONS_TABLE = 'locations'
+PEOPLE_VIEW = 'people_view'
+
+# Villages without an official code (JSON fallback, or names only found in
+# people) get ids from here up, clear of the 8-digit gazetteer codes
+UNOFFICIAL_ID_BASE = 100000000
+
+# How often (seconds) to look for villages added by other processes
+REFRESH_INTERVAL = 5.0
+
+
+class LocationTree:
+    """Immutable province -> district -> commune -> village index"""
+
+    def __init__(self, nested):
+        # Sorted tuples at every level, matching the old ORDER BY output
+        self._provinces = tuple(sorted(nested))
+        self._districts = {}
+        self._communes = {}
+        self._villages = {}
+        for province, districts in nested.items():
+            self._districts[province] = tuple(sorted(districts))
+            for district, communes in districts.items():
+                self._communes[(province, district)] = tuple(sorted(communes))
+                for commune, villages in communes.items():
+                    self._villages[(province, district, commune)] = tuple(sorted(set(villages)))
+        self._payloads = {}
+        self._payload_lock = threading.Lock()
+
+    def provinces(self):
+        return self._provinces
+
+    def districts(self, province):
+        return self._districts.get(province, ())
+
+    def communes(self, province, district):
+        return self._communes.get((province, district), ())
+
+    def villages(self, province, district, commune):
+        return self._villages.get((province, district, commune), ())
+
+    def contains(self, province, district, commune, village):
+        return village in self._villages.get((province, district, commune), ())
+
+    def to_dict(self):
+        """Nested {province: {district: {commune: [villages]}}} form"""
+        return {
+            province: {
+                district: {
+                    commune: list(self.villages(province, district, commune))
+                    for commune in self.communes(province, district)
+                }
+                for district in self.districts(province)
+            }
+            for province in self._provinces
+        }
+
+    def with_villages(self, rows):
+        """Return a new tree that also contains the given (p, d, c, v) rows"""
+        nested = self.to_dict()
+        for province, district, commune, village in rows:
+            nested.setdefault(province, {}).setdefault(district, {}).setdefault(commune, []).append(village)
+        return LocationTree(nested)
+
+    def payload(self, *path):
+        """
+        Serialized JSON list for a level of the tree plus its strong ETag,
+        computed once per path for the lifetime of this tree.
+        """
+        payload = self._payloads.get(path)
+        if payload is None:
+            if len(path) == 0:
+                items = self.provinces()
+            elif len(path) == 1:
+                items = self.districts(*path)
+            elif len(path) == 2:
+                items = self.communes(*path)
+            else:
+                items = self.villages(*path)
+            body = json.dumps(list(items), ensure_ascii=False).encode('utf-8')
+            payload = (body, hashlib.md5(body).hexdigest())
+            with self._payload_lock:
+                self._payloads[path] = payload
+        return payload
+
+
+class CompressedPayload:
+    """A JSON body with its strong ETag and precompressed variants"""
+
+    def __init__(self, data=None, body=None, encodings=None):
+        if body is None:
+            body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.body = body
+        self.etag = hashlib.md5(self.body).hexdigest()
+        self.encodings = dict(encodings or {})
+        if 'gzip' not in self.encodings:
+            self.encodings['gzip'] = gzip.compress(self.body, compresslevel=9, mtime=0)
+        if brotli is not None and 'br' not in self.encodings:
+            self.encodings['br'] = brotli.compress(self.body)
+
+
+class GazetteerCache:
+    """
+    cambodia_locations_real.json serialized once and rebuilt only when the
+    file's mtime changes. Province subtrees are compressed on first request.
+    """
+
+    def __init__(self, path=LOCATIONS_FILE):
+        self.path = path
+        self._mtime = None
+        self._data = None
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def get(self, province=None):
+        """Payload for the whole country or one province, or None if missing"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        key = province or ''
+        with self._lock:
+            if mtime != self._mtime:
+                cached = read_cache(self.path)
+                if cached is not None:
+                    # Country payload already serialized and compressed
+                    self._data = cached['locations']
+                    self._payloads = {'': CompressedPayload(**cached['payload'])}
+                else:
+                    data = load_from_file(self.path)
+                    if data is None:
+                        # Removed since the stat: keep serving what was loaded
+                        # before, and look at the file again next time
+                        if self._data is None:
+                            return None
+                        mtime = self._mtime
+                    else:
+                        self._data = data
+                        self._payloads = {}
+                self._mtime = mtime
+            payload = self._payloads.get(key)
+            if payload is None:
+                data = self._data if province is None else self._data.get(province)
+                if data is None:
+                    return None
+                payload = CompressedPayload(data)
+                self._payloads[key] = payload
+        return payload
+
+
+gazetteer = GazetteerCache()
+
+
+def cache_path(path=LOCATIONS_FILE):
+    return os.path.splitext(path)[0] + CACHE_SUFFIX
+
+
+def _pack(value):
+    if msgpack is not None:
+        return b'm', msgpack.packb(value, use_bin_type=True)
+    return b'r', marshal.dumps(value)
+
+
+def _unpack(kind, blob):
+    if kind == b'm':
+        if msgpack is None:
+            raise ValueError("cache written with msgpack, which is not installed")
+        return msgpack.unpackb(blob, raw=False)
+    return marshal.loads(blob)
+
+
+def write_cache(locations, path=LOCATIONS_FILE, extra=None):
+    """
+    Write the binary cache for the JSON at `path` (just written from
+    `locations`). `extra` goes in a second section that read_cache()
+    only decodes on request (the importer keeps its sheet hashes there).
+    """
+    stat = os.stat(path)
+    payload = CompressedPayload(locations)
+    kind, head = _pack({
+        'json': [stat.st_size, stat.st_mtime_ns],
+        'locations': locations,
+        'payload': {'body': payload.body, 'encodings': {'gzip': payload.encodings['gzip']}},
+    })
+    _, tail = _pack(extra or {})
+    target = cache_path(path)
+    with open(target + '.tmp', 'wb') as f:
+        f.write(CACHE_MAGIC + kind + len(head).to_bytes(4, 'little') + head + tail)
+    os.replace(target + '.tmp', target)
+
+
+def read_cache(path=LOCATIONS_FILE, extra=False):
+    """
+    The cache for the JSON at `path` as a dict (locations, payload, and
+    with `extra` the second section), or None if it is missing,
+    unreadable or older than the JSON.
+    """
+    try:
+        stat = os.stat(path)
+        with open(cache_path(path), 'rb') as f:
+            data = f.read()
+        if not data.startswith(CACHE_MAGIC):
+            return None
+        start = len(CACHE_MAGIC)
+        kind = data[start:start + 1]
+        size = int.from_bytes(data[start + 1:start + 5], 'little')
+        head = _unpack(kind, data[start + 5:start + 5 + size])
+        if list(head['json']) != [stat.st_size, stat.st_mtime_ns]:
+            return None
+        if extra:
+            head['extra'] = _unpack(kind, data[start + 5 + size:])
+        return head
+    except (OSError, ValueError, EOFError, TypeError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"⚠️  Ignoring location cache {cache_path(path)}: {e}")
+        return None
+
+
+def load_from_file(path=LOCATIONS_FILE):
+    """Load the nested gazetteer dict (from the binary cache when current), or None if the file is missing"""
+    cached = read_cache(path)
+    if cached is not None:
+        return cached['locations']
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_from_database(conn):
+    """Build the nested dict with one pass over locations (or people_stats)"""
+    cursor = conn.cursor()
+    table = LOCATIONS_TABLE if has_locations(conn) else 'people_stats'
+    cursor.execute(f"SELECT DISTINCT province, district, commune, village FROM {table}")
+    nested = {}
+    for province, district, commune, village in cursor.fetchall():
+        nested.setdefault(province, {}).setdefault(district, {}).setdefault(commune, []).append(village)
+    return nested
+
+
+CREATE_LOCATIONS_SQL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {LOCATIONS_TABLE} (
+        id INTEGER NOT NULL PRIMARY KEY,
+        province VARCHAR(100) NOT NULL,
+        district VARCHAR(100) NOT NULL,
+        commune VARCHAR(100) NOT NULL,
+        village VARCHAR(100) NOT NULL
+    )
+    """,
+    f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_locations_path
+    ON {LOCATIONS_TABLE} (province, district, commune, village)
+    """,
+]
+
+# people with its location names resolved, for raw-SQL readers (GUIs, scripts)
+CREATE_PEOPLE_VIEW_SQL = f"""
+    CREATE VIEW IF NOT EXISTS {PEOPLE_VIEW} AS
+    SELECT p.id, p.name, p.first_name, p.last_name, p.gender, p.age,
+           l.province, l.district, l.commune, l.village, p.village_id, p.created_at
+    FROM people p JOIN {LOCATIONS_TABLE} l ON l.id = p.village_id
+"""
+
+
+def has_locations(conn):
+    """True when the locations table exists and has rows"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (LOCATIONS_TABLE,))
+    if cursor.fetchone() is None:
+        return False
+    cursor.execute(f"SELECT 1 FROM {LOCATIONS_TABLE} LIMIT 1")
+    return cursor.fetchone() is not None
+
+
+def gazetteer_rows(path=GAZETTEER_FILE):
+    """
+    (id, province, district, commune, village) for every known village.
+    Ids are the official village codes from camboia.xlsx; if it can't be
+    read, villages from cambodia_locations_real.json get unofficial ids.
+    """
+    try:
+        from import_cambodia_locations import iter_villages
+        return list(iter_villages(path))
+    except (ImportError, OSError) as e:
+        print(f"⚠️  Could not read village codes from {path} ({e}); using {LOCATIONS_FILE}")
+    nested = load_from_file() or {}
+    rows = []
+    for province, districts in nested.items():
+        for district, communes in districts.items():
+            for commune, villages in communes.items():
+                for village in villages:
+                    rows.append((UNOFFICIAL_ID_BASE + len(rows), province, district, commune, village))
+    return rows
+
+
+def sync_locations(conn, rows=None):
+    """
+    Create the locations table and view and add any villages it lacks.
+    Existing ids are never changed, since people rows point at them.
+    Returns the number of villages added.
+    """
+    cursor = conn.cursor()
+    for statement in CREATE_LOCATIONS_SQL:
+        cursor.execute(statement)
+    cursor.execute(CREATE_PEOPLE_VIEW_SQL)
+    if rows is None:
+        rows = gazetteer_rows()
+    before = conn.total_changes
+    # A name path listed twice under different codes keeps its first code
+    cursor.executemany(
+        f"INSERT OR IGNORE INTO {LOCATIONS_TABLE} (id, province, district, commune, village) "
+        f"VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    added = conn.total_changes - before
+    conn.commit()
+    return added
+
+
+def add_unofficial_villages(conn, paths):
+    """Give (p, d, c, v) paths missing from locations an unofficial id"""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MAX(id) FROM {LOCATIONS_TABLE} WHERE id >= ?", (UNOFFICIAL_ID_BASE,))
+    next_id = (cursor.fetchone()[0] or UNOFFICIAL_ID_BASE - 1) + 1
+    rows = []
+    for path in paths:
+        cursor.execute(
+            f"SELECT 1 FROM {LOCATIONS_TABLE} "
+            f"WHERE province = ? AND district = ? AND commune = ? AND village = ?",
+            tuple(path)
+        )
+        if cursor.fetchone() is None:
+            rows.append((next_id + len(rows),) + tuple(path))
+    return sync_locations(conn, rows) if rows else 0
+
+
+_tree = None
+_lock = threading.Lock()
+_watermark = None
+_checked_at = 0.0
+
+
+def _stats_watermark(conn):
+    """Highest people_stats id; a new group row may mean a new village"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'people_stats_ai'")
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute("SELECT MAX(id) FROM people_stats")
+    return cursor.fetchone()[0] or 0
+
+
+def _refresh(conn):
+    """Merge villages from people_stats rows added since the last check"""
+    global _tree, _watermark
+    watermark = _stats_watermark(conn)
+    if watermark is None or watermark == _watermark:
+        return
+    # If people_stats appeared or was rebuilt since the last check, look at all of it
+    since = _watermark if _watermark is not None and watermark > _watermark else 0
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT DISTINCT province, district, commune, village FROM people_stats WHERE id > ?",
+        (since,)
+    )
+    missing = [row for row in cursor.fetchall() if not _tree.contains(*row)]
+    if missing:
+        _tree = _tree.with_villages(missing)
+    _watermark = watermark
+
+
+def get_tree(connect=None):
+    """
+    Return the process-wide tree, loading it on first use.
+
+    `connect` is a callable returning a DB-API connection; it is only
+    called when the tree must be loaded from the database or when it is
+    time to look for newly populated villages.
+    """
+    global _tree, _watermark, _checked_at
+    tree = _tree
+    if tree is None:
+        with _lock:
+            if _tree is None:
+                conn = connect() if connect is not None else None
+                if conn is not None:
+                    _watermark = _stats_watermark(conn)
+                nested = load_from_file()
+                if nested is None and conn is not None:
+                    nested = load_from_database(conn)
+                _tree = LocationTree(nested or {})
+                _checked_at = time.monotonic()
+            tree = _tree
+    if connect is not None and time.monotonic() - _checked_at > REFRESH_INTERVAL:
+        with _lock:
+            if time.monotonic() - _checked_at > REFRESH_INTERVAL:
+                _refresh(connect())
+                _checked_at = time.monotonic()
+                tree = _tree
+    return tree
+
+
+def invalidate():
+    """Drop the tree so the next call reloads it"""
+    global _tree, _watermark
+    with _lock:
+        _tree = None
+        _watermark = None
@@ -3,10 +3,22 @@ Migration script to add first_name and last_name columns
 and populate them with authentic Khmer names for all 10 million records
 """
 import sqlite3
-import random
+import sys
 from khmer_names import get_khmer_name_parts
+from batch_migration import BatchMigration
 
-def migrate_database():
+def set_first_last_names(cursor, rows):
+    """Give each (id, gender) row a Khmer first name, last name and full name"""
+    updates = []
+    for person_id, gender in rows:
+        first_name, last_name = get_khmer_name_parts(gender)
+        updates.append((first_name, last_name, f"{first_name} {last_name}", person_id))
+    cursor.executemany(
+        "UPDATE people SET first_name = ?, last_name = ?, name = ? WHERE id = ?",
+        updates
+    )
+
+def migrate_database(restart=False):
     """Add first_name and last_name columns and populate with Khmer names"""
     
     db_path = 'instance/people.db'
@@ -46,40 +58,13 @@ def migrate_database():
     
     # Step 3: Update records in batches with authentic Khmer names
     print("\n🔄 Step 3: Updating records with authentic Khmer names...")
-    print("This will take 10-30 minutes for 10 million records...")
-    
-    batch_size = 10000
-    updated = 0
-    offset = 0
-    
-    while offset < total_records:
-        # Get batch of IDs and genders
-        cursor.execute(f"SELECT id, gender FROM people ORDER BY id LIMIT {batch_size} OFFSET {offset}")
-        rows = cursor.fetchall()
-        
-        if not rows:
-            break
-        
-        # Prepare batch update
-        updates = []
-        for person_id, gender in rows:
-            first_name, last_name = get_khmer_name_parts(gender)
-            updates.append((first_name, last_name, f"{first_name} {last_name}", person_id))
-        
-        # Execute batch update
-        cursor.executemany(
-            "UPDATE people SET first_name = ?, last_name = ?, name = ? WHERE id = ?",
-            updates
-        )
-        conn.commit()
-        
-        updated += len(updates)
-        offset += batch_size
-        
-        # Progress update every 100k records
-        if updated % 100000 == 0:
-            percentage = (updated / total_records) * 100
-            print(f"   Progress: {updated:,} / {total_records:,} ({percentage:.1f}%)")
+    print("Progress is checkpointed; if interrupted, run the script again to resume")
+    
+    migration = BatchMigration(conn, 'first_last_name', set_first_last_names, columns=('id', 'gender'),
+                               repeatable=True)
+    if restart:
+        migration.reset()
+    updated = migration.run()
     
     print(f"\n✅ Updated {updated:,} records with authentic Khmer names!")
     
@@ -110,11 +95,14 @@ def migrate_database():
     verified_count = cursor.fetchone()[0]
     print(f"✅ Verified {verified_count:,} records have first_name and last_name")
     
-    # Show sample records
+    # Show sample records. Older databases still keep the province on
+    # people; after migrate_to_location_ids.py it comes from people_view
     print("\n📝 Sample records:")
-    cursor.execute("""
-        SELECT id, first_name, last_name, gender, province 
-        FROM people 
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'people_view'")
+    source = 'people_view' if cursor.fetchone() else 'people'
+    cursor.execute(f"""
+        SELECT id, first_name, last_name, gender, province
+        FROM {source}
         LIMIT 10
     """)
     
@@ -141,7 +129,7 @@ def migrate_database():
 
 if __name__ == '__main__':
     try:
-        migrate_database()
+        migrate_database(restart='--restart' in sys.argv)
     except Exception as e:
         print(f"\n❌ Error during migration: {e}")
         import traceback
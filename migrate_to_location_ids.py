@@ -0,0 +1,153 @@
+"""
+Migration script to replace the four location name columns on people
+(province, district, commune, village) with a single integer village_id
+pointing at the locations table of official gazetteer codes
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from sqlalchemy.dialects import sqlite as sqlite_dialect
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import locations
+import search_index
+import stats
+from models import Person
+
+LOCATION_COLUMNS = ('province', 'district', 'commune', 'village')
+
+
+def database_size(db_path):
+    """Size of the database file plus its WAL, in bytes"""
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+
+def people_ddl():
+    """CREATE TABLE/INDEX statements for people, exactly as models.py defines it"""
+    dialect = sqlite_dialect.dialect()
+    table = str(CreateTable(Person.__table__).compile(dialect=dialect))
+    indexes = [str(CreateIndex(index).compile(dialect=dialect)) for index in Person.__table__.indexes]
+    return table, indexes
+
+
+def migrate_database(db_path='instance/people.db', vacuum=False):
+    """Rebuild people with village_id instead of location name columns"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    cursor = conn.cursor()
+
+    print("🔄 Starting location id migration...")
+    print("=" * 60)
+
+    cursor.execute("PRAGMA table_info(people)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'village_id' in columns:
+        print("⚠️  people already uses village_id, nothing to do")
+        conn.close()
+        return
+    if not all(column in columns for column in LOCATION_COLUMNS):
+        raise RuntimeError("people has neither village_id nor the location name columns")
+
+    size_before = database_size(db_path)
+
+    # Step 1: The locations dimension table
+    print("\n📋 Step 1: Filling the locations table...")
+    added = locations.sync_locations(conn)
+    print(f"✅ {added:,} gazetteer villages added")
+
+    cursor.execute("""
+        SELECT DISTINCT p.province, p.district, p.commune, p.village
+        FROM people p
+        LEFT JOIN locations l
+          ON l.province = p.province AND l.district = p.district
+         AND l.commune = p.commune AND l.village = p.village
+        WHERE l.id IS NULL
+    """)
+    unknown = cursor.fetchall()
+    if unknown:
+        added = locations.add_unofficial_villages(conn, unknown)
+        print(f"⚠️  {added:,} villages in people are not in the gazetteer; gave them unofficial ids")
+
+    # Remember which derived structures to put back on the new table
+    had_search_index = search_index.has_search_index(conn)
+    had_stats = stats.has_stats(conn)
+
+    # Step 2: Copy people into the new layout
+    print("\n🔄 Step 2: Copying people with village_id...")
+    start = time.perf_counter()
+    table_sql, index_sql = people_ddl()
+    cursor.execute("PRAGMA foreign_keys=OFF")
+    cursor.execute("BEGIN")
+    # The view and the old table's triggers refer to people by name
+    cursor.execute(f"DROP VIEW IF EXISTS {locations.PEOPLE_VIEW}")
+    cursor.execute("DROP TABLE IF EXISTS people_new")
+    cursor.execute(table_sql.replace("CREATE TABLE people ", "CREATE TABLE people_new ", 1))
+    cursor.execute("""
+        INSERT INTO people_new (id, name, first_name, last_name, gender, age, village_id, created_at)
+        SELECT p.id, p.name, p.first_name, p.last_name, p.gender, p.age, l.id, p.created_at
+        FROM people p
+        JOIN locations l
+          ON l.province = p.province AND l.district = p.district
+         AND l.commune = p.commune AND l.village = p.village
+        ORDER BY p.id
+    """)
+    copied = cursor.rowcount
+    cursor.execute("SELECT COUNT(*) FROM people")
+    total = cursor.fetchone()[0]
+    if copied != total:
+        cursor.execute("ROLLBACK")
+        raise RuntimeError(f"Copied {copied:,} of {total:,} people; nothing was changed")
+    print(f"✅ Copied {copied:,} people in {time.perf_counter() - start:.1f}s")
+
+    # Step 3: Swap the tables and rebuild indexes
+    print("\n🔧 Step 3: Replacing people and rebuilding indexes...")
+    cursor.execute("DROP TABLE people")
+    cursor.execute("ALTER TABLE people_new RENAME TO people")
+    for statement in index_sql:
+        cursor.execute(statement)
+    cursor.execute(locations.CREATE_PEOPLE_VIEW_SQL)
+    cursor.execute("COMMIT")
+    print(f"✅ Created {len(index_sql)} indexes")
+
+    # Step 4: Triggers for the name search index and people_stats
+    print("\n🔧 Step 4: Reinstalling triggers...")
+    if had_search_index:
+        # Ids and names are unchanged, so the FTS index itself is still valid
+        search_index.create_search_index(conn)
+        print("✅ Name search triggers")
+    if had_stats:
+        stats.install_triggers(conn)
+        print("✅ people_stats triggers")
+
+    cursor.execute("ANALYZE")
+    if vacuum:
+        print("\n🧹 Vacuuming database (this may take a while)...")
+        cursor.execute("VACUUM")
+    cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    size_after = database_size(db_path)
+    print("\n" + "=" * 60)
+    print("🎉 Migration completed successfully!")
+    print("=" * 60)
+    print(f"Database size: {size_before / 1024 ** 2:,.1f} MB -> {size_after / 1024 ** 2:,.1f} MB")
+    if not vacuum:
+        print("Run with --vacuum to return the freed pages to the file system")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store people locations as integer village ids")
+    parser.add_argument('--db', default='instance/people.db', help="SQLite database path")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM after the migration")
+    args = parser.parse_args()
+    migrate_database(args.db, vacuum=args.vacuum)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f"\n❌ Error during migration: {e}")
+        import traceback
+        traceback.print_exc()
@@ -4,6 +4,19 @@ from datetime import datetime
 
 db = SQLAlchemy()
 
+class Location(db.Model):
+    """Gazetteer villages; id is the official village code from camboia.xlsx"""
+    __tablename__ = 'locations'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    province = db.Column(db.String(100), nullable=False)
+    district = db.Column(db.String(100), nullable=False)
+    commune = db.Column(db.String(100), nullable=False)
+    village = db.Column(db.String(100), nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_locations_path', 'province', 'district', 'commune', 'village', unique=True),
+    )
+
 class Person(db.Model):
     __tablename__ = 'people'
     id = db.Column(db.Integer, primary_key=True)
@@ -12,21 +25,55 @@ class Person(db.Model):
     last_name = db.Column(db.String(50), nullable=True, index=True)
     gender = db.Column(db.String(10), nullable=False, index=True)
     age = db.Column(db.Integer, nullable=False, index=True)
-    province = db.Column(db.String(100), nullable=False, index=True)
-    district = db.Column(db.String(100), nullable=False, index=True)
-    commune = db.Column(db.String(100), nullable=False, index=True)
-    village = db.Column(db.String(100), nullable=False, index=True)
+    # Province/district/commune/village live in the locations table
+    village_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Eager loading relationship so location names cost no extra queries
+    location = db.relationship('Location', lazy='joined', innerjoin=True)
+    
     # Composite indexes for common search patterns
     __table_args__ = (
-        db.Index('idx_province_district', 'province', 'district'),
+        db.Index('idx_village_gender_age', 'village_id', 'gender', 'age'),
         db.Index('idx_gender_age', 'gender', 'age'),
-        db.Index('idx_name_province', 'name', 'province'),
         db.Index('idx_first_name', 'first_name'),
         db.Index('idx_last_name', 'last_name'),
         db.Index('idx_first_last_name', 'first_name', 'last_name'),
     )
+    
+    @property
+    def province(self):
+        return self.location.province
+    
+    @property
+    def district(self):
+        return self.location.district
+    
+    @property
+    def commune(self):
+        return self.location.commune
+    
+    @property
+    def village(self):
+        return self.location.village
+
+class PeopleStat(db.Model):
+    """Precomputed head counts per location/gender/age, maintained by stats.py"""
+    __tablename__ = 'people_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    province = db.Column(db.String(100), nullable=False)
+    district = db.Column(db.String(100), nullable=False)
+    commune = db.Column(db.String(100), nullable=False)
+    village = db.Column(db.String(100), nullable=False)
+    gender = db.Column(db.String(10), nullable=False)
+    age = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('idx_people_stats_key', 'province', 'district', 'commune', 'village',
+                 'gender', 'age', unique=True),
+        db.Index('idx_people_stats_gender_age', 'gender', 'age'),
+    )
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -37,14 +84,5 @@ class User(UserMixin, db.Model):
     province = db.Column(db.String(100), nullable=True, index=True)  # For managers only
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-class EditHistory(db.Model):
-    __tablename__ = 'edit_history'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    person_id = db.Column(db.Integer, db.ForeignKey('people.id'), nullable=True, index=True)
-    action = db.Column(db.String(50), nullable=False, index=True)
-    details = db.Column(db.Text)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    
-    # Eager loading relationship to avoid N+1
-    user = db.relationship('User', backref='edits', lazy='joined')
+# The audit log (edit_history) is stored in monthly partitions managed by
+# history_partitions.py rather than a mapped table
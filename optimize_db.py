@@ -14,8 +14,8 @@ def optimize_database():
         try:
             print("Creating composite indexes...")
             db.session.execute(db.text("""
-                CREATE INDEX IF NOT EXISTS idx_province_district 
-                ON people (province, district)
+                CREATE INDEX IF NOT EXISTS idx_village_gender_age 
+                ON people (village_id, gender, age)
             """))
             
             db.session.execute(db.text("""
@@ -23,11 +23,6 @@ def optimize_database():
                 ON people (gender, age)
             """))
             
-            db.session.execute(db.text("""
-                CREATE INDEX IF NOT EXISTS idx_name_province 
-                ON people (name, province)
-            """))
-            
             db.session.commit()
             print("✓ Composite indexes created")
         except Exception as e:
@@ -0,0 +1,128 @@
+"""
+Keyset (seek) pagination
+Pages through a query by seeking past the last key seen instead of using
+LIMIT/OFFSET, so deep pages cost the same as the first one
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(data):
+    """Encode cursor data as an opaque URL-safe token"""
+    raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token, returning None if it is missing or malformed"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('k'), list):
+        return None
+    return data
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, value):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+class KeysetPage:
+    """One page of keyset-paginated results with next/prev cursor tokens"""
+
+    def __init__(self, items, page, per_page, has_prev, has_next,
+                 prev_cursor=None, next_cursor=None, total=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+        self.total = total
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return max(1, (self.total + self.per_page - 1) // self.per_page)
+
+
+def keyset_paginate(query, columns, per_page, cursor=None, page=1,
+                    descending=False, total=None):
+    """
+    Paginate `query` by seeking on `columns` (which must form a unique key).
+
+    `cursor` is a token produced by a previous page; without one the first
+    page is returned, or page `page` via OFFSET for old page-number links.
+    """
+    data = decode_cursor(cursor)
+    key = None
+    backwards = False
+    if data and len(data['k']) == len(columns):
+        try:
+            key = [_load_value(col, val) for col, val in zip(columns, data['k'])]
+        except (TypeError, ValueError):
+            key = None
+    if key is not None:
+        backwards = data.get('d') == 'p'
+        page = data.get('p') if isinstance(data.get('p'), int) else None
+    else:
+        page = max(1, page or 1)
+
+    seek_key = columns[0] if len(columns) == 1 else tuple_(*columns)
+    seek_value = key[0] if key and len(columns) == 1 else (tuple_(*key) if key else None)
+
+    # Walking backwards flips both the seek comparison and the sort order
+    reverse = descending != backwards
+    if key is not None:
+        if reverse:
+            query = query.filter(seek_key < seek_value)
+        else:
+            query = query.filter(seek_key > seek_value)
+    query = query.order_by(*[col.desc() if reverse else col.asc() for col in columns])
+
+    if key is None and page > 1:
+        query = query.offset((page - 1) * per_page)
+
+    items = query.limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = key is not None or page > 1, has_more
+
+    def cursor_for(item, direction, target_page):
+        values = [_dump_value(getattr(item, col.key)) for col in columns]
+        return encode_cursor({'k': values, 'd': direction, 'p': target_page})
+
+    prev_cursor = next_cursor = None
+    if items:
+        if has_prev:
+            prev_cursor = cursor_for(items[0], 'p', page - 1 if page else None)
+        if has_next:
+            next_cursor = cursor_for(items[-1], 'n', page + 1 if page else None)
+
+    return KeysetPage(items, page, per_page, has_prev, has_next,
+                      prev_cursor, next_cursor, total)
@@ -0,0 +1,313 @@
+"""
+Request performance instrumentation
+Every request records its wall time and, for the SQL it ran, the number
+of statements, the time spent executing and fetching them and the rows
+returned. Statements are timed at the DB-API level (an sqlite3 connection
+class installed through the engine's connect_args), so raw connections
+borrowed by repository.py and history_partitions.py are measured along
+with ORM queries. Only cursors opened while a request is collecting stats
+are instrumented, and only per call: rows read by iterating a cursor are
+not timed one by one, so streamed exports and background threads run on
+plain sqlite3 cursors. Statements slower than a threshold are written with
+their EXPLAIN QUERY PLAN (the SQL and the parameter types, never their
+values) to a rotating slow-query log, and the last request times per
+endpoint are kept for /admin/perf (p50/p95/p99)
+"""
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+
+from flask import request
+
+# Request times kept per endpoint for the percentiles
+DEFAULT_SAMPLES = 1000
+
+_current = ContextVar('perf_request', default=None)
+
+
+class RequestStats:
+    """SQL totals for one request"""
+    __slots__ = ('statements', 'sql_seconds', 'rows', 'slow')
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.slow = []
+
+
+class _Statement:
+    """One execute() and the fetches that followed it"""
+    __slots__ = ('sql', 'params', 'seconds', 'rows', 'stats', 'slow_seconds')
+
+    def __init__(self, sql, params, stats, slow_seconds):
+        self.sql = sql
+        self.params = params
+        self.seconds = 0.0
+        self.rows = 0
+        self.stats = stats
+        self.slow_seconds = slow_seconds
+
+    def add(self, seconds, rows=0):
+        self.seconds += seconds
+        self.rows += rows
+        self.stats.sql_seconds += seconds
+        self.stats.rows += rows
+        # Flagged as soon as it crosses the threshold, so a cursor that is
+        # never exhausted (fetchone() of a COUNT) is still caught
+        if self.slow_seconds is not None and self.seconds >= self.slow_seconds:
+            self.stats.slow.append(self)
+            self.slow_seconds = None
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """sqlite3 cursor that reports to the current request's RequestStats"""
+    _statement = None
+
+    def _begin(self, sql, params):
+        stats = _current.get()
+        if stats is None:
+            self._statement = None
+            return None
+        stats.statements += 1
+        self._statement = _Statement(sql, params, stats, self.connection.monitor.slow_seconds)
+        return self._statement
+
+    def _end(self):
+        self._statement = None
+
+    def _timed(self, method, *args):
+        statement = self._statement
+        if statement is None:
+            return method(*args)
+        start = time.perf_counter()
+        result = method(*args)
+        elapsed = time.perf_counter() - start
+        if isinstance(result, list):
+            statement.add(elapsed, len(result))
+        else:
+            statement.add(elapsed, 0 if result is None else 1)
+        return result
+
+    def execute(self, sql, parameters=()):
+        statement = self._begin(sql, parameters)
+        if statement is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            statement.add(time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        statement = self._begin(sql, None)
+        if statement is None:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            statement.add(time.perf_counter() - start)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._end()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._end()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._end()
+        return rows
+
+    def close(self):
+        self._end()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    sqlite3 connection whose cursors (including execute() shortcuts) are
+    instrumented while the current request collects stats, and plain
+    sqlite3 cursors otherwise
+    """
+    monitor = None
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = InstrumentedCursor if _current.get() is not None else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if _current.get() is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if _current.get() is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def describe_params(params):
+    """Types of a statement's parameters, for the log (their values can be people's names)"""
+    if params is None:
+        return '(executemany)'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f"{name}: {type(value).__name__}" for name, value in params.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+
+def _percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class PerfMonitor:
+    """
+    Collects per-request timings for a Flask app.
+
+    Create it before the app's engine exists and pass the engine options
+    through engine_options(), then call init_app().
+    """
+
+    def __init__(self, slow_ms=100, log_path='slow_queries.log', max_bytes=5 * 1024 * 1024,
+                 backup_count=5, samples=DEFAULT_SAMPLES, database=None):
+        self.slow_seconds = slow_ms / 1000.0
+        self.database = database
+        self.samples = samples
+        self.log_path = log_path
+        self.log = logging.getLogger('perf.slow_queries')
+        self.log.setLevel(logging.INFO)
+        self.log.propagate = False
+        if log_path and not self.log.handlers:
+            handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count,
+                                          encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.log.addHandler(handler)
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(lambda: {'times': deque(maxlen=self.samples), 'requests': 0,
+                                               'statements': 0, 'sql_seconds': 0.0, 'rows': 0,
+                                               'slow': 0})
+        self._explain = threading.local()
+        self.connection_class = type('MonitoredConnection', (InstrumentedConnection,), {'monitor': self})
+
+    def engine_options(self, options, database_uri):
+        """SQLAlchemy engine options with the instrumented connection class (SQLite only)"""
+        if not database_uri.startswith('sqlite'):
+            return options
+        connect_args = dict(options.get('connect_args', {}), factory=self.connection_class)
+        return dict(options, connect_args=connect_args)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['perf'] = self
+
+    def _before_request(self):
+        request.perf_start = time.perf_counter()
+        request.perf_token = _current.set(RequestStats())
+
+    def _after_request(self, response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        wall = time.perf_counter() - request.perf_start
+        # Visible in the browser's network panel
+        response.headers['Server-Timing'] = (f"app;dur={wall * 1000:.1f}, "
+                                             f"db;dur={stats.sql_seconds * 1000:.1f};desc=\"{stats.statements} queries\"")
+        self._record(request.endpoint or request.path, wall, stats)
+        return response
+
+    def _teardown_request(self, exc=None):
+        token = getattr(request, 'perf_token', None)
+        if token is not None:
+            stats = _current.get()
+            _current.reset(token)
+            request.perf_token = None
+            if stats is not None and stats.slow:
+                self._log_slow(request.endpoint or request.path, stats.slow)
+
+    def _record(self, endpoint, wall, stats):
+        with self._lock:
+            entry = self._endpoints[endpoint]
+            entry['times'].append(wall)
+            entry['requests'] += 1
+            entry['statements'] += stats.statements
+            entry['sql_seconds'] += stats.sql_seconds
+            entry['rows'] += stats.rows
+            entry['slow'] += len(stats.slow)
+
+    def _explain_connection(self, database):
+        # A separate read-only connection, so the plan is never taken on a
+        # connection that has already gone back to the pool
+        conn = getattr(self._explain, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+            self._explain.conn = conn
+        return conn
+
+    def explain(self, database, sql, params):
+        """EXPLAIN QUERY PLAN lines for a statement, or the reason there are none"""
+        if params is None:
+            return ['(executemany, no plan)']
+        try:
+            rows = self._explain_connection(database).execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as e:
+            return [f"(no plan: {e})"]
+        # Rows are (id, parent, notused, detail); indent children under parents
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node] + detail)
+        return lines
+
+    def _log_slow(self, endpoint, statements):
+        database = self.database
+        for statement in statements:
+            plan = self.explain(database, statement.sql, statement.params) if database else []
+            self.log.info("%s %.1fms rows=%d\n  SQL: %s\n  params: %s\n  plan:\n    %s",
+                          endpoint, statement.seconds * 1000, statement.rows,
+                          ' '.join(statement.sql.split()), describe_params(statement.params),
+                          '\n    '.join(plan))
+
+    def summary(self):
+        """Per-endpoint figures for /admin/perf, slowest p95 first"""
+        with self._lock:
+            snapshot = [(endpoint, sorted(entry['times']), dict(entry))
+                        for endpoint, entry in self._endpoints.items() if entry['times']]
+        rows = []
+        for endpoint, times, entry in snapshot:
+            requests = entry['requests']
+            rows.append({
+                'endpoint': endpoint,
+                'requests': requests,
+                'p50_ms': _percentile(times, 0.50) * 1000,
+                'p95_ms': _percentile(times, 0.95) * 1000,
+                'p99_ms': _percentile(times, 0.99) * 1000,
+                'max_ms': times[-1] * 1000,
+                'avg_statements': entry['statements'] / requests,
+                'avg_sql_ms': entry['sql_seconds'] * 1000 / requests,
+                'avg_rows': entry['rows'] / requests,
+                'slow_statements': entry['slow'],
+            })
+        rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
@@ -0,0 +1,274 @@
+"""
+Shared data access for the web app and the desktop GUIs
+One query builder for people searches, so every frontend filters the same
+way and benefits from the same indexes: names through the FTS5 trigram
+index (search_index.py), locations through the small locations table and
+the integer village_id. Values are always bound parameters and the SQL
+text depends only on which filters are set, so each shape is built once
+and sqlite3's per-connection statement cache reuses the prepared
+statement. Connections come from a pluggable backend: a pool of sqlite3
+connections for the desktop apps, or a SQLAlchemy engine's pool for Flask
+"""
+import queue
+import sqlite3
+from contextlib import contextmanager
+from functools import lru_cache
+
+import counts
+import db_tuning
+import search_index
+from config import Config
+from locations import LOCATIONS_TABLE, PEOPLE_VIEW
+
+PEOPLE_TABLE = 'people'
+
+# Columns of a search result row, in display order (id first)
+RESULT_COLUMNS = ('id', 'name', 'gender', 'age', 'province', 'district', 'commune', 'village')
+
+FILTER_FIELDS = ('id', 'name', 'gender', 'age', 'province', 'district', 'commune', 'village')
+LOCATION_FIELDS = ('province', 'district', 'commune', 'village')
+
+# Prepared statements kept per sqlite3 connection (the library default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+# PRAGMAs that only affect the connection, so they are safe on read-only ones
+SESSION_PRAGMAS = ('cache_size', 'temp_store', 'mmap_size', 'busy_timeout')
+
+
+def normalize_filters(args, manager_province=None):
+    """
+    Turn raw filter strings (request.args or a dict of widget texts) into
+    the filter dict every query here takes. Province managers only ever
+    see their own province.
+    """
+    filters = {field: (args.get(field) or '').strip() for field in FILTER_FIELDS}
+    for key in ('id', 'age'):
+        try:
+            filters[key] = int(filters[key]) if filters[key] else None
+        except ValueError:
+            filters[key] = None
+    if manager_province:
+        filters['manager_province'] = manager_province
+    return filters
+
+
+def _shape(filters, use_fts):
+    """The part of a filter dict that decides the SQL text"""
+    active = tuple(key for key in FILTER_FIELDS + ('manager_province',)
+                   if filters.get(key) not in (None, ''))
+    return active, use_fts
+
+
+@lru_cache(maxsize=512)
+def _where_sql(table, active, use_fts):
+    conditions = []
+    if 'id' in active:
+        conditions.append(f"{table}.id = :id")
+    if 'name' in active:
+        if use_fts:
+            conditions.append(f"{table}.id IN (SELECT rowid FROM {search_index.FTS_TABLE} "
+                              f"WHERE {search_index.FTS_TABLE} MATCH :name)")
+        else:
+            conditions.append(f"({table}.name LIKE :name OR {table}.first_name LIKE :name "
+                              f"OR {table}.last_name LIKE :name)")
+    if 'gender' in active:
+        conditions.append(f"{table}.gender = :gender")
+    if 'age' in active:
+        conditions.append(f"{table}.age = :age")
+
+    # Location names are matched against the small locations table; people
+    # is then filtered on the integer village_id
+    location_conditions = []
+    if 'manager_province' in active:
+        location_conditions.append("province = :manager_province")
+    for field in LOCATION_FIELDS:
+        if field in active:
+            location_conditions.append(f"{field} LIKE :{field}")
+    if location_conditions:
+        conditions.append(f"{table}.village_id IN (SELECT id FROM {LOCATIONS_TABLE} "
+                          f"WHERE {' AND '.join(location_conditions)})")
+    return ' AND '.join(conditions) or '1=1'
+
+
+def page_sql(query, params, after_id=None, limit=100):
+    """Add keyset paging (rows after `after_id`, in id order) to a search query"""
+    params = dict(params, limit=limit)
+    if after_id is None:
+        return f"{query} ORDER BY id LIMIT :limit", params
+    params['after_id'] = after_id
+    return f"{query} AND id > :after_id ORDER BY id LIMIT :limit", params
+
+
+class SQLiteBackend:
+    """A small pool of sqlite3 connections to one database file"""
+
+    def __init__(self, db_path, read_only=False, pool_size=4, pragmas=None):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.cache_key = db_path
+        if pragmas is None:
+            pragmas = Config.SQLITE_PRAGMAS
+            if read_only:
+                pragmas = {name: pragmas[name] for name in SESSION_PRAGMAS if name in pragmas}
+        self.pragmas = pragmas
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        db_tuning.apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def acquire(self):
+        """An idle pooled connection, or a new one"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        """Return a connection to the pool (closing it if the pool is full)"""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SQLAlchemyBackend:
+    """Raw DB-API connections borrowed from a SQLAlchemy engine's pool"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.cache_key = str(engine.url)
+
+    def acquire(self):
+        return self.engine.raw_connection()
+
+    def release(self, conn):
+        # Closing a pooled connection hands it back to the engine's pool
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        self.engine.dispose()
+
+
+class PeopleRepository:
+    """
+    People searches over a backend.
+
+    Methods taking `conn` use it when given (e.g. a worker thread's own
+    connection, or the connection of the current SQLAlchemy session) and
+    borrow one from the backend otherwise.
+    """
+
+    def __init__(self, backend, count_cache=None):
+        self.backend = backend
+        self.count_cache = count_cache if count_cache is not None else counts.CountCache(ttl=300)
+
+    @contextmanager
+    def _connection(self, conn):
+        if conn is not None:
+            yield conn
+        else:
+            with self.backend.connection() as conn:
+                yield conn
+
+    def where(self, filters, table=PEOPLE_TABLE, conn=None):
+        """Return (sql, params): the WHERE condition for a filter dict, on `table` or people_view"""
+        use_fts = False
+        if search_index.match_expression(filters.get('name')):
+            with self._connection(conn) as conn:
+                use_fts = search_index.has_search_index(conn, cache_key=self.backend.cache_key)
+        active, use_fts = _shape(filters, use_fts)
+
+        params = {key: filters[key] for key in active}
+        if 'name' in params:
+            params['name'] = (search_index.match_expression(params['name']) if use_fts
+                              else f"%{params['name']}%")
+        for field in LOCATION_FIELDS:
+            if field in params:
+                params[field] = f"%{params[field]}%"
+        return _where_sql(table, active, use_fts), params
+
+    def search_sql(self, filters, conn=None):
+        """
+        Return (query, params, count_query) for a filter dict. `query` ends
+        with its WHERE clause, ready for page_sql(); the count runs on people
+        alone, without joining the location names.
+        """
+        where, params = self.where(filters, PEOPLE_VIEW, conn)
+        query = f"SELECT {', '.join(RESULT_COLUMNS)} FROM {PEOPLE_VIEW} WHERE {where}"
+        count_where, _ = self.where(filters, PEOPLE_TABLE, conn)
+        count_query = f"SELECT COUNT(*) FROM {PEOPLE_TABLE} WHERE {count_where}"
+        return query, params, count_query
+
+    def page(self, filters, after_id=None, limit=100, conn=None):
+        """One page of result rows (RESULT_COLUMNS) after `after_id`, in id order"""
+        with self._connection(conn) as conn:
+            query, params, _ = self.search_sql(filters, conn)
+            sql, params = page_sql(query, params, after_id, limit)
+            return conn.execute(sql, params).fetchall()
+
+    def iter_rows(self, filters, batch_size=5000, conn=None):
+        """
+        Every matching row (RESULT_COLUMNS) in id order, read in keyset
+        batches and streamed off the cursor, so memory stays flat however
+        many rows match. The connection is held until the generator ends
+        or is closed.
+        """
+        with self._connection(conn) as conn:
+            query, params, _ = self.search_sql(filters, conn)
+            after_id = None
+            while True:
+                sql, batch_params = page_sql(query, params, after_id, batch_size)
+                rows = 0
+                for row in conn.execute(sql, batch_params):
+                    yield row
+                    rows += 1
+                    after_id = row[0]
+                if rows < batch_size:
+                    return
+
+    def count_sql(self, count_query, params, conn=None):
+        """Run a count_query from search_sql(), cached per query and parameters"""
+        def count():
+            with self._connection(conn) as connection:
+                return connection.execute(count_query, params).fetchone()[0]
+
+        return self.count_cache.get_or_compute((count_query, tuple(sorted(params.items()))), count)
+
+    def count(self, filters, conn=None):
+        """Number of people matching a filter dict"""
+        with self._connection(conn) as conn:
+            _, params, count_query = self.search_sql(filters, conn)
+            return self.count_sql(count_query, params, conn)
@@ -0,0 +1,162 @@
+"""
+Local stand-in for the NCDD gazetteer, so scrape_locations.py can be run
+and tested offline
+
+It replays the pages of a scrape_locations response cache (a copy of
+scrape_cache/ from a real run, for instance), answering conditional
+requests with 304 like a real server. --from-xlsx fills a cache with
+pages built from camboia.xlsx in the table layout parse_rows() reads,
+so no real site is needed at all. --latency and --error-rate make it
+slow and flaky on purpose.
+
+    python scrape_fixtures.py --from-xlsx camboia.xlsx
+    python scrape_fixtures.py --latency 200 --error-rate 0.02
+    python scrape_locations.py --base-url http://127.0.0.1:8765/gazetteer/view --no-cache
+"""
+import argparse
+import asyncio
+import html
+import random
+
+from aiohttp import web
+from openpyxl import load_workbook
+
+from import_cambodia_locations import (COMMUNE_TYPES, DISTRICT_TYPES, FIRST_DATA_ROW, VILLAGE_TYPE,
+                                       province_name)
+from scrape_locations import ResponseCache, page_key
+
+FIXTURE_DIR = 'scrape_fixtures'
+VIEW_PATH = '/gazetteer/view'
+# Request counters of a make_app() server
+STATS_KEY = web.AppKey('stats', dict)
+
+def render_page(title, rows):
+    """A gazetteer table page: two header rows, then No, code, Khmer and English name, then a total"""
+    lines = [
+        '<html><head><meta charset="utf-8"><title>{}</title></head><body><table>'.format(html.escape(title)),
+        '<tr><th colspan="4">{}</th></tr>'.format(html.escape(title)),
+        '<tr><th>No</th><th>Code</th><th>Name (Khmer)</th><th>Name (Latin)</th></tr>',
+    ]
+    for number, (code, khmer, english) in enumerate(rows, 1):
+        lines.append('<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'.format(
+            number, html.escape(code), html.escape(khmer), html.escape(english)))
+    lines.append('<tr><td></td><td>Total</td><td></td><td>{}</td></tr>'.format(len(rows)))
+    lines.append('</table></body></html>')
+    return '\n'.join(lines).encode('utf-8')
+
+def build_fixtures(path='camboia.xlsx', cache_dir=FIXTURE_DIR):
+    """Fill a response cache with every gazetteer page, built from the workbook"""
+    cache = ResponseCache(cache_dir)
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        provinces = []
+        for sheet in workbook.worksheets:
+            # Sheet titles are "01. Banteay Meanchey"
+            code = sheet.title.split('. ', 1)[0]
+            province = province_name(sheet.title)
+            provinces.append((code, '', province))
+            
+            districts = []
+            communes = {}
+            villages = {}
+            for row in sheet.iter_rows(min_row=FIRST_DATA_ROW, max_col=4, values_only=True):
+                row_type, row_code, khmer, latin = (str(value).strip() if value is not None else ''
+                                                    for value in (tuple(row) + (None,) * 4)[:4])
+                if not row_code or not (latin or khmer):
+                    continue
+                item = (row_code, khmer, latin or khmer)
+                if row_type in DISTRICT_TYPES:
+                    districts.append(item)
+                    communes[row_code] = []
+                elif row_type in COMMUNE_TYPES and districts:
+                    communes[districts[-1][0]].append(item)
+                    villages[row_code] = []
+                elif row_type == VILLAGE_TYPE and villages:
+                    villages[next(reversed(villages))].append(item)
+            
+            cache.put(page_key('districts', code), render_page(province, districts))
+            for district_code, items in communes.items():
+                cache.put(page_key('communes', district_code), render_page(district_code, items))
+            for commune_code, items in villages.items():
+                cache.put(page_key('villages', commune_code), render_page(commune_code, items))
+        
+        cache.put(page_key(), render_page('Provinces', provinces))
+        cache.save()
+    finally:
+        workbook.close()
+    return cache
+
+def make_app(cache, latency=0.0, error_rate=0.0, seed=None, retry_after=None):
+    """
+    aiohttp application serving `cache` under VIEW_PATH. Each response
+    waits about `latency` seconds, and `error_rate` of them are 503s,
+    with a Retry-After of `retry_after` seconds if given. GET /_stats
+    reports requests, status counts and peak concurrency.
+    """
+    rng = random.Random(seed)
+    stats = {'requests': 0, 'in_flight': 0, 'max_in_flight': 0, 'not_modified': 0, 'errors': 0, 'missing': 0}
+    
+    async def page(request):
+        key = request.match_info['page']
+        if request.query_string:
+            key += '?' + request.query_string
+        
+        stats['requests'] += 1
+        stats['in_flight'] += 1
+        stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+        try:
+            if latency:
+                await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+            if error_rate and rng.random() < error_rate:
+                stats['errors'] += 1
+                headers = {'Retry-After': str(retry_after)} if retry_after is not None else None
+                return web.Response(status=503, text="Service Unavailable", headers=headers)
+            
+            entry, body = cache.get(key)
+            if body is None:
+                stats['missing'] += 1
+                return web.Response(status=404, text="Not Found")
+            etag = '"{}"'.format(entry['sha256'])
+            if request.headers.get('If-None-Match') == etag:
+                stats['not_modified'] += 1
+                return web.Response(status=304, headers={'ETag': etag})
+            return web.Response(body=body, content_type='text/html', charset='utf-8', headers={'ETag': etag})
+        finally:
+            stats['in_flight'] -= 1
+    
+    async def get_stats(request):
+        return web.json_response(request.app[STATS_KEY])
+    
+    app = web.Application()
+    app[STATS_KEY] = stats
+    app.router.add_get(VIEW_PATH + '/{page}', page)
+    app.router.add_get('/_stats', get_stats)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve cached gazetteer pages to scrape_locations.py")
+    parser.add_argument('--cache-dir', default=FIXTURE_DIR, help="Response cache to serve (or fill)")
+    parser.add_argument('--from-xlsx', metavar='PATH', help="Fill the cache from the gazetteer workbook and exit")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0, help="Milliseconds per response (randomized ±50%%)")
+    parser.add_argument('--error-rate', type=float, default=0, help="Share of requests answered with 503")
+    parser.add_argument('--retry-after', type=int, default=None, help="Retry-After seconds sent with the 503s")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed for latency and errors")
+    args = parser.parse_args()
+    
+    if args.from_xlsx:
+        cache = build_fixtures(args.from_xlsx, args.cache_dir)
+        print(f"✅ {len(cache):,} pages from {args.from_xlsx} written to {args.cache_dir}")
+        return
+    
+    cache = ResponseCache(args.cache_dir)
+    if not len(cache):
+        print(f"⚠️  {args.cache_dir} has no pages; fill it with --from-xlsx or a scrape_locations.py run")
+        return
+    print(f"Serving {len(cache):,} pages at http://{args.host}:{args.port}{VIEW_PATH}")
+    app = make_app(cache, args.latency / 1000, args.error_rate, args.seed, args.retry_after)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+if __name__ == '__main__':
+    main()
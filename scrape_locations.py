@@ -1,161 +1,438 @@
-import requests
-from bs4 import BeautifulSoup
+"""
+Scrape the NCDD gazetteer (provinces → districts → communes → villages)
+into cambodia_locations.json
+
+Pages are fetched concurrently with aiohttp: at most --concurrency at a
+time and no more than --rate per second (a token bucket). Every response
+is kept in a content-addressed cache (scrape_cache/), so a rerun only
+fetches pages it has never seen, or revalidates those older than
+--max-age. Parsed pages are checkpointed while the walk runs, and an
+interrupted run resumes from the checkpoint.
+
+To scrape offline, scrape_fixtures.py serves cached pages over HTTP:
+    python scrape_fixtures.py --from-xlsx camboia.xlsx
+    python scrape_fixtures.py
+    python scrape_locations.py --base-url http://127.0.0.1:8765/gazetteer/view --no-cache
+"""
+import argparse
+import asyncio
+import hashlib
 import json
+import os
+import random
+import sys
 import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+from bs4 import BeautifulSoup
 
 BASE_URL = "https://db.ncdd.gov.kh/gazetteer/view"
+INDEX_PAGE = 'index.castle'
+
+# Level: (page listing it, query parameter taking the parent's code)
+PAGES = {
+    'districts': ('pro_district.castle', 'pv_code'),
+    'communes': ('district_commune.castle', 'ds_code'),
+    'villages': ('commune_village.castle', 'cm_code'),
+}
+# Level listed below each level; None is the province list on the index page
+CHILD_LEVEL = {None: 'districts', 'districts': 'communes', 'communes': 'villages', 'villages': None}
+
+OUTPUT_FILE = 'cambodia_locations.json'
+CACHE_DIR = 'scrape_cache'
+CHECKPOINT_EVERY = 100  # parsed pages between checkpoint writes
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+USER_AGENT = 'cambodia-people-gazetteer-scraper'
 
-def scrape_provinces():
-    """Scrape all provinces from the main page"""
-    url = f"{BASE_URL}/index.castle"
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
+def parse_rows(content):
+    """Code, Khmer and English name of every row in a gazetteer table page"""
+    soup = BeautifulSoup(content, 'html.parser')
     
-    provinces = []
+    items = []
     rows = soup.find_all('tr')[2:]  # Skip header rows
     
     for row in rows:
         cols = row.find_all('td')
-        if len(cols) >= 3:
+        if len(cols) >= 4:
             code = cols[1].text.strip()
             khmer = cols[2].text.strip()
             english = cols[3].text.strip()
             
-            if code and english and code != 'Total':
-                provinces.append({
+            if code and english and code != 'Total' and 'Total' not in english:
+                items.append({
                     'code': code,
                     'khmer': khmer,
-                    'english': english,
-                    'districts': []
+                    'english': english
                 })
     
-    return provinces
+    return items
 
-def scrape_districts(province_code):
-    """Scrape districts for a province"""
-    url = f"{BASE_URL}/pro_district.castle?pv_code={province_code}"
+def page_key(level=None, code=None):
+    """A page's URL relative to the base URL, which is also its cache key"""
+    if level is None:
+        return INDEX_PAGE
+    page, param = PAGES[level]
+    return f"{page}?{param}={code}"
+
+def _write_atomic(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+def _retry_after(value):
+    """Seconds asked for by a Retry-After header, or None"""
+    if not value:
+        return None
     try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        districts = []
-        rows = soup.find_all('tr')[2:]
-        
-        for row in rows:
-            cols = row.find_all('td')
-            if len(cols) >= 3:
-                code = cols[1].text.strip()
-                khmer = cols[2].text.strip()
-                english = cols[3].text.strip()
-                
-                if code and english and 'Total' not in english:
-                    districts.append({
-                        'code': code,
-                        'khmer': khmer,
-                        'english': english,
-                        'communes': []
-                    })
-        
-        return districts
-    except Exception as e:
-        print(f"Error scraping districts for {province_code}: {e}")
-        return []
-
-def scrape_communes(district_code):
-    """Scrape communes for a district"""
-    url = f"{BASE_URL}/district_commune.castle?ds_code={district_code}"
+        return max(0.0, float(value))
+    except ValueError:
+        pass
     try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        communes = []
-        rows = soup.find_all('tr')[2:]
-        
-        for row in rows:
-            cols = row.find_all('td')
-            if len(cols) >= 3:
-                code = cols[1].text.strip()
-                khmer = cols[2].text.strip()
-                english = cols[3].text.strip()
-                
-                if code and english and 'Total' not in english:
-                    communes.append({
-                        'code': code,
-                        'khmer': khmer,
-                        'english': english,
-                        'villages': []
-                    })
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class ResponseCache:
+    """
+    Page bodies stored by content: objects/ holds each distinct body once,
+    named by its sha256, and index.json maps page keys to the hash, the
+    fetch time and the validators (ETag, Last-Modified) for revalidation
+    """
+    
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except FileNotFoundError:
+            self.index = {}
+        self._dirty = False
+    
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+    
+    def get(self, key):
+        """(index entry, body) of a cached page, or (None, None)"""
+        entry = self.index.get(key)
+        if entry is None:
+            return None, None
+        try:
+            with open(self._object_path(entry['sha256']), 'rb') as f:
+                return entry, f.read()
+        except FileNotFoundError:
+            return None, None
+    
+    def put(self, key, body, headers=None):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, body)
         
-        return communes
-    except Exception as e:
-        print(f"Error scraping communes for {district_code}: {e}")
-        return []
-
-def scrape_villages(commune_code):
-    """Scrape villages for a commune"""
-    url = f"{BASE_URL}/commune_village.castle?cm_code={commune_code}"
-    try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, 'html.parser')
+        entry = {'sha256': digest, 'fetched': time.time()}
+        for header in ('ETag', 'Last-Modified'):
+            if headers and headers.get(header):
+                entry[header.lower()] = headers[header]
+        self.index[key] = entry
+        self._dirty = True
+    
+    def touch(self, key):
+        """Mark a cached page as fresh again (the server answered 304)"""
+        self.index[key]['fetched'] = time.time()
+        self._dirty = True
+    
+    def __len__(self):
+        return len(self.index)
+    
+    def save(self):
+        if self._dirty:
+            os.makedirs(self.directory, exist_ok=True)
+            _write_atomic(self.index_path, json.dumps(self.index, indent=1, sort_keys=True).encode('utf-8'))
+            self._dirty = False
+
+class TokenBucket:
+    """Lets requests through at `rate` per second on average, in bursts of up to `burst`"""
+    
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        if not self.rate:
+            return
+        # The lock queues waiters, so tokens go out in arrival order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def pause(self, seconds):
+        """Hold every request back for `seconds` (the server asked us to slow down)"""
+        if self.rate:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+class GazetteerScraper:
+    """Concurrent, cached and resumable walk of the gazetteer"""
+    
+    def __init__(self, base_url=BASE_URL, cache=None, concurrency=8, rate=5.0, burst=None,
+                 retries=3, timeout=30, max_age=None, refresh=False, checkpoint_path=None, resume=True):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self.max_age = max_age
+        self.refresh = refresh
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.rate = rate
+        self.burst = burst or concurrency
+        self.stats = dict.fromkeys(('fetched', 'cached', 'revalidated', 'resumed', 'retries', 'stale', 'failed'), 0)
+        self.pages = {}  # page key -> parsed rows, what the checkpoint holds
+        self.missing = []  # keys of pages that could not be fetched at all
+        self._parsed = 0
+    
+    def load_checkpoint(self):
+        if not (self.resume and self.checkpoint_path):
+            return
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return
+        if checkpoint.get('base_url') != self.base_url:
+            print(f"⚠️  {self.checkpoint_path} is for {checkpoint.get('base_url')}; starting over")
+            return
+        self.pages = checkpoint['pages']
+        print(f"Resuming from {self.checkpoint_path}: {len(self.pages):,} pages already parsed")
+    
+    def save_checkpoint(self):
+        if self.cache is not None:
+            self.cache.save()
+        if self.checkpoint_path:
+            checkpoint = {'base_url': self.base_url, 'pages': self.pages}
+            _write_atomic(self.checkpoint_path, json.dumps(checkpoint, ensure_ascii=False).encode('utf-8'))
+    
+    def _fresh(self, entry):
+        if self.refresh:
+            return False
+        return self.max_age is None or time.time() - entry['fetched'] < self.max_age
+    
+    async def fetch(self, session, key):
+        """
+        Body of a page: from the cache while fresh, otherwise over HTTP
+        (conditionally, if a copy is cached), retrying transient errors.
+        A stale copy is used if the server can't be reached; None if
+        there is none.
+        """
+        entry, cached = self.cache.get(key) if self.cache is not None else (None, None)
+        if cached is not None and self._fresh(entry):
+            self.stats['cached'] += 1
+            return cached
         
-        villages = []
-        rows = soup.find_all('tr')[2:]
+        headers = {}
+        if cached is not None:
+            if 'etag' in entry:
+                headers['If-None-Match'] = entry['etag']
+            if 'last-modified' in entry:
+                headers['If-Modified-Since'] = entry['last-modified']
         
-        for row in rows:
-            cols = row.find_all('td')
-            if len(cols) >= 3:
-                code = cols[1].text.strip()
-                khmer = cols[2].text.strip()
-                english = cols[3].text.strip()
-                
-                if code and english and 'Total' not in english:
-                    villages.append({
-                        'code': code,
-                        'khmer': khmer,
-                        'english': english
-                    })
+        url = f"{self.base_url}/{key}"
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats['retries'] += 1
+            retry_after = None
+            async with self.semaphore:
+                await self.bucket.acquire()
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        if response.status == 304 and cached is not None:
+                            self.cache.touch(key)
+                            self.stats['revalidated'] += 1
+                            return cached
+                        if response.status == 200:
+                            body = await response.read()
+                            if self.cache is not None:
+                                self.cache.put(key, body, response.headers)
+                            self.stats['fetched'] += 1
+                            return body
+                        error = f"HTTP {response.status}"
+                        if response.status not in RETRY_STATUSES:
+                            break
+                        retry_after = _retry_after(response.headers.get('Retry-After'))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = str(e) or type(e).__name__
+            
+            if attempt < self.retries:
+                if retry_after and self.bucket.rate:
+                    # The server asked everybody to wait, not just this request
+                    self.bucket.pause(retry_after)
+                elif retry_after:
+                    # No bucket to hold the others back; this request still waits
+                    await asyncio.sleep(retry_after)
+                else:
+                    await asyncio.sleep(0.5 * 2 ** attempt * random.uniform(0.5, 1.5))
         
-        return villages
-    except Exception as e:
-        print(f"Error scraping villages for {commune_code}: {e}")
-        return []
-
-def scrape_all_data():
-    """Scrape complete hierarchy"""
-    print("Scraping provinces...")
-    provinces = scrape_provinces()
-    print(f"Found {len(provinces)} provinces")
-    
-    for i, province in enumerate(provinces, 1):
-        print(f"\n[{i}/{len(provinces)}] Processing {province['english']}...")
+        if cached is not None:
+            self.stats['stale'] += 1
+            print(f"⚠️  {url}: {error}; using the cached copy")
+            return cached
+        self.stats['failed'] += 1
+        self.missing.append(key)
+        print(f"❌ {url}: {error}")
+        return None
+    
+    async def children(self, session, level=None, code=None):
+        """Rows listed on a page, each with an empty list for the level below it"""
+        key = page_key(level, code)
+        rows = self.pages.get(key)
+        if rows is not None:
+            self.stats['resumed'] += 1
+        else:
+            body = await self.fetch(session, key)
+            if body is None:
+                return []  # not checkpointed, so a resumed run tries it again
+            rows = self.pages[key] = parse_rows(body)
+            self._parsed += 1
+            if self._parsed % CHECKPOINT_EVERY == 0:
+                self.save_checkpoint()
         
-        districts = scrape_districts(province['code'])
-        province['districts'] = districts
-        print(f"  Found {len(districts)} districts")
+        child = CHILD_LEVEL[level]
+        return [dict(row, **{child: []}) if child else dict(row) for row in rows]
+    
+    async def fill(self, session, node, level):
+        """Fill node[level], and every level below it, down to the villages"""
+        node[level] = await self.children(session, level, node['code'])
+        child = CHILD_LEVEL[level]
+        if child:
+            await asyncio.gather(*(self.fill(session, item, child) for item in node[level]))
+    
+    async def run(self):
+        """The complete province list with districts, communes and villages"""
+        self.load_checkpoint()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.bucket = TokenBucket(self.rate, self.burst)
         
-        for j, district in enumerate(districts, 1):
-            print(f"  [{j}/{len(districts)}] Processing {district['english']}...")
-            
-            communes = scrape_communes(district['code'])
-            district['communes'] = communes
-            print(f"    Found {len(communes)} communes")
-            
-            for k, commune in enumerate(communes, 1):
-                villages = scrape_villages(commune['code'])
-                commune['villages'] = villages
-                if (k % 10) == 0:
-                    print(f"    Processed {k}/{len(communes)} communes...")
-                time.sleep(0.1)  # Be nice to the server
-            
-            time.sleep(0.2)
+        finished = False
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        try:
+            async with aiohttp.ClientSession(timeout=timeout, connector=connector,
+                                             headers={'User-Agent': USER_AGENT}) as session:
+                print("Scraping provinces...")
+                provinces = await self.children(session)
+                print(f"Found {len(provinces)} provinces")
+                done = 0
+                
+                async def province_tree(province):
+                    nonlocal done
+                    await self.fill(session, province, 'districts')
+                    done += 1
+                    communes = [c for d in province['districts'] for c in d['communes']]
+                    villages = sum(len(c['villages']) for c in communes)
+                    print(f"  ✓ [{done}/{len(provinces)}] {province['english']}: "
+                          f"{len(province['districts'])} districts, {len(communes)} communes, {villages} villages")
+                
+                await asyncio.gather(*(province_tree(province) for province in provinces))
+            finished = True
+        finally:
+            if finished and not self.missing:
+                if self.cache is not None:
+                    self.cache.save()
+                if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+                    os.remove(self.checkpoint_path)
+            else:
+                # Failed pages are not in the checkpoint, so the next run
+                # fetches just those and resumes the rest
+                self.save_checkpoint()
+                if self.checkpoint_path:
+                    print(f"\n💾 Progress saved to {self.checkpoint_path}; run again to resume")
         
-        # Save after each province
-        with open('cambodia_locations.json', 'w', encoding='utf-8') as f:
-            json.dump(provinces, f, ensure_ascii=False, indent=2)
-        print(f"  Saved progress for {province['english']}")
+        return provinces
+
+def scrape_all_data(output=OUTPUT_FILE, cache_dir=CACHE_DIR, checkpoint_path=None, **options):
+    """
+    Scrape complete hierarchy. Returns (provinces, keys of pages that could
+    not be fetched); when any are missing the output is incomplete and the
+    checkpoint is kept for the next run.
+    """
+    cache = ResponseCache(cache_dir) if cache_dir else None
+    if checkpoint_path is None:
+        checkpoint_path = os.path.splitext(output)[0] + '.checkpoint.json'
+    scraper = GazetteerScraper(cache=cache, checkpoint_path=checkpoint_path, **options)
+    
+    start = time.perf_counter()
+    provinces = asyncio.run(scraper.run())
+    elapsed = time.perf_counter() - start
+    
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(provinces, f, ensure_ascii=False, indent=2)
     
-    print("\n✓ Complete! Data saved to cambodia_locations.json")
-    return provinces
+    stats = scraper.stats
+    villages = sum(len(c['villages']) for p in provinces for d in p['districts'] for c in d['communes'])
+    if scraper.missing:
+        print(f"\n❌ Incomplete: {len(scraper.missing):,} pages failed; "
+              f"{villages:,} villages saved to {output} in {elapsed:.1f}s")
+    else:
+        print(f"\n✓ Complete! {villages:,} villages saved to {output} in {elapsed:.1f}s")
+    print(f"  Pages: {stats['fetched']:,} fetched, {stats['revalidated']:,} revalidated, "
+          f"{stats['cached']:,} from cache, {stats['resumed']:,} from checkpoint, "
+          f"{stats['retries']:,} retries, {stats['stale']:,} stale, {stats['failed']:,} failed")
+    if cache is not None:
+        print(f"  Cache: {len(cache):,} pages in {cache_dir}")
+    return provinces, scraper.missing
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape the NCDD gazetteer into a nested JSON file")
+    parser.add_argument('--output', default=OUTPUT_FILE, help="JSON output")
+    parser.add_argument('--base-url', default=BASE_URL, help="Gazetteer site (or a scrape_fixtures.py server)")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Response cache directory")
+    parser.add_argument('--no-cache', action='store_true', help="Neither read nor write the response cache")
+    parser.add_argument('--max-age', type=float, default=None,
+                        help="Revalidate cached pages older than this many days (default: never)")
+    parser.add_argument('--refresh', action='store_true', help="Revalidate every cached page")
+    parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight at once")
+    parser.add_argument('--rate', type=float, default=5.0, help="Requests per second (0 for no limit)")
+    parser.add_argument('--burst', type=int, default=None, help="Token bucket size (default: --concurrency)")
+    parser.add_argument('--retries', type=int, default=3, help="Retries of a failed request")
+    parser.add_argument('--timeout', type=float, default=30, help="Seconds per request")
+    parser.add_argument('--no-resume', action='store_true', help="Ignore the checkpoint of an interrupted run")
+    args = parser.parse_args()
+    
+    try:
+        _, missing = scrape_all_data(
+            output=args.output,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            base_url=args.base_url,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            burst=args.burst,
+            retries=args.retries,
+            timeout=args.timeout,
+            max_age=args.max_age * 86400 if args.max_age is not None else None,
+            refresh=args.refresh,
+            resume=not args.no_resume,
+        )
+    except KeyboardInterrupt:
+        print("Interrupted")
+        sys.exit(130)
+    if missing:
+        sys.exit(1)
 
 if __name__ == '__main__':
-    data = scrape_all_data()
+    main()
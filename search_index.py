@@ -0,0 +1,149 @@
+"""
+SQLite FTS5 name search index
+Trigram-tokenized shadow table over people(name, first_name, last_name),
+kept in sync with the people table by triggers so substring name searches
+use the index instead of scanning every row with LIKE '%...%'
+"""
+import sqlite3
+import time
+
+FTS_TABLE = 'people_fts'
+
+# The trigram tokenizer can only match terms of 3 or more characters
+MIN_TERM_LENGTH = 3
+
+CREATE_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, first_name, last_name,
+        content='people', content_rowid='id',
+        tokenize='trigram'
+    )
+"""
+
+CREATE_TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS people_fts_ai AFTER INSERT ON people BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, first_name, last_name)
+        VALUES (new.id, new.name, new.first_name, new.last_name);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS people_fts_ad AFTER DELETE ON people BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, first_name, last_name)
+        VALUES ('delete', old.id, old.name, old.first_name, old.last_name);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS people_fts_au AFTER UPDATE OF name, first_name, last_name ON people BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, first_name, last_name)
+        VALUES ('delete', old.id, old.name, old.first_name, old.last_name);
+        INSERT INTO {FTS_TABLE}(rowid, name, first_name, last_name)
+        VALUES (new.id, new.name, new.first_name, new.last_name);
+    END
+    """,
+]
+
+# SQL fragment for hand-built queries against the people table
+MATCH_SQL = f"id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)"
+
+_available = set()
+
+
+def match_expression(term):
+    """Build an FTS5 phrase query matching `term` as a substring, or None if too short"""
+    term = (term or '').strip()
+    if len(term) < MIN_TERM_LENGTH:
+        return None
+    return '"' + term.replace('"', '""') + '"'
+
+
+def has_search_index(conn, cache_key=None):
+    """Check whether the FTS table exists (positive results are cached per database)"""
+    if cache_key is not None and cache_key in _available:
+        return True
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    )
+    found = cursor.fetchone() is not None
+    if found and cache_key is not None:
+        _available.add(cache_key)
+    return found
+
+
+def name_filter_sql(conn, term, cache_key=None):
+    """
+    Return (sql, params) filtering people by name substring.
+    Uses the FTS index when available, falling back to LIKE for short terms.
+    """
+    expression = match_expression(term)
+    if expression and has_search_index(conn, cache_key):
+        return MATCH_SQL, [expression]
+    pattern = f"%{term}%"
+    return "(name LIKE ? OR first_name LIKE ? OR last_name LIKE ?)", [pattern, pattern, pattern]
+
+
+def create_search_index(conn, rebuild=False):
+    """Create the FTS table and sync triggers, populating it from people"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    )
+    exists = cursor.fetchone() is not None
+
+    cursor.execute(CREATE_TABLE_SQL)
+    for trigger_sql in CREATE_TRIGGERS_SQL:
+        cursor.execute(trigger_sql)
+
+    if rebuild or not exists:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    conn.commit()
+
+
+def index_people_after(conn, last_id):
+    """Add people with id > last_id to the index (after a bulk load without triggers)"""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        INSERT INTO {FTS_TABLE}(rowid, name, first_name, last_name)
+        SELECT id, name, first_name, last_name FROM people WHERE id > ?
+    """, (last_id,))
+    conn.commit()
+
+
+def drop_search_index(conn):
+    """Remove the FTS table and its triggers"""
+    cursor = conn.cursor()
+    for trigger in ('people_fts_ai', 'people_fts_ad', 'people_fts_au'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    conn.commit()
+    _available.clear()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the FTS5 name search index")
+    parser.add_argument('--db', default='instance/people.db', help="SQLite database path")
+    parser.add_argument('--rebuild', action='store_true', help="Repopulate the index from scratch")
+    parser.add_argument('--drop', action='store_true', help="Remove the index and its triggers")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.drop:
+            drop_search_index(conn)
+            print(f"✅ Dropped {FTS_TABLE}")
+            return
+
+        print(f"🔄 Building {FTS_TABLE} (trigram) on {args.db}...")
+        start = time.perf_counter()
+        create_search_index(conn, rebuild=args.rebuild)
+        elapsed = time.perf_counter() - start
+        print(f"✅ Search index ready in {elapsed:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Precomputed demographic aggregates
+people_stats holds one row per (province, district, commune, village,
+gender, age) with its head count. It is built in one GROUP BY pass and
+then kept current by triggers on people, so dashboards and counts never
+have to scan the full table. Location names are resolved once per row
+through the locations table (people only stores village_id)
+"""
+import sqlite3
+import time
+
+STATS_TABLE = 'people_stats'
+
+KEY_COLUMNS = ('province', 'district', 'commune', 'village', 'gender', 'age')
+
+CREATE_TABLE_SQL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+        id INTEGER PRIMARY KEY,
+        province VARCHAR(100) NOT NULL,
+        district VARCHAR(100) NOT NULL,
+        commune VARCHAR(100) NOT NULL,
+        village VARCHAR(100) NOT NULL,
+        gender VARCHAR(10) NOT NULL,
+        age INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_people_stats_key
+    ON {STATS_TABLE} (province, district, commune, village, gender, age)
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS idx_people_stats_gender_age
+    ON {STATS_TABLE} (gender, age)
+    """,
+]
+
+_INCREMENT = f"""
+        INSERT INTO {STATS_TABLE} (province, district, commune, village, gender, age, count)
+        SELECT province, district, commune, village, new.gender, new.age, 1
+        FROM locations WHERE id = new.village_id
+        ON CONFLICT (province, district, commune, village, gender, age)
+        DO UPDATE SET count = count + 1;
+"""
+
+_DECREMENT = f"""
+        UPDATE {STATS_TABLE} SET count = count - 1
+        WHERE (province, district, commune, village) =
+              (SELECT province, district, commune, village FROM locations WHERE id = old.village_id)
+          AND gender = old.gender AND age = old.age;
+"""
+
+CREATE_TRIGGERS_SQL = [
+    f"CREATE TRIGGER IF NOT EXISTS people_stats_ai AFTER INSERT ON people BEGIN {_INCREMENT} END",
+    f"CREATE TRIGGER IF NOT EXISTS people_stats_ad AFTER DELETE ON people BEGIN {_DECREMENT} END",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS people_stats_au
+    AFTER UPDATE OF village_id, gender, age ON people BEGIN
+        {_DECREMENT}
+        {_INCREMENT}
+    END
+    """,
+]
+
+TRIGGERS = ('people_stats_ai', 'people_stats_ad', 'people_stats_au')
+
+_built = set()
+
+
+def has_stats(conn, cache_key=None):
+    """
+    Check whether people_stats has been built. The maintenance triggers are
+    the marker: an empty table created by db.create_all() does not count.
+    """
+    if cache_key is not None and cache_key in _built:
+        return True
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (TRIGGERS[0],)
+    )
+    found = cursor.fetchone() is not None
+    if found and cache_key is not None:
+        _built.add(cache_key)
+    return found
+
+
+def build_stats(conn):
+    """(Re)build people_stats in one GROUP BY pass and install the triggers"""
+    cursor = conn.cursor()
+    # One transaction, so no insert can land between the snapshot and the
+    # triggers taking over
+    if not getattr(conn, 'in_transaction', True):
+        cursor.execute("BEGIN")
+    for statement in CREATE_TABLE_SQL:
+        cursor.execute(statement)
+
+    for trigger in TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute(f"DELETE FROM {STATS_TABLE}")
+    # Group on the integer key first, then attach the names
+    cursor.execute(f"""
+        INSERT INTO {STATS_TABLE} (province, district, commune, village, gender, age, count)
+        SELECT l.province, l.district, l.commune, l.village, g.gender, g.age, g.n
+        FROM (
+            SELECT village_id, gender, age, COUNT(*) AS n
+            FROM people
+            GROUP BY village_id, gender, age
+        ) g
+        JOIN locations l ON l.id = g.village_id
+    """)
+    install_triggers(conn)
+    conn.commit()
+
+
+def add_people_after(conn, last_id):
+    """Count people with id > last_id in (after a bulk load without triggers)"""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        INSERT INTO {STATS_TABLE} (province, district, commune, village, gender, age, count)
+        SELECT l.province, l.district, l.commune, l.village, g.gender, g.age, g.n
+        FROM (
+            SELECT village_id, gender, age, COUNT(*) AS n
+            FROM people
+            WHERE id > ?
+            GROUP BY village_id, gender, age
+        ) g
+        JOIN locations l ON l.id = g.village_id
+        WHERE true
+        ON CONFLICT (province, district, commune, village, gender, age)
+        DO UPDATE SET count = count + excluded.count
+    """, (last_id,))
+    conn.commit()
+
+
+def install_triggers(conn):
+    """(Re)create the maintenance triggers, e.g. after people is rebuilt"""
+    cursor = conn.cursor()
+    for statement in CREATE_TRIGGERS_SQL:
+        cursor.execute(statement)
+
+
+def drop_stats(conn):
+    """Remove the maintenance triggers and the aggregate rows"""
+    cursor = conn.cursor()
+    for trigger in TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute(f"DELETE FROM {STATS_TABLE}")
+    conn.commit()
+    _built.clear()
+
+
+def total_people(conn, province=None):
+    """Total head count (optionally for one province) from people_stats"""
+    cursor = conn.cursor()
+    if province:
+        cursor.execute(f"SELECT COALESCE(SUM(count), 0) FROM {STATS_TABLE} WHERE province = ?", (province,))
+    else:
+        cursor.execute(f"SELECT COALESCE(SUM(count), 0) FROM {STATS_TABLE}")
+    return cursor.fetchone()[0]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the people_stats aggregate table")
+    parser.add_argument('--db', default='instance/people.db', help="SQLite database path")
+    parser.add_argument('--drop', action='store_true', help="Remove the aggregates and triggers")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.drop:
+            drop_stats(conn)
+            print(f"✅ Dropped {STATS_TABLE} triggers and rows")
+            return
+
+        print(f"🔄 Building {STATS_TABLE} on {args.db}...")
+        start = time.perf_counter()
+        build_stats(conn)
+        elapsed = time.perf_counter() - start
+        groups = conn.execute(f"SELECT COUNT(*) FROM {STATS_TABLE}").fetchone()[0]
+        print(f"✅ {groups:,} groups covering {total_people(conn):,} people in {elapsed:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Tests for the buffered audit log writer (audit_log.py)
+"""
+import atexit
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+import audit_log
+import history_partitions
+import repository
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the audit writer"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = repository.SQLiteBackend(str(tmp_path / 'audit.db'))
+    with backend.connection() as conn:
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(80))")
+        conn.execute("INSERT INTO users (id, username) VALUES (1, 'admin')")
+        conn.commit()
+    yield backend
+    backend.close()
+
+
+def stored(backend):
+    with backend.connection() as conn:
+        return history_partitions.fetch(conn, 1000)
+
+
+def test_batches_by_size(backend):
+    writer = audit_log.AuditWriter(backend, batch_size=10, flush_interval=60)
+    for i in range(25):
+        writer.log(1, 'search', details=f"search {i}")
+    wait_for(lambda: writer.written == 20)
+    assert writer.batches == 2
+    time.sleep(0.05)
+    assert writer.written == 20
+
+    assert writer.flush(timeout=5)
+    assert (writer.written, writer.batches) == (25, 3)
+    assert [entry.details for entry in stored(backend)] == [f"search {i}" for i in reversed(range(25))]
+    writer.close()
+
+
+def test_flushes_after_interval(backend):
+    writer = audit_log.AuditWriter(backend, batch_size=100, flush_interval=0.05)
+    for _ in range(3):
+        writer.log(1, 'login')
+    wait_for(lambda: writer.written == 3)
+    assert writer.batches == 1
+    writer.close()
+
+
+def test_close_writes_the_rest_and_restarts(backend, monkeypatch):
+    hooks = []
+    monkeypatch.setattr(atexit, 'register', hooks.append)
+    writer = audit_log.AuditWriter(backend, batch_size=100, flush_interval=60)
+    writer.log(1, 'login')
+    writer.close()
+    assert writer.written == 1 and writer._thread is None
+
+    # Logging after close() starts the thread again, without a second exit hook
+    writer.log(1, 'logout')
+    writer.close()
+    assert writer.written == 2
+    assert hooks == [writer.close]
+    assert writer.flush() is True
+
+
+def test_rows_go_to_monthly_partitions(backend):
+    writer = audit_log.AuditWriter(backend)
+    writer.log(1, 'login', timestamp=datetime(2026, 9, 30, 23, 59))
+    writer.log(2, 'search', person_id=7, details='x', timestamp=datetime(2026, 10, 1, 0, 1))
+    writer.close()
+    with backend.connection() as conn:
+        september = conn.execute("SELECT id, user_id, action FROM edit_history_2026_09").fetchall()
+        october = conn.execute("SELECT id, user_id, person_id, details FROM edit_history_2026_10").fetchall()
+    assert september == [(202609 * history_partitions.ID_BLOCK + 1, 1, 'login')]
+    assert october == [(202610 * history_partitions.ID_BLOCK + 1, 2, 7, 'x')]
+
+
+class FailingBackend:
+    def __init__(self):
+        self.attempts = 0
+
+    @contextmanager
+    def connection(self):
+        self.attempts += 1
+        raise sqlite3.OperationalError("database is locked")
+        yield
+
+
+def test_gives_up_after_retries(capsys):
+    backend = FailingBackend()
+    writer = audit_log.AuditWriter(backend, batch_size=5, flush_interval=0.01)
+    for _ in range(5):
+        writer.log(1, 'search')
+    wait_for(lambda: writer.dropped == 5)
+    assert backend.attempts == audit_log.MAX_ATTEMPTS
+    assert writer.written == 0
+    writer.close()
+    assert 'giving up on 5 rows' in capsys.readouterr().out
+
+
+def test_failed_flush_and_rows_lost_at_close(capsys):
+    backend = FailingBackend()
+    writer = audit_log.AuditWriter(backend, batch_size=100, flush_interval=60)
+    writer.log(1, 'login')
+    writer.log(1, 'search')
+    assert writer.flush(timeout=5) is False
+    assert writer.dropped == 0
+
+    # Stopping retries the remaining attempts, then counts what is lost
+    assert writer.close() is True
+    assert backend.attempts == audit_log.MAX_ATTEMPTS
+    assert (writer.written, writer.dropped) == (0, 2)
+    assert 'giving up on 2 rows' in capsys.readouterr().out
+
+
+class BlockingBackend:
+    """Holds every write until `release` is set"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.release = threading.Event()
+
+    @contextmanager
+    def connection(self):
+        self.release.wait()
+        with self.backend.connection() as conn:
+            yield conn
+
+
+def test_no_second_writer_while_closing(backend):
+    blocking = BlockingBackend(backend)
+    writer = audit_log.AuditWriter(blocking, batch_size=1, flush_interval=60)
+    writer.log(1, 'login')
+    thread = writer._thread
+    assert writer.close(timeout=0.05) is False
+    assert writer._thread is thread and thread.is_alive()
+
+    # Rows logged meanwhile wait for close() instead of starting a thread
+    started = threading.active_count()
+    writer.log(1, 'logout')
+    assert writer._thread is thread and threading.active_count() == started
+
+    blocking.release.set()
+    assert writer.close() is True
+    assert writer._thread is None and not thread.is_alive()
+    assert [entry.action for entry in stored(backend)] == ['logout', 'login']
+
+
+def test_app_logs_actions(login):
+    client = login('admin')
+    client.get('/search/export?format=jsonl&name=Auditable').close()
+    # /history flushes the queue first, so both actions are listed
+    page = client.get('/history').get_data(as_text=True)
+    assert 'login' in page
+    assert "Exported search results as jsonl: {&#39;name&#39;: &#39;Auditable&#39;}" in page
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
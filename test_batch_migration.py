@@ -0,0 +1,137 @@
+"""
+Tests for the resumable batch migration runner (batch_migration.py)
+"""
+import sqlite3
+
+import pytest
+
+from batch_migration import BatchMigration
+
+# Ids with gaps, as left behind by deletes
+IDS = [i for i in range(1, 5001) if i % 7 and i % 11]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE people (id INTEGER PRIMARY KEY, gender TEXT, visits INTEGER DEFAULT 0)")
+    conn.executemany("INSERT INTO people (id, gender) VALUES (?, ?)",
+                     [(i, 'male' if i % 2 else 'female') for i in IDS])
+    conn.commit()
+    return conn
+
+
+def count_visit(cursor, rows):
+    cursor.executemany("UPDATE people SET visits = visits + 1 WHERE id = ?", [(row[0],) for row in rows])
+
+
+def interrupt_after(batches):
+    calls = []
+
+    def process(cursor, rows):
+        if len(calls) == batches:
+            # Half of this batch is written, then the process dies
+            count_visit(cursor, rows[:len(rows) // 2])
+            raise Interrupted
+        calls.append(len(rows))
+        count_visit(cursor, rows)
+    return process
+
+
+def visits(conn):
+    return dict(conn.execute("SELECT id, visits FROM people"))
+
+
+def test_runs_every_row_once(tmp_path):
+    conn = make_db(str(tmp_path / 'm.db'))
+    seen = []
+    migration = BatchMigration(conn, 'visits', lambda cursor, rows: seen.extend(rows) or count_visit(cursor, rows),
+                               columns=('id', 'gender'), batch_size=300, min_batch=100, report_every=60)
+    assert migration.run() == len(IDS)
+    assert [row[0] for row in seen] == IDS
+    assert seen[0] == (1, 'male')
+    assert set(visits(conn).values()) == {1}
+
+    last_id, max_id, rows_done, _, finished_at = migration.checkpoint()
+    assert (last_id, max_id, rows_done) == (IDS[-1], IDS[-1], len(IDS)) and finished_at
+
+    # Finished migrations are not run again until reset
+    assert migration.run() == 0
+    migration.reset()
+    assert migration.checkpoint() is None
+    assert migration.run() == len(IDS)
+    assert set(visits(conn).values()) == {2}
+
+
+def test_resume_after_interruption(tmp_path):
+    path = str(tmp_path / 'm.db')
+    conn = make_db(path)
+    migration = BatchMigration(conn, 'visits', interrupt_after(3), batch_size=500, min_batch=500,
+                               max_batch=500, report_every=60)
+    with pytest.raises(Interrupted):
+        migration.run()
+    conn.close()
+
+    # The interrupted batch was never committed; the first three were
+    conn = sqlite3.connect(path)
+    done = visits(conn)
+    assert sum(done.values()) == BatchMigration(conn, 'visits', None).checkpoint()[2]
+    assert {i for i, n in done.items() if n} == {i for i in IDS if i <= 1500}
+
+    migration = BatchMigration(conn, 'visits', count_visit, batch_size=500, report_every=60)
+    assert migration.run() == len(IDS) - sum(done.values())
+    assert set(visits(conn).values()) == {1}
+    conn.close()
+
+
+def test_repeatable_migration_starts_over(tmp_path):
+    path = str(tmp_path / 'm.db')
+    conn = make_db(path)
+    migration = BatchMigration(conn, 'visits', count_visit, batch_size=500, report_every=60, repeatable=True)
+    assert migration.run() == len(IDS)
+    assert migration.checkpoint() is None
+
+    # Rows added after the first run are rewritten by the second
+    conn.executemany("INSERT INTO people (id, gender) VALUES (?, 'male')", [(i,) for i in range(6000, 6100)])
+    conn.commit()
+    assert migration.run() == len(IDS) + 100
+    assert visits(conn)[6050] == 1 and visits(conn)[IDS[0]] == 2
+
+    # An interrupted run still resumes instead of starting over
+    interrupted = BatchMigration(conn, 'visits', interrupt_after(2), batch_size=500, min_batch=500,
+                                 max_batch=500, report_every=60, repeatable=True)
+    with pytest.raises(Interrupted):
+        interrupted.run()
+    conn.rollback()  # the process died with the half-written batch
+    done = interrupted.checkpoint()[2]
+    assert migration.run() == len(IDS) + 100 - done
+    assert visits(conn) == {i: 3 for i in IDS} | {i: 2 for i in range(6000, 6100)}
+
+    # A checkpoint recorded as finished by a one-shot run does not block it
+    BatchMigration(conn, 'visits', count_visit, report_every=60).run()
+    assert migration.run() == len(IDS) + 100
+
+
+def test_empty_table(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'm.db'))
+    conn.execute("CREATE TABLE people (id INTEGER PRIMARY KEY)")
+    migration = BatchMigration(conn, 'nothing', lambda cursor, rows: pytest.fail("no rows expected"))
+    assert migration.run() == 0
+    assert migration.checkpoint()[4] is not None
+
+
+def test_batch_size_tracks_target_latency():
+    migration = BatchMigration(None, 'sizes', None, target_seconds=0.5, min_batch=1000, max_batch=100000)
+    assert migration._next_batch_size(10000, 0.25) == 20000
+    assert migration._next_batch_size(10000, 5.0) == 5000
+    assert migration._next_batch_size(10000, 0.5) == 10000
+    assert migration._next_batch_size(80000, 0.01) == 100000
+    assert migration._next_batch_size(1500, 10.0) == 1000
+    assert migration._next_batch_size(60000, 0) == 100000
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
@@ -0,0 +1,95 @@
+"""
+Tests for the search benchmark (bench_search.py)
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bench_search
+import repository
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_server_timing():
+    assert bench_search.server_timing('app;dur=12.5, db;dur=3.2;desc="4 queries"') == (3.2, 4)
+    assert bench_search.server_timing('app;dur=12.5') == (None, None)
+    assert bench_search.server_timing(None) == (None, None)
+
+
+def test_summarize():
+    summary = bench_search.summarize([float(ms) for ms in range(20, 0, -1)])
+    assert summary == {'min_ms': 1.0, 'p50_ms': 10.5, 'p95_ms': 20.0, 'mean_ms': 10.5}
+
+
+def test_catalog_is_resolved_from_the_dataset(db_path):
+    catalog = bench_search.resolve_catalog(db_path)
+    assert [case[0] for case in catalog] == [case[0] for case in bench_search.CATALOG]
+    for name, user, filters in catalog:
+        assert not any(value.startswith('<') for value in filters.values()), name
+    assert bench_search.resolve_catalog(db_path) == catalog
+
+
+def test_sql_bench_counts_match_the_repository(db_path):
+    catalog = [case for case in bench_search.resolve_catalog(db_path)
+               if case[0] in ('name_gender', 'manager_all', 'deep_page_gender', 'no_match')]
+    results = bench_search.bench_sql(db_path, catalog, 'Kampong Cham', repeat=2)
+
+    people = repository.PeopleRepository(repository.SQLiteBackend(db_path, read_only=True))
+    for name, user, filters in catalog:
+        filters = dict(filters)
+        filters.pop('after_id', None)
+        parsed = repository.normalize_filters(filters, manager_province='Kampong Cham' if user == 'manager' else None)
+        assert results[name]['matches'] == people.count(parsed), name
+        assert results[name]['min_ms'] <= results[name]['p50_ms'] <= results[name]['p95_ms']
+    assert results['no_match'] == dict(results['no_match'], page_rows=0, matches=0)
+    people.backend.close()
+
+
+def test_compare(tmp_path, capsys):
+    cases = {'a': {'user': 'admin', 'filters': {}}, 'b': {'user': 'admin', 'filters': {'age': '35'}},
+             'c': {'user': 'admin', 'filters': {}}}
+    baseline = {'meta': {'rows': 10, 'revision': 'abc1234'}, 'cases': dict(cases, c={'user': 'manager'}),
+                'sql': {'a': {'p50_ms': 10.0, 'matches': 5}, 'b': {'p50_ms': 10.0, 'matches': 5},
+                        'c': {'p50_ms': 1.0, 'matches': 5}}}
+    path = tmp_path / 'baseline.json'
+    path.write_text(json.dumps(baseline))
+    current = {'cases': cases, 'sql': {'a': {'p50_ms': 11.0, 'matches': 5}, 'b': {'p50_ms': 15.0, 'matches': 6},
+                                        'c': {'p50_ms': 100.0, 'matches': 5}}}
+
+    # b is slower and finds a different number of rows; c changed and is skipped
+    assert bench_search.compare(current, str(path), threshold=20) == 2
+    out = capsys.readouterr().out
+    assert 'abc1234' in out and 'case changed, not compared' in out
+    assert bench_search.compare(current, str(path), threshold=60) == 1
+
+
+def test_end_to_end(tmp_path):
+    data_dir = tmp_path / 'bench_data'
+    command = [sys.executable, os.path.join(HERE, 'bench_search.py'), '--rows', '400', '--repeat', '1',
+               '--data-dir', str(data_dir)]
+    # Run from the repo, where the gazetteer files are
+    first = subprocess.run(command, cwd=HERE, capture_output=True, text=True, timeout=300)
+    assert first.returncode == 0, first.stdout + first.stderr
+    with open(data_dir / 'bench_search_400.json', encoding='utf-8') as f:
+        results = json.load(f)
+    assert results['meta']['rows'] == 400 and results['meta']['seed'] == 42
+    assert set(results['client']) == set(results['sql']) == set(results['cases'])
+    assert results['sql']['all_first_page']['matches'] == 400
+    assert all('statements' in result for result in results['client'].values())
+
+    # A second run reuses the dataset and compares against the first
+    second = subprocess.run(command + ['--skip-client', '--output', str(tmp_path / 'second.json'),
+                                       '--compare', str(data_dir / 'bench_search_400.json'),
+                                       '--threshold', '100000'],
+                            cwd=HERE, capture_output=True, text=True, timeout=300)
+    assert second.returncode == 0, second.stdout + second.stderr
+    assert 'regenerating' not in second.stdout and 'No regressions' in second.stdout
+    assert not os.path.exists(os.path.join(HERE, 'bench_data'))
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
@@ -0,0 +1,139 @@
+"""
+Tests for the columnar (Parquet) snapshots of people (columnar.py)
+"""
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import columnar
+
+ENGINES = ['pyarrow', pytest.param('duckdb', marks=pytest.mark.skipif(columnar.duckdb is None,
+                                                                        reason="duckdb is not installed"))]
+
+QUERIES = [
+    ((), {}, None, None),
+    (('gender',), {}, None, None),
+    (('age', 'gender'), {}, 20, 29),
+    (('province', 'district', 'commune', 'gender'), {}, None, None),
+    (('age',), {'province': 'Kampong Cham'}, None, None),
+    (('village',), {'province': 'Kampot', 'gender': 'female'}, 30, None),
+    ((), {'province': 'Kampot', 'age': 40}, None, None),
+    (('gender',), {'province': 'Nowhere'}, None, None),
+]
+
+
+def sqlite_aggregate(db_path, group_by, filters, min_age, max_age):
+    """The same aggregate written out against people_view"""
+    conditions, params = [], []
+    for key, value in filters.items():
+        conditions.append(f"{key} = ?")
+        params.append(value)
+    if min_age is not None:
+        conditions.append("age >= ?")
+        params.append(min_age)
+    if max_age is not None:
+        conditions.append("age <= ?")
+        params.append(max_age)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    conn = sqlite3.connect(db_path)
+    try:
+        if not group_by:
+            return conn.execute(f"SELECT COUNT(*) FROM people_view {where}", params).fetchone()[0], []
+        columns = ', '.join(group_by)
+        rows = conn.execute(f"SELECT {columns}, COUNT(*) FROM people_view {where} "
+                            f"GROUP BY {columns} ORDER BY {columns}", params).fetchall()
+    finally:
+        conn.close()
+    groups = [dict(zip(group_by, row[:-1]), count=row[-1]) for row in rows]
+    return sum(group['count'] for group in groups), groups
+
+
+@pytest.fixture(scope='module')
+def snapshot_dir(db_path, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('columnar') / 'snapshot')
+    # Small batches and row groups, so provinces span several of each
+    columnar.build_snapshot(db_path, path, batch_size=700, row_group_size=300)
+    return path
+
+
+def test_manifest(db_path, snapshot_dir):
+    snapshot = columnar.Snapshot(snapshot_dir, engine='pyarrow')
+    conn = sqlite3.connect(db_path)
+    provinces = dict(conn.execute("SELECT province, COUNT(*) FROM people_view GROUP BY province"))
+    total, max_id = conn.execute("SELECT COUNT(*), MAX(id) FROM people").fetchone()
+    conn.close()
+
+    manifest = snapshot.manifest
+    assert manifest['rows'] == total and manifest['max_id'] == max_id
+    assert {province: entry['rows'] for province, entry in manifest['files'].items()} == provinces
+    assert sorted(os.listdir(snapshot_dir)) == sorted([columnar.MANIFEST] +
+                                                      [entry['file'] for entry in manifest['files'].values()])
+    assert columnar.has_snapshot(snapshot_dir)
+    assert snapshot.files('Kampot') == [os.path.join(snapshot_dir, 'kampot.parquet')]
+    assert snapshot.files('Nowhere') == []
+
+
+def test_file_names():
+    assert columnar._file_name('Kampong Cham') == 'kampong_cham.parquet'
+    assert columnar._file_name('Preah Sihanouk (Kampong Som)') == 'preah_sihanouk_kampong_som.parquet'
+    assert columnar._file_name('???') == 'unknown.parquet'
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('group_by, filters, min_age, max_age', QUERIES)
+def test_aggregate_matches_sqlite(db_path, snapshot_dir, engine, group_by, filters, min_age, max_age):
+    snapshot = columnar.Snapshot(snapshot_dir, engine=engine)
+    assert snapshot.aggregate(group_by, filters, min_age, max_age) == \
+        sqlite_aggregate(db_path, group_by, filters, min_age, max_age)
+
+
+def test_invalid_group_by(snapshot_dir):
+    with pytest.raises(ValueError):
+        columnar.Snapshot(snapshot_dir, engine='pyarrow').aggregate(['name'])
+
+
+def test_rebuild_replaces_the_snapshot(db_copy, tmp_path):
+    path = db_copy()
+    out_dir = str(tmp_path / 'snapshot')
+    columnar.build_snapshot(path, out_dir)
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM people WHERE id % 2 = 0")
+    remaining = conn.execute("SELECT COUNT(*) FROM people").fetchone()[0]
+    conn.commit()
+    conn.close()
+
+    manifest = columnar.build_snapshot(path, out_dir)
+    assert manifest['rows'] == remaining
+    assert columnar.Snapshot(out_dir, engine='pyarrow').aggregate()[0] == remaining
+    # The .tmp and .old directories of the swap are gone
+    assert [name for name in os.listdir(tmp_path) if name.startswith('snapshot')] == ['snapshot']
+
+
+def test_api_stats_from_snapshot(app, login, db_path):
+    out_dir = app.config['COLUMNAR_SNAPSHOT_DIR']
+    admin = login('admin')
+    assert admin.get('/api/stats?source=columnar').status_code == 503
+
+    columnar.build_snapshot(db_path, out_dir)
+    try:
+        for query in ('group_by=province,gender', 'group_by=age&province=Kampot&min_age=30&max_age=39', ''):
+            columnar_result = admin.get(f'/api/stats?source=columnar&{query}').get_json()
+            assert columnar_result == admin.get(f'/api/stats?{query}').get_json()
+        assert admin.get('/api/stats?source=columnar&group_by=name').status_code == 400
+
+        manager = login('kampong_cham')
+        own = manager.get('/api/stats?source=columnar&group_by=province').get_json()
+        assert own == manager.get('/api/stats?group_by=province').get_json()
+        assert [group['province'] for group in own['groups']] == ['Kampong Cham']
+        assert manager.get('/api/stats?source=columnar&province=Battambang').get_json() == \
+            {'total': 0, 'groups': []}
+    finally:
+        shutil.rmtree(out_dir)
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
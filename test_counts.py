@@ -0,0 +1,146 @@
+"""
+Tests for search result counting (counts.py)
+"""
+import sqlite3
+import time
+
+import pytest
+
+import counts
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    counts.invalidate()
+    yield
+    counts.invalidate()
+
+
+def test_cache_ttl_and_lru():
+    cache = counts.CountCache(ttl=60, max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None and cache.get('c') == 3
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    cache.ttl = 0.01
+    cache.set('d', 4)
+    time.sleep(0.02)
+    assert cache.get('d') is None
+
+    cache.invalidate()
+    assert cache.get('a') is None
+    assert cache.get_or_compute('e', lambda: 5) == 5
+    assert cache.get_or_compute('e', lambda: 6) == 5
+
+
+def test_invalidate_reaches_every_cache(tmp_path):
+    import repository
+    people = repository.PeopleRepository(repository.SQLiteBackend(str(tmp_path / 'people.db')))
+    desktop = counts.CountCache(ttl=300)
+    for cache in (counts._cache, people.count_cache, desktop):
+        cache.set('key', 1)
+    counts.invalidate()
+    assert [cache.get('key') for cache in (counts._cache, people.count_cache, desktop)] == [None] * 3
+
+
+def test_filter_key():
+    assert counts.filter_key({'gender': 'male', 'name': '', 'age': None, 'province': 'Kep'}) == \
+        counts.filter_key({'province': 'Kep', 'gender': 'male'})
+    assert counts.is_aggregate_filter({'province': 'Kep', 'age': 30, 'name': ''})
+    assert not counts.is_aggregate_filter({'province': 'Kep', 'name': 'Sok'})
+
+
+def test_round_estimate():
+    assert counts._round_estimate(87) == 87
+    assert counts._round_estimate(1234) == 1200
+    assert counts._round_estimate(9876543) == 9900000
+
+
+def sql_count(db_path, where, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM people_view WHERE {where}", params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('query, where, params', [
+    ('name=Sok', "name LIKE ? OR first_name LIKE ? OR last_name LIKE ?", ('%Sok%',) * 3),
+    ('name=ok', "name LIKE ? OR first_name LIKE ? OR last_name LIKE ?", ('%ok%',) * 3),
+    ('province=Kampong&gender=female', "province LIKE ? AND gender = ?", ('%Kampong%', 'female')),
+    ('age=40', "age = ?", (40,)),
+])
+def test_exact_counts(login, db_path, query, where, params):
+    data = login('admin').get(f'/api/search/count?{query}').get_json()
+    assert data == {'count': sql_count(db_path, where, params), 'exact': True}
+
+
+def test_counts_with_and_without_fts(app, db_path):
+    """The same name search counted through the FTS index and through LIKE"""
+    from models import db, Person
+    import search_index
+    filters = {'name': 'Chan', 'gender': 'male'}
+    pattern = '%Chan%'
+    fts_ids = db.text(f"SELECT rowid FROM {search_index.FTS_TABLE} "
+                      f"WHERE {search_index.FTS_TABLE} MATCH '\"Chan\"'")
+    with app.app_context():
+        with_fts = counts.count_results(
+            Person.query.filter(Person.id.in_(fts_ids), Person.gender == 'male'),
+            filters, Person.id, exact=True)
+        counts.invalidate()
+        without_fts = counts.count_results(
+            Person.query.filter(Person.name.like(pattern) | Person.first_name.like(pattern)
+                                | Person.last_name.like(pattern), Person.gender == 'male'),
+            filters, Person.id, exact=True)
+    assert with_fts == without_fts
+    assert with_fts.value == sql_count(db_path, "(name LIKE ? OR first_name LIKE ? OR last_name LIKE ?) "
+                                                "AND gender = 'male'", (pattern,) * 3)
+
+
+def test_counts_are_cached(app):
+    from models import Person
+    with app.app_context():
+        filters = {'gender': 'female', 'name': 'Sok'}
+        query = Person.query.filter(Person.gender == 'female', Person.name.like('%Sok%'))
+        first = counts.count_results(query, filters, Person.id, exact=True)
+        # A cached count is returned whatever query comes with the same filters
+        second = counts.count_results(Person.query, filters, Person.id)
+        assert second == first
+        counts.invalidate()
+        assert counts.count_results(Person.query, filters, Person.id, exact=True) != first
+
+
+def test_aggregate_source_matches_count(app, db_path):
+    """Location/gender/age filters are answered from people_stats"""
+    from models import Person
+    with app.app_context():
+        filters = {'province': 'Kampong', 'gender': 'male', 'age': None}
+        calls = []
+        source = counts._aggregate_source
+        counts.set_aggregate_source(lambda f: calls.append(f) or source(f))
+        try:
+            result = counts.count_results(Person.query, filters, Person.id)
+        finally:
+            counts.set_aggregate_source(source)
+    assert calls and result.exact
+    assert result.value == sql_count(db_path, "province LIKE ? AND gender = ?", ('%Kampong%', 'male'))
+
+
+def test_estimate_above_threshold(app):
+    from models import Person
+    with app.app_context():
+        filters = {'name': 'a'}
+        query = Person.query.filter(Person.name.like('%a%'))
+        exact = query.count()
+        estimate = counts.count_results(query, filters, Person.id, estimate_threshold=100)
+        assert not estimate.exact
+        assert abs(estimate.value - exact) < exact * 0.25
+        # Estimates are not cached
+        assert counts.count_results(query, filters, Person.id, exact=True).value == exact
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
@@ -0,0 +1,141 @@
+"""
+Tests for the NumPy people generator and the multi-process pipeline
+(data_generator.py)
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import data_generator
+import search_index
+import stats
+from conftest import PEOPLE, SEED
+from khmer_names import FEMALE_FIRST_NAMES, KHMER_SURNAMES, MALE_FIRST_NAMES
+
+CREATED_AT = '2024-01-01 00:00:00.000000'
+VILLAGES = np.array([1010101, 1010102, 2020201, 2020202], dtype=np.int64)
+
+
+def batch(seed, size=2000, village_ids=VILLAGES):
+    return data_generator.make_batch(np.random.default_rng(seed), size, village_ids, CREATED_AT)
+
+
+def test_rows_are_valid():
+    rows = batch(1)
+    assert len(rows) == 2000
+    for name, first, last, gender, age, village_id, created_at in rows:
+        assert name == f"{first} {last}"
+        assert first in (MALE_FIRST_NAMES if gender == 'male' else FEMALE_FIRST_NAMES)
+        assert last in KHMER_SURNAMES
+        assert 15 <= age <= 60
+        assert village_id in VILLAGES
+        assert created_at == CREATED_AT
+    genders = [row[3] for row in rows]
+    assert 800 < genders.count('male') < 1200
+    assert {row[4] for row in rows} == set(range(15, 61))
+
+
+def test_seed_is_reproducible():
+    assert batch(42) == batch(42)
+    assert batch(42) != batch(43)
+    # Plain Python values, ready for sqlite3
+    assert all(type(value) in (str, int) for value in batch(7, size=5)[0])
+
+
+def test_generated_database_matches_seed(db_path):
+    """generate_people_fast(seed=...) inserts exactly the rows make_batch draws"""
+    conn = sqlite3.connect(db_path)
+    village_ids = np.array([row[0] for row in conn.execute("SELECT id FROM locations")], dtype=np.int64)
+    stored = conn.execute("""
+        SELECT name, first_name, last_name, gender, age, village_id FROM people ORDER BY id
+    """).fetchall()
+    conn.close()
+
+    rng = np.random.default_rng(SEED)
+    expected = []
+    for start in range(0, PEOPLE, 1000):
+        expected += [row[:6] for row in data_generator.make_batch(rng, 1000, village_ids, CREATED_AT)]
+    assert stored == expected
+
+
+def run_generator(db_file, *args):
+    env = dict(os.environ, DATABASE_URI=f"sqlite:///{db_file}",
+               PERF_SLOW_QUERY_LOG=os.path.join(os.path.dirname(db_file), 'slow_queries.log'))
+    result = subprocess.run([sys.executable, 'data_generator.py', *args], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def people_schema(conn):
+    return sorted(conn.execute("SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'people'"))
+
+
+def test_fast_load_catches_up(tmp_path):
+    """The single-process load also runs without triggers, then fills FTS and people_stats"""
+    db_file = str(tmp_path / 'people.db')
+    run_generator(db_file, '--rows', '500', '--seed', '1')
+    conn = sqlite3.connect(db_file)
+    search_index.create_search_index(conn)
+    stats.build_stats(conn)
+    schema = people_schema(conn)
+    conn.close()
+
+    out = run_generator(db_file, '--rows', '2000', '--batch-size', '700', '--seed', '3')
+    assert 'Generated 2,000 people' in out and 'Indexing new names' in out
+
+    conn = sqlite3.connect(db_file)
+    assert people_schema(conn) == schema
+    assert conn.execute("SELECT SUM(count) FROM people_stats").fetchone()[0] == 2500
+    sql, params = search_index.name_filter_sql(conn, 'Sok')
+    assert conn.execute(f"SELECT COUNT(*) FROM people WHERE {sql}", params).fetchone()[0] == \
+        conn.execute("SELECT COUNT(*) FROM people WHERE name LIKE '%Sok%'").fetchone()[0]
+    conn.close()
+
+
+def test_parallel_pipeline(tmp_path):
+    """Worker processes feed one writer; indexes, FTS and people_stats end up as before"""
+    db_file = str(tmp_path / 'people.db')
+    run_generator(db_file, '--rows', '500', '--seed', '1')
+    conn = sqlite3.connect(db_file)
+    search_index.create_search_index(conn)
+    stats.build_stats(conn)
+    schema = people_schema(conn)
+    conn.close()
+
+    out = run_generator(db_file, '--rows', '3001', '--workers', '2', '--batch-size', '700', '--seed', '9')
+    assert 'Generated 3,001 people' in out and 'Bottleneck:' in out
+
+    conn = sqlite3.connect(db_file)
+    assert conn.execute("SELECT COUNT(*) FROM people").fetchone()[0] == 3501
+    assert people_schema(conn) == schema
+
+    # The rows are the ones each shard's (seed, shard) generator draws
+    village_ids = np.array([row[0] for row in conn.execute("SELECT id FROM locations")], dtype=np.int64)
+    expected = []
+    for shard, rows in enumerate((1501, 1500)):
+        rng = np.random.default_rng([9, shard])
+        for start in range(0, rows, 700):
+            expected += [row[:6] for row in data_generator.make_batch(
+                rng, min(700, rows - start), village_ids, CREATED_AT)]
+    stored = conn.execute("""
+        SELECT name, first_name, last_name, gender, age, village_id FROM people WHERE id > 500
+    """).fetchall()
+    assert sorted(stored) == sorted(expected)
+
+    # Triggers were off during the load; the new rows were caught up afterwards
+    assert conn.execute("SELECT SUM(count) FROM people_stats").fetchone()[0] == 3501
+    sql, params = search_index.name_filter_sql(conn, 'Sok')
+    assert conn.execute(f"SELECT COUNT(*) FROM people WHERE {sql}", params).fetchone()[0] == \
+        conn.execute("SELECT COUNT(*) FROM people WHERE name LIKE '%Sok%'").fetchone()[0]
+    conn.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
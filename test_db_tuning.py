@@ -0,0 +1,63 @@
+"""
+Tests for the per-connection SQLite PRAGMAs (db_tuning.py)
+"""
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import db_tuning
+from config import Config
+
+PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -2000,
+           'temp_store': 'MEMORY', 'busy_timeout': 1234, 'mmap_size': None}
+
+
+def test_pragma_statements():
+    assert db_tuning.pragma_statements(PRAGMAS) == [
+        'PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL', 'PRAGMA cache_size=-2000',
+        'PRAGMA temp_store=MEMORY', 'PRAGMA busy_timeout=1234',
+    ]
+
+
+def read_pragmas(execute):
+    return {name: execute(f"PRAGMA {name}") for name in
+            ('journal_mode', 'synchronous', 'cache_size', 'temp_store', 'busy_timeout')}
+
+
+# PRAGMA values as SQLite reports them back
+EXPECTED = {'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -2000,
+            'temp_store': 2, 'busy_timeout': 1234}
+
+
+def test_apply_pragmas(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'tuned.db'))
+    db_tuning.apply_pragmas(conn, PRAGMAS)
+    assert read_pragmas(lambda sql: conn.execute(sql).fetchone()[0]) == EXPECTED
+    conn.close()
+
+
+def test_install_tunes_every_pooled_connection(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}", pool_size=2, max_overflow=0)
+    db_tuning.install(engine, PRAGMAS)
+    connections = [engine.connect() for _ in range(2)]
+    try:
+        for connection in connections:
+            assert read_pragmas(lambda sql: connection.execute(text(sql)).scalar()) == EXPECTED
+    finally:
+        for connection in connections:
+            connection.close()
+        engine.dispose()
+
+
+def test_app_engine_is_tuned(app):
+    from models import db
+    with app.app_context():
+        connection = db.session.connection()
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == Config.SQLITE_PRAGMAS['cache_size']
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == Config.SQLITE_PRAGMAS['busy_timeout']
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
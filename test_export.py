@@ -0,0 +1,113 @@
+"""
+Tests for the streamed /search/export and the province managers'
+restriction on /search, /search/export and /api/stats
+"""
+import csv
+import io
+import json
+import re
+import sqlite3
+
+import pytest
+
+import repository
+
+
+def expected_rows(db_path, search, manager_province=None):
+    people = repository.PeopleRepository(repository.SQLiteBackend(db_path, read_only=True))
+    try:
+        return list(people.iter_rows(repository.normalize_filters(search, manager_province=manager_province)))
+    finally:
+        people.backend.close()
+
+
+def province_ids(db_path, province):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {row[0] for row in conn.execute("SELECT id FROM people_view WHERE province = ?", (province,))}
+    finally:
+        conn.close()
+
+
+def read_csv(data):
+    rows = list(csv.reader(io.StringIO(data)))
+    assert rows[0] == list(repository.RESULT_COLUMNS)
+    return rows[1:]
+
+
+@pytest.fixture
+def small_batches(app, monkeypatch):
+    # Several keyset batches even for small exports
+    monkeypatch.setitem(app.config, 'EXPORT_BATCH_SIZE', 97)
+
+
+def test_export_chunks():
+    import app as app_module
+    rows = [(i, f"Name {i}", 'male', 30, 'P', 'D', 'C', 'V') for i in range(5)]
+    chunks = list(app_module.export_chunks(iter(rows), 'jsonl', rows_per_chunk=2))
+    assert len(chunks) == 3
+    lines = ''.join(chunks).splitlines()
+    assert [json.loads(line)['id'] for line in lines] == list(range(5))
+    assert list(app_module.export_chunks(iter([]), 'csv')) == [','.join(repository.RESULT_COLUMNS) + '\r\n']
+
+
+@pytest.mark.parametrize('search', [{'gender': 'female'}, {'name': 'Chan', 'age': '40'}, {'name': 'zzqx'}])
+def test_csv_export(login, db_path, small_batches, search):
+    response = login('admin').get('/search/export', query_string=dict(search, format='csv'))
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    assert re.match(r'attachment; filename="people_export_\d{8}_\d{6}\.csv"',
+                    response.headers['Content-Disposition'])
+    expected = expected_rows(db_path, search)
+    assert read_csv(response.get_data(as_text=True)) == [[str(value) for value in row] for row in expected]
+
+
+def test_jsonl_export(login, db_path, small_batches):
+    response = login('admin').get('/search/export?format=jsonl&province=Kampot')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    expected = expected_rows(db_path, {'province': 'Kampot'})
+    assert len(expected) > 97
+    assert [json.loads(line) for line in lines] == [dict(zip(repository.RESULT_COLUMNS, row)) for row in expected]
+
+
+def test_unknown_format(login):
+    response = login('admin').get('/search/export?format=xlsx')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Unknown format: xlsx'}
+
+
+def test_manager_export_is_restricted(login, db_path, small_batches):
+    client = login('kampong_cham')
+    own = province_ids(db_path, 'Kampong Cham')
+    rows = read_csv(client.get('/search/export?format=csv').get_data(as_text=True))
+    assert {int(row[0]) for row in rows} == own
+    assert {row[4] for row in rows} == {'Kampong Cham'}
+
+    # Another province gives nothing; a partial name matching others stays inside their own
+    assert read_csv(client.get('/search/export?format=csv&province=Battambang').get_data(as_text=True)) == []
+    rows = read_csv(client.get('/search/export?format=csv&province=Kampong').get_data(as_text=True))
+    assert {int(row[0]) for row in rows} == own
+
+
+@pytest.mark.parametrize('query', ['', 'province=Kampong', 'gender=female', 'province=Battambang'])
+def test_manager_search_is_restricted(login, db_path, query):
+    own = province_ids(db_path, 'Kampong Cham')
+    page = login('kampong_cham').get(f'/search?{query}').get_data(as_text=True)
+    ids = {int(person_id) for person_id in re.findall(r'#(\d+)</strong>', page)}
+    assert ids <= own
+    assert bool(ids) == (query != 'province=Battambang')
+
+
+def test_manager_stats_are_restricted(login, db_path):
+    own = len(province_ids(db_path, 'Kampong Cham'))
+    client = login('kampong_cham')
+    assert client.get('/api/stats').get_json()['total'] == own
+    assert client.get('/api/stats?province=Kampong Cham').get_json()['total'] == own
+    # Stats match locations exactly, unlike the search filters
+    assert client.get('/api/stats?province=Kampong').get_json()['total'] == 0
+    assert client.get('/api/stats?province=Battambang').get_json()['total'] == 0
+    assert login('admin').get('/api/stats').get_json()['total'] > own
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
@@ -0,0 +1,75 @@
+"""
+Tests for the Khmer name rewrites in fast_update_khmer_names.py
+The set-based SQL path must pick exactly the names its hash formula
+selects, for any seed
+"""
+import sqlite3
+
+import pytest
+
+import fast_update_khmer_names as fast
+
+MALE = ['Dara', 'Sokha', 'Virak']
+FEMALE = ['Bopha', 'Chantrea']
+SURNAMES = ['Sok', 'Chan', 'Chea', 'Kim']
+
+
+def expected_name(person_id, gender, seed):
+    """Python version of FIRST_NAME_HASH / SURNAME_HASH"""
+    value = (person_id + seed % fast.HASH_INPUT_MODULUS) % fast.HASH_INPUT_MODULUS
+    first_pool = MALE if gender == 'male' else FEMALE
+    first = first_pool[((value * 2654435761) % 2 ** 32 >> 16) % len(first_pool)]
+    surname = SURNAMES[((value * 2246822519) % 2 ** 32 >> 16) % len(SURNAMES)]
+    return f"{first} {surname}"
+
+
+def name_indexes(conn):
+    return sorted(conn.execute("SELECT name, sql FROM sqlite_master "
+                               "WHERE type = 'index' AND tbl_name = 'people' AND sql IS NOT NULL"))
+
+
+@pytest.mark.parametrize('seed', [0, 12345, 2 ** 31 - 1, 2 ** 40 + 17, 2 ** 63 - 1, -5])
+def test_sql_rewrite_matches_hash(db_copy, seed):
+    conn = sqlite3.connect(db_copy())
+    indexes = name_indexes(conn)
+    total = conn.execute("SELECT COUNT(*) FROM people").fetchone()[0]
+
+    assert fast.update_names_sql(conn, MALE, FEMALE, SURNAMES, seed=seed) == total
+    rows = conn.execute("SELECT id, gender, name FROM people").fetchall()
+    assert all(name == expected_name(person_id, gender, seed) for person_id, gender, name in rows)
+    # Every pool entry is used, not just the first few
+    assert {name.split()[0] for _, _, name in rows} == set(MALE + FEMALE)
+    assert {name.split()[1] for _, _, name in rows} == set(SURNAMES)
+
+    # The dropped name indexes are back and the temp tables gone
+    assert name_indexes(conn) == indexes
+    assert not conn.execute("SELECT name FROM temp.sqlite_master WHERE type = 'table'").fetchall()
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+    conn.close()
+
+
+def test_sql_rewrite_keeps_fts_in_sync(db_copy):
+    import search_index
+    conn = sqlite3.connect(db_copy())
+    fast.update_names_sql(conn, MALE, FEMALE, SURNAMES, seed=99)
+    sql, params = search_index.name_filter_sql(conn, 'Chantrea')
+    assert conn.execute(f"SELECT COUNT(*) FROM people WHERE {sql}", params).fetchone()[0] == \
+        conn.execute("SELECT COUNT(*) FROM people WHERE name LIKE 'Chantrea %'").fetchone()[0] > 0
+    conn.close()
+
+
+def test_python_rewrite(db_copy):
+    conn = sqlite3.connect(db_copy())
+    total = conn.execute("SELECT COUNT(*) FROM people").fetchone()[0]
+    assert fast.update_names_python(conn, MALE, FEMALE, SURNAMES) == total
+    for gender, name in conn.execute("SELECT gender, name FROM people"):
+        first, surname = name.split()
+        assert first in (MALE if gender == 'male' else FEMALE) and surname in SURNAMES
+    # A completed rewrite leaves no checkpoint behind: the next run covers every row again
+    assert fast.update_names_python(conn, MALE, FEMALE, SURNAMES) == total
+    assert fast.update_names_python(conn, MALE, FEMALE, SURNAMES, restart=True) == total
+    conn.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
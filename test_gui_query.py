@@ -0,0 +1,194 @@
+"""
+Tests for the desktop GUIs' background query worker and lazily fetched
+table model (gui_query.py), run headless on Qt's offscreen platform
+"""
+import os
+import time
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtCore = pytest.importorskip('PyQt6.QtCore')
+
+import gui_query
+import repository
+
+# Takes several seconds unless interrupted
+SLOW_QUERY = ("SELECT id, name FROM people WHERE (WITH RECURSIVE c(x) AS "
+              "(SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000) SELECT COUNT(*) FROM c) > 0")
+
+
+@pytest.fixture(scope='module')
+def qt_app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the query worker"
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def people(db_copy):
+    people = repository.PeopleRepository(repository.SQLiteBackend(db_copy(), read_only=True))
+    yield people
+    people.backend.close()
+
+
+@pytest.fixture
+def worker(qt_app, people):
+    worker = gui_query.QueryWorker(people)
+    events = {'blocks': [], 'counts': [], 'errors': []}
+    worker.block_ready.connect(lambda generation, block, rows: events['blocks'].append((generation, block, rows)))
+    worker.count_ready.connect(lambda generation, total: events['counts'].append((generation, total)))
+    worker.search_failed.connect(lambda generation, message: events['errors'].append((generation, message)))
+    worker.events = events
+    worker.start()
+    yield worker
+    worker.stop()
+    assert worker.isFinished()
+
+
+def search(people, **filters):
+    filters = repository.normalize_filters(filters)
+    return lambda conn: people.search_sql(filters, conn)
+
+
+def test_first_block_and_count(worker, people):
+    filters = repository.normalize_filters({'gender': 'female'})
+    generation = worker.submit(search(people, gender='female'))
+    wait_for(lambda: worker.events['counts'])
+
+    assert worker.events['blocks'] == [(generation, 0, people.page(filters, limit=gui_query.BLOCK_SIZE))]
+    assert worker.events['counts'] == [(generation, people.count(filters))]
+    assert not worker.events['errors']
+
+
+def test_small_result_is_counted_from_the_block(worker, people):
+    generation = worker.submit(search(people, province='Kep'))
+    wait_for(lambda: worker.events['counts'])
+    rows = worker.events['blocks'][0][2]
+    assert len(rows) < gui_query.BLOCK_SIZE
+    assert worker.events['counts'] == [(generation, len(rows))]
+
+
+def test_fetch_block_by_keyset(worker, people):
+    filters = repository.normalize_filters({'gender': 'male'})
+    generation = worker.submit(search(people, gender='male'))
+    wait_for(lambda: worker.events['counts'])
+    first = worker.events['blocks'][0][2]
+
+    worker.fetch_block(generation, 1, first[-1][0])
+    wait_for(lambda: len(worker.events['blocks']) == 2)
+    assert worker.events['blocks'][1] == (generation, 1, people.page(filters, after_id=first[-1][0],
+                                                                      limit=gui_query.BLOCK_SIZE))
+    # Requests for an older search are ignored
+    worker.fetch_block(generation - 1, 2, first[-1][0])
+    time.sleep(0.1)
+    QtCore.QCoreApplication.processEvents()
+    assert len(worker.events['blocks']) == 2
+
+
+def test_new_search_interrupts_the_running_one(worker, people):
+    slow = worker.submit(lambda conn: (SLOW_QUERY, {}, "SELECT 1"))
+    time.sleep(0.2)
+    start = time.monotonic()
+    fast = worker.submit(search(people, province='Kep'))
+    wait_for(lambda: worker.events['counts'], timeout=3)
+
+    assert time.monotonic() - start < 2
+    assert [event[0] for event in worker.events['blocks']] == [fast]
+    # The interrupted search reports nothing, not even its error
+    assert not worker.events['errors']
+    assert slow < fast
+
+
+def test_errors_are_reported(worker):
+    generation = worker.submit(lambda conn: ("SELECT id FROM no_such_table WHERE 1", {}, "SELECT 1"))
+    wait_for(lambda: worker.events['errors'])
+    assert worker.events['errors'][0][0] == generation
+    assert 'no_such_table' in worker.events['errors'][0][1]
+
+
+def test_stop_interrupts(qt_app, people):
+    worker = gui_query.QueryWorker(people)
+    worker.start()
+    worker.submit(lambda conn: (SLOW_QUERY, {}, "SELECT 1"))
+    time.sleep(0.2)
+    start = time.monotonic()
+    worker.stop()
+    assert worker.isFinished() and time.monotonic() - start < 2
+
+
+def load_all(model):
+    while not model._exhausted:
+        if model.canFetchMore():
+            model.fetchMore()
+        wait_for(lambda: model.canFetchMore() or model._exhausted)
+
+
+def all_ids(people, **filters):
+    filters = repository.normalize_filters(filters)
+    return [row[0] for row in people.iter_rows(filters)]
+
+
+def test_model_fetches_blocks_as_needed(worker, people):
+    model = gui_query.PeopleTableModel(worker, list(repository.RESULT_COLUMNS))
+    model.search(search(people, gender='female'))
+    wait_for(lambda: model.rowCount() == gui_query.BLOCK_SIZE)
+    assert model.canFetchMore()
+    assert model.columnCount() == len(repository.RESULT_COLUMNS)
+    assert model.headerData(1, QtCore.Qt.Orientation.Horizontal) == 'name'
+
+    load_all(model)
+    expected = all_ids(people, gender='female')
+    assert model.rowCount() == len(expected) > 2 * gui_query.BLOCK_SIZE
+    assert [int(model.data(model.index(row, 0))) for row in range(model.rowCount())] == expected
+    assert not model.canFetchMore()
+
+
+def test_model_rereads_evicted_blocks(worker, people):
+    model = gui_query.PeopleTableModel(worker, list(repository.RESULT_COLUMNS), max_blocks=2)
+    changed = []
+    model.dataChanged.connect(lambda first, last: changed.append((first.row(), last.row())))
+    model.search(search(people, gender='male'))
+    wait_for(lambda: model.rowCount())
+    load_all(model)
+    assert len(model._blocks) == 2
+
+    expected = all_ids(people, gender='male')
+    # Row 0 was evicted: blank until its block has been read again
+    assert model.data(model.index(0, 0)) is None
+    wait_for(lambda: changed)
+    assert changed == [(0, gui_query.BLOCK_SIZE - 1)]
+    assert int(model.data(model.index(0, 0))) == expected[0]
+    assert int(model.data(model.index(gui_query.BLOCK_SIZE - 1, 0))) == expected[gui_query.BLOCK_SIZE - 1]
+    assert len(model._blocks) == 2
+
+
+def test_model_new_search_drops_old_rows(worker, people):
+    colours = []
+    model = gui_query.PeopleTableModel(worker, list(repository.RESULT_COLUMNS),
+                                       foreground=lambda column, value: colours.append(column) or 'red')
+    first = model.search(search(people, gender='female'))
+    wait_for(lambda: model.rowCount())
+    second = model.search(search(people, province='Kep'))
+    assert model.rowCount() == 0
+
+    # A late block from the first search does not reach the new one
+    model._block_ready(first, 0, [(1, 'x', 'male', 30, 'a', 'b', 'c', 'd')])
+    assert model.rowCount() == 0
+
+    wait_for(lambda: model.rowCount())
+    assert [int(model.data(model.index(row, 0))) for row in range(model.rowCount())] == \
+        all_ids(people, province='Kep')
+    assert all(model.data(model.index(row, 4)) == 'Kep' for row in range(model.rowCount()))
+    assert model.data(model.index(0, 2), QtCore.Qt.ItemDataRole.ForegroundRole) == 'red' and colours == [2]
+    assert first < second == model.generation
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
@@ -0,0 +1,187 @@
+"""
+Tests for the monthly audit log partitions and their archives
+(history_partitions.py)
+"""
+import gzip
+import os
+import sqlite3
+import stat
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+import history_partitions as hp
+
+LEGACY_SQL = f"""
+    CREATE TABLE {hp.LEGACY_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL, person_id INTEGER,
+        action VARCHAR(50) NOT NULL, details TEXT, timestamp DATETIME NOT NULL
+    )
+"""
+
+
+def stamp(month, n):
+    """A timestamp string in `month` ('YYYY-MM'), n minutes into it"""
+    return (datetime.fromisoformat(f"{month}-01") + timedelta(minutes=n)).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    # Decompressed archives are cached under the temp dir
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    conn = sqlite3.connect(str(tmp_path / 'history.db'))
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(80))")
+    conn.executemany("INSERT INTO users VALUES (?, ?)", [(1, 'admin'), (2, 'kep')])
+
+    # Legacy rows from before partitioning; one month overlaps the partitions
+    conn.execute(LEGACY_SQL)
+    conn.executemany(f"INSERT INTO {hp.LEGACY_TABLE} (user_id, action, details, timestamp) VALUES (?, ?, ?, ?)",
+                     [(1 + n % 2, 'login', f"legacy {n}", stamp(month, n * 7))
+                      for month in ('2025-12', '2026-01') for n in range(6)])
+    hp.insert_entries(conn, [(1 + n % 2, None, 'search', f"{month} {n}", stamp(month, n * 5))
+                             for month in ('2026-01', '2026-02', '2026-03') for n in range(10)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def everything(conn):
+    """Every row, newest first, read straight from the tables"""
+    rows = []
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                 "AND name LIKE 'edit_history%'").fetchall():
+        rows += conn.execute(f"SELECT id, user_id, details, timestamp FROM {table}").fetchall()
+    return sorted(rows, key=lambda row: (row[3], row[0]), reverse=True)
+
+
+def walk(conn, per_page, archive_dir, user_id=None):
+    pages = [hp.paginate(conn, per_page, user_id=user_id, archive_dir=archive_dir)]
+    while pages[-1].has_next:
+        pages.append(hp.paginate(conn, per_page, cursor=pages[-1].next_cursor,
+                                 user_id=user_id, archive_dir=archive_dir))
+    return pages
+
+
+def ids(pages):
+    return [entry.id for page in pages for entry in page.items]
+
+
+def test_partition_ids_and_months(conn):
+    assert hp.month_of('2026-03-09 10:00:00.000000') == '2026_03'
+    assert hp.month_of(datetime(2026, 3, 9)) == '2026_03'
+    first = conn.execute("SELECT MIN(id), MAX(id) FROM edit_history_2026_02").fetchone()
+    assert first == (202602 * hp.ID_BLOCK + 1, 202602 * hp.ID_BLOCK + 10)
+    assert hp.cutoff_for(3, today=datetime(2026, 2, 15)) == '2025_12'
+    assert hp.cutoff_for(1, today=datetime(2026, 2, 15)) == '2026_02'
+
+
+def test_pages_across_partitions_and_legacy_table(conn, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    expected = everything(conn)
+    assert len(expected) == 42
+
+    entries = hp.fetch(conn, 100, archive_dir=archive_dir)
+    assert [(e.id, e.details) for e in entries] == [(row[0], row[2]) for row in expected]
+    assert entries[0].username in ('admin', 'kep') and isinstance(entries[0].timestamp, datetime)
+
+    pages = walk(conn, 5, archive_dir)
+    assert ids(pages) == [row[0] for row in expected]
+    assert [page.page for page in pages] == list(range(1, 10))
+
+    # prev cursors lead back through the same pages
+    page = pages[-1]
+    for previous in reversed(pages[:-1]):
+        page = hp.paginate(conn, 5, cursor=page.prev_cursor, archive_dir=archive_dir)
+        assert [e.id for e in page.items] == [e.id for e in previous.items]
+
+    # Managers only see their own entries; old page links still work
+    assert ids(walk(conn, 4, archive_dir, user_id=2)) == [row[0] for row in expected if row[1] == 2]
+    third = hp.paginate(conn, 5, page=3, archive_dir=archive_dir)
+    assert [e.id for e in third.items] == [row[0] for row in expected[10:15]]
+
+
+def test_archive_month(conn, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    expected = everything(conn)
+
+    rows, path = hp.archive_month(conn, '2026_01', archive_dir)
+    assert rows == 10 and path == os.path.join(archive_dir, 'edit_history_2026_01.db.gz')
+    assert not stat.S_IMODE(os.stat(path).st_mode) & 0o222
+    assert 'edit_history_2026_01' not in [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert ('2026_01', 'archive', path) in hp.segments(conn, archive_dir)
+
+    # Archived rows read back the same, merged with the rest
+    assert ids(walk(conn, 7, archive_dir)) == [row[0] for row in expected]
+
+    # A late write to the archived month continues its id sequence
+    hp.insert_entries(conn, [(1, None, 'logout', 'late', stamp('2026-01', 9999))])
+    conn.commit()
+    late_id = conn.execute("SELECT id FROM edit_history_2026_01").fetchone()[0]
+    assert late_id == 202601 * hp.ID_BLOCK + 11
+    entries = hp.fetch(conn, 100, archive_dir=archive_dir)
+    assert len(entries) == 43 and len({e.id for e in entries}) == 43
+    assert ids(walk(conn, 7, archive_dir)) == [e.id for e in entries]
+
+    # Archiving again merges the late row into the existing archive
+    rows, _ = hp.archive_month(conn, '2026_01', archive_dir)
+    assert rows == 1
+    with gzip.open(path) as f:
+        copy = tmp_path / 'copy.db'
+        copy.write_bytes(f.read())
+    archived = sqlite3.connect(str(copy))
+    assert archived.execute("SELECT COUNT(*), MAX(id) FROM edit_history").fetchone() == (11, late_id)
+    archived.close()
+    assert [e.id for e in hp.fetch(conn, 100, archive_dir=archive_dir)] == [e.id for e in entries]
+
+
+def test_archive_keeps_usernames(conn, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    hp.archive_month(conn, '2026_02', archive_dir)
+    conn.execute("DELETE FROM users WHERE id = 2")
+    conn.commit()
+    names = {e.details: e.username for e in hp.fetch(conn, 100, archive_dir=archive_dir)}
+    assert names['2026-02 1'] == 'kep'
+    assert names['2026-03 1'] == '#2'
+
+
+def test_only_the_needed_segments_are_opened(conn, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    hp.archive_before(conn, '2026_03', archive_dir)
+    # An unreadable archive for a later month breaks any read that opens it
+    with open(os.path.join(archive_dir, 'edit_history_2026_09.db.gz'), 'wb') as f:
+        f.write(b'not gzip')
+
+    key = ['2026-02-01 00:30:00.000000', 202602 * hp.ID_BLOCK + 7]
+    older = hp.fetch(conn, 5, key=key, archive_dir=archive_dir)
+    assert [e.details for e in older] == ['2026-02 5', '2026-02 4', '2026-02 3', '2026-02 2', '2026-02 1']
+    # Newer entries: February and March fill the page before September is reached
+    newer = hp.fetch(conn, 5, key=key, newer=True, archive_dir=archive_dir)
+    assert [e.details for e in newer] == ['2026-02 7', '2026-02 8', '2026-02 9', '2026-03 0', '2026-03 1']
+    with pytest.raises(OSError):
+        hp.fetch(conn, 100, key=key, newer=True, archive_dir=archive_dir)
+
+
+def test_archive_before(conn, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    expected = everything(conn)
+    done = hp.archive_before(conn, '2026_03', archive_dir)
+    assert [(month, rows) for month, rows, _ in done] == [('2026_01', 10), ('2026_02', 10)]
+    assert [kind for month, kind, _ in hp.segments(conn, archive_dir)] == ['table', 'archive', 'archive', 'table']
+    assert ids(walk(conn, 9, archive_dir)) == [row[0] for row in expected]
+
+
+def test_migrate_legacy(conn, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    expected = everything(conn)
+    assert hp.migrate_legacy(conn) == 12
+    assert hp.segments(conn, archive_dir)[-1][0] is not None
+    assert everything(conn) == expected
+    assert ids(walk(conn, 6, archive_dir)) == [row[0] for row in expected]
+    assert hp.migrate_legacy(conn) == 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
@@ -0,0 +1,132 @@
+"""
+Tests for the gazetteer import (import_cambodia_locations.py)
+"""
+import os
+import sqlite3
+import zipfile
+
+import pytest
+
+pytest.importorskip('openpyxl')
+
+import import_cambodia_locations as importer
+import locations
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKBOOK = os.path.join(HERE, 'camboia.xlsx')
+COMMITTED_JSON = os.path.join(HERE, 'cambodia_locations_real.json')
+
+
+def copy_workbook(path, member=None):
+    """Copy the workbook, appending whitespace to one worksheet's XML"""
+    with zipfile.ZipFile(WORKBOOK) as source, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename == member:
+                data += b'\n'
+            target.writestr(info, data)
+
+
+@pytest.fixture(scope='module')
+def villages():
+    return list(importer.iter_villages(WORKBOOK))
+
+
+def test_province_name():
+    assert importer.province_name('3. Kampong Cham') == 'Kampong Cham'
+    assert importer.province_name('Kep') == 'Kep'
+
+
+def test_iter_villages(villages):
+    sheets = []
+    rows = list(importer.iter_villages(WORKBOOK, on_sheet=lambda *args: sheets.append(args)))
+    assert rows == villages
+    assert len(sheets) == 25
+    assert sum(sheet[2] for sheet in sheets) == len(villages)
+    assert all(isinstance(code, int) and all(names) for code, *names in villages)
+
+    title, province = sheets[2][0], sheets[2][1]
+    only = list(importer.iter_villages(WORKBOOK, sheets={title}))
+    assert only == [row for row in villages if row[1] == province]
+
+
+def test_one_pass_writes_json_and_table(tmp_path, villages):
+    json_path = str(tmp_path / 'locations.json')
+    db_path = str(tmp_path / 'locations.db')
+    nested = importer.read_cambodia_excel(WORKBOOK, json_path, db_path)
+    with open(json_path, 'rb') as f, open(COMMITTED_JSON, 'rb') as committed:
+        assert f.read() == committed.read()
+    assert len(nested) == 25
+    assert sum(len(names) for districts in nested.values() for communes in districts.values()
+               for names in communes.values()) == len({row[1:] for row in villages})
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0] == \
+        len({row[1:] for row in villages})
+    conn.close()
+
+
+def test_sheet_hashes(tmp_path):
+    hashes = importer.sheet_hashes(WORKBOOK)
+    assert len(hashes) == 25 and len(set(hashes.values())) == 25
+    assert hashes == importer.sheet_hashes(WORKBOOK)
+
+    copy = str(tmp_path / 'changed.xlsx')
+    copy_workbook(copy, 'xl/worksheets/sheet2.xml')
+    changed = importer.sheet_hashes(copy)
+    assert list(changed) == list(hashes)
+    assert [title for title in hashes if changed[title] != hashes[title]] == [list(hashes)[1]]
+
+
+def test_import_is_incremental(tmp_path, monkeypatch, villages, capsys):
+    json_path = str(tmp_path / 'locations.json')
+    db_path = str(tmp_path / 'locations.db')
+    nested = importer.read_cambodia_excel(WORKBOOK, json_path, db_path)
+    cached = locations.read_cache(json_path, extra=True)
+    assert cached['locations'] == nested
+    assert {title: digest for title, (digest, _) in cached['extra']['sheets'].items()} == \
+        importer.sheet_hashes(WORKBOOK)
+    assert [tuple(row) for _, rows in cached['extra']['sheets'].values() for row in rows] == villages
+
+    # Nothing changed: no sheet is parsed and the files are left alone
+    stat = os.stat(json_path)
+    parsed = []
+    real_iter_villages = importer.iter_villages
+
+    def recording_iter_villages(path, on_sheet=None, sheets=None):
+        parsed.append(set(sheets))
+        return real_iter_villages(path, on_sheet=on_sheet, sheets=sheets)
+
+    monkeypatch.setattr(importer, 'iter_villages', recording_iter_villages)
+    capsys.readouterr()
+    assert importer.read_cambodia_excel(WORKBOOK, json_path, db_path) == nested
+    assert '25 of 25 sheets unchanged' in capsys.readouterr().out
+    assert parsed == [] and os.stat(json_path).st_mtime_ns == stat.st_mtime_ns
+
+    # One sheet changed: only it is parsed; the rest come from the cache
+    workbook = str(tmp_path / 'changed.xlsx')
+    copy_workbook(workbook, 'xl/worksheets/sheet2.xml')
+    assert importer.read_cambodia_excel(workbook, json_path, db_path) == nested
+    assert parsed == [{list(importer.sheet_hashes(WORKBOOK))[1]}]
+    with open(json_path, 'rb') as f, open(COMMITTED_JSON, 'rb') as committed:
+        assert f.read() == committed.read()
+
+    # --force and a JSON edited by hand both re-read every sheet
+    importer.read_cambodia_excel(workbook, json_path, None, force=True)
+    assert len(parsed[-1]) == 25
+    os.utime(json_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert locations.read_cache(json_path) is None
+    assert importer.read_cambodia_excel(workbook, json_path, None) == nested
+    assert len(parsed) == 3 and len(parsed[-1]) == 25
+
+
+def test_unreadable_workbook(tmp_path):
+    path = str(tmp_path / 'broken.xlsx')
+    with open(path, 'wb') as f:
+        f.write(b'not a workbook')
+    assert importer.read_cambodia_excel(path, str(tmp_path / 'out.json')) is None
+    assert not os.path.exists(tmp_path / 'out.json')
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
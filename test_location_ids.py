@@ -0,0 +1,120 @@
+"""
+Tests for the village_id layout: migrate_to_location_ids.py on a database
+in the old layout (location names on every people row), and the scripts
+that read people through people_view afterwards
+"""
+import sqlite3
+
+import pytest
+
+import locations
+import migrate_to_first_last_name
+import migrate_to_location_ids
+import search_index
+
+OLD_PEOPLE_SQL = """
+    CREATE TABLE people (
+        id INTEGER NOT NULL PRIMARY KEY,
+        name VARCHAR(100), first_name VARCHAR(50), last_name VARCHAR(50),
+        gender VARCHAR(10) NOT NULL, age INTEGER NOT NULL,
+        province VARCHAR(100) NOT NULL, district VARCHAR(100) NOT NULL,
+        commune VARCHAR(100) NOT NULL, village VARCHAR(100) NOT NULL,
+        created_at DATETIME
+    )
+"""
+
+COLUMNS = 'id, name, first_name, last_name, gender, age, province, district, commune, village'
+
+UNKNOWN_VILLAGE = ('Kep', 'Kaeb', 'Kaeb', 'Not In The Gazetteer')
+
+
+@pytest.fixture
+def old_db(db_path, tmp_path):
+    """A database in the pre-village_id layout with the rows of the generated one"""
+    path = str(tmp_path / 'old.db')
+    source = sqlite3.connect(db_path)
+    rows = source.execute(f"SELECT {COLUMNS}, created_at FROM people_view ORDER BY id").fetchall()
+    source.close()
+
+    conn = sqlite3.connect(path)
+    conn.execute(OLD_PEOPLE_SQL)
+    conn.executemany("INSERT INTO people VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.execute("INSERT INTO people VALUES (NULL, 'Sok Dara', 'Sok', 'Dara', 'male', 33, ?, ?, ?, ?, NULL)",
+                 UNKNOWN_VILLAGE)
+    search_index.create_search_index(conn)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_migration_keeps_every_row(old_db):
+    conn = sqlite3.connect(old_db)
+    before = conn.execute(f"SELECT {COLUMNS} FROM people ORDER BY id").fetchall()
+    conn.close()
+
+    migrate_to_location_ids.migrate_database(old_db)
+
+    conn = sqlite3.connect(old_db)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(people)")]
+    assert 'village_id' in columns and 'province' not in columns
+    assert conn.execute(f"SELECT {COLUMNS} FROM people_view ORDER BY id").fetchall() == before
+
+    # A village missing from the gazetteer gets an unofficial id
+    village_id = conn.execute("SELECT village_id FROM people WHERE name = 'Sok Dara' "
+                              "ORDER BY id DESC LIMIT 1").fetchone()[0]
+    assert village_id >= locations.UNOFFICIAL_ID_BASE
+    assert conn.execute("SELECT province, district, commune, village FROM locations WHERE id = ?",
+                        (village_id,)).fetchone() == UNKNOWN_VILLAGE
+
+    # The FTS index still matches the rows and its triggers are back
+    sql, params = search_index.name_filter_sql(conn, 'Sok Dara')
+    assert conn.execute(f"SELECT COUNT(*) FROM people WHERE {sql}", params).fetchone()[0] == \
+        sum(1 for row in before if 'Sok Dara' in row[1])
+    conn.execute("INSERT INTO people (name, gender, age, village_id) VALUES ('Qqzz Test', 'male', 20, ?)",
+                 (village_id,))
+    sql, params = search_index.name_filter_sql(conn, 'Qqzz')
+    assert conn.execute(f"SELECT COUNT(*) FROM people WHERE {sql}", params).fetchone()[0] == 1
+    conn.close()
+
+
+def test_migration_is_idempotent(old_db, capsys):
+    migrate_to_location_ids.migrate_database(old_db)
+    conn = sqlite3.connect(old_db)
+    before = conn.execute("SELECT * FROM people ORDER BY id").fetchall()
+    conn.close()
+
+    migrate_to_location_ids.migrate_database(old_db)
+    assert 'nothing to do' in capsys.readouterr().out
+    conn = sqlite3.connect(old_db)
+    assert conn.execute("SELECT * FROM people ORDER BY id").fetchall() == before
+    conn.close()
+
+
+def test_people_ddl_matches_model(db_path):
+    table_sql, index_sql = migrate_to_location_ids.people_ddl()
+    assert 'village_id INTEGER NOT NULL' in table_sql
+    conn = sqlite3.connect(db_path)
+    indexes = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'people' AND sql IS NOT NULL")}
+    conn.close()
+    assert {sql.split()[2] for sql in index_sql} == indexes
+
+
+def test_first_last_name_migration_reads_people_view(db_copy, tmp_path, monkeypatch, capsys):
+    """Step 5 of migrate_to_first_last_name.py samples rows through people_view"""
+    (tmp_path / 'instance').mkdir()
+    db_copy('instance/people.db')
+    monkeypatch.chdir(tmp_path)
+    migrate_to_first_last_name.migrate_database()
+
+    out = capsys.readouterr().out
+    assert 'Migration completed successfully' in out
+    conn = sqlite3.connect(str(tmp_path / 'instance' / 'people.db'))
+    first = conn.execute("SELECT province FROM people_view ORDER BY id LIMIT 1").fetchone()[0]
+    assert conn.execute("SELECT COUNT(*) FROM people WHERE first_name IS NULL").fetchone()[0] == 0
+    conn.close()
+    assert first in out
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
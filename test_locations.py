@@ -0,0 +1,185 @@
+"""
+Tests for the in-memory location tree (locations.py), the cascading
+dropdown APIs and the precompressed /api/locations payloads
+"""
+import gzip
+import json
+import os
+import sqlite3
+
+import pytest
+
+import locations
+
+NESTED = {
+    'Takeo': {'Bati': {'Trapeang Sab': ['Prey Kduoch', 'Ang', 'Ang']}},
+    'Kep': {'Damnak Chang Aeur': {'Prey Thom': ['Chhak Kep'], 'Angkaol': ['Ou Krasar', 'Angk Kaol']}},
+}
+
+
+def test_tree_levels():
+    tree = locations.LocationTree(NESTED)
+    assert tree.provinces() == ('Kep', 'Takeo')
+    assert tree.districts('Kep') == ('Damnak Chang Aeur',)
+    assert tree.communes('Kep', 'Damnak Chang Aeur') == ('Angkaol', 'Prey Thom')
+    assert tree.villages('Takeo', 'Bati', 'Trapeang Sab') == ('Ang', 'Prey Kduoch')
+    assert tree.districts('Nowhere') == () and tree.villages('Kep', 'x', 'y') == ()
+    assert tree.contains('Kep', 'Damnak Chang Aeur', 'Angkaol', 'Ou Krasar')
+    assert not tree.contains('Kep', 'Damnak Chang Aeur', 'Angkaol', 'Chhak Kep')
+
+
+def test_with_villages_is_a_copy():
+    tree = locations.LocationTree(NESTED)
+    grown = tree.with_villages([('Kep', 'Damnak Chang Aeur', 'Prey Thom', 'New Village'),
+                                ('Pailin', 'Sala Krau', 'Stueng Kach', 'Phsar')])
+    assert grown.villages('Kep', 'Damnak Chang Aeur', 'Prey Thom') == ('Chhak Kep', 'New Village')
+    assert grown.provinces() == ('Kep', 'Pailin', 'Takeo')
+    assert not tree.contains('Kep', 'Damnak Chang Aeur', 'Prey Thom', 'New Village')
+    assert grown.to_dict()['Takeo'] == tree.to_dict()['Takeo']
+
+
+def test_payload_and_etag():
+    tree = locations.LocationTree(NESTED)
+    body, etag = tree.payload('Kep', 'Damnak Chang Aeur')
+    assert json.loads(body) == ['Angkaol', 'Prey Thom']
+    assert tree.payload('Kep', 'Damnak Chang Aeur') == (body, etag)
+    assert tree.payload()[1] != etag
+    # Same content, same ETag, even from another tree
+    assert locations.LocationTree(NESTED).payload('Kep', 'Damnak Chang Aeur')[1] == etag
+
+
+def test_dropdown_apis(login):
+    client = login('admin')
+    with open(locations.LOCATIONS_FILE, encoding='utf-8') as f:
+        nested = json.load(f)
+    province = 'Kep'
+    district = sorted(nested[province])[0]
+    commune = sorted(nested[province][district])[0]
+
+    assert client.get('/api/provinces').get_json() == sorted(nested)
+    assert client.get(f'/api/districts/{province}').get_json() == sorted(nested[province])
+    assert client.get(f'/api/communes/{province}/{district}').get_json() == sorted(nested[province][district])
+    assert client.get(f'/api/villages/{province}/{district}/{commune}').get_json() == \
+        sorted(set(nested[province][district][commune]))
+    assert client.get('/api/districts/Atlantis').get_json() == []
+
+
+def test_dropdown_conditional_get(login):
+    client = login('admin')
+    response = client.get('/api/districts/Kep')
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    again = client.get('/api/districts/Kep', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and not again.data
+    other = client.get('/api/districts/Pailin', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+
+
+def test_new_villages_are_picked_up(db_copy, monkeypatch):
+    """Villages first seen in people_stats are merged into the tree"""
+    conn = sqlite3.connect(db_copy())
+    monkeypatch.setattr(locations, 'REFRESH_INTERVAL', 0)
+    locations.invalidate()
+    try:
+        tree = locations.get_tree(lambda: conn)
+        path = ('Kep', 'Kep', 'Prey Thom', 'Brand New Village')
+        assert not tree.contains(*path)
+
+        locations.add_unofficial_villages(conn, [path])
+        conn.execute("""
+            INSERT INTO people (name, gender, age, village_id)
+            SELECT 'Test Person', 'female', 40, id FROM locations WHERE village = 'Brand New Village'
+        """)
+        conn.commit()
+        tree = locations.get_tree(lambda: conn)
+        assert tree.contains(*path)
+        assert 'Brand New Village' in json.loads(tree.payload(*path[:3])[0])
+    finally:
+        locations.invalidate()
+        conn.close()
+
+
+def test_compressed_payload():
+    payload = locations.CompressedPayload(NESTED)
+    assert json.loads(payload.body) == NESTED
+    assert gzip.decompress(payload.encodings['gzip']) == payload.body
+    if locations.brotli is not None:
+        assert locations.brotli.decompress(payload.encodings['br']) == payload.body
+    # Deterministic output (gzip mtime=0), so the ETag is stable across processes
+    assert locations.CompressedPayload(NESTED).encodings['gzip'] == payload.encodings['gzip']
+    assert locations.CompressedPayload(body=payload.body).etag == payload.etag
+
+
+def test_gazetteer_cache_reloads_on_change(tmp_path):
+    path = tmp_path / 'locations.json'
+    path.write_text(json.dumps(NESTED), encoding='utf-8')
+    cache = locations.GazetteerCache(str(path))
+
+    country = cache.get()
+    assert json.loads(country.body) == NESTED
+    assert cache.get() is country
+    assert json.loads(cache.get('Kep').body) == NESTED['Kep']
+    assert cache.get('Atlantis') is None
+
+    changed = dict(NESTED, Pailin={'Pailin': {'Pailin': ['Phsar']}})
+    path.write_text(json.dumps(changed), encoding='utf-8')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1000))
+    assert json.loads(cache.get().body) == changed
+    assert cache.get('Pailin') is not None
+
+    path.unlink()
+    assert cache.get() is None
+
+
+def test_gazetteer_cache_file_gone_after_stat(tmp_path, monkeypatch):
+    path = tmp_path / 'locations.json'
+    path.write_text(json.dumps(NESTED), encoding='utf-8')
+    cache = locations.GazetteerCache(str(path))
+    # The file disappears between os.stat() and the read
+    monkeypatch.setattr(locations, 'load_from_file', lambda path: None)
+    assert cache.get() is None and cache.get('Kep') is None
+
+    monkeypatch.undo()
+    country = cache.get()
+    assert json.loads(country.body) == NESTED
+    monkeypatch.setattr(locations, 'load_from_file', lambda path: None)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1000))
+    assert cache.get() is country
+    assert json.loads(cache.get('Kep').body) == NESTED['Kep']
+
+
+def test_api_locations_encodings(login):
+    client = login('admin')
+    with open(locations.LOCATIONS_FILE, encoding='utf-8') as f:
+        nested = json.load(f)
+
+    plain = client.get('/api/locations')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_json() == nested
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    zipped = client.get('/api/locations', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.data) == plain.data
+    assert zipped.headers['ETag'] != plain.headers['ETag']
+
+    again = client.get('/api/locations', headers={'Accept-Encoding': 'gzip',
+                                                  'If-None-Match': zipped.headers['ETag']})
+    assert again.status_code == 304
+
+    if locations.brotli is not None:
+        br = client.get('/api/locations', headers={'Accept-Encoding': 'gzip, br'})
+        assert br.headers['Content-Encoding'] == 'br'
+        assert locations.brotli.decompress(br.data) == plain.data
+
+
+def test_api_province_locations(login):
+    client = login('admin')
+    with open(locations.LOCATIONS_FILE, encoding='utf-8') as f:
+        nested = json.load(f)
+    assert client.get('/api/locations/Kep').get_json() == nested['Kep']
+    assert client.get('/api/locations/Atlantis').status_code == 404
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
@@ -30,7 +30,7 @@ def test_manager_restrictions():
         print()
         
         # Test 1: Count all people in manager's province
-        cursor.execute("SELECT COUNT(*) FROM people WHERE province = ?", (province,))
+        cursor.execute("SELECT COUNT(*) FROM people_view WHERE province = ?", (province,))
         province_count = cursor.fetchone()[0]
         print(f"📊 People in {province}: {province_count:,}")
         
@@ -41,14 +41,14 @@ def test_manager_restrictions():
         print()
         
         # Test 3: Verify manager can't see other provinces
-        cursor.execute("SELECT COUNT(*) FROM people WHERE province != ?", (province,))
+        cursor.execute("SELECT COUNT(*) FROM people_view WHERE province != ?", (province,))
         other_provinces = cursor.fetchone()[0]
         print(f"🔒 People in OTHER provinces: {other_provinces:,}")
         print(f"   ✅ Manager CANNOT see these {other_provinces:,} people")
         print()
         
         # Test 4: Show sample data from manager's province
-        cursor.execute("SELECT id, name, gender, age, district FROM people WHERE province = ? LIMIT 5", (province,))
+        cursor.execute("SELECT id, name, gender, age, district FROM people_view WHERE province = ? LIMIT 5", (province,))
         samples = cursor.fetchall()
         
         print(f"📋 Sample people from {province}:")
@@ -84,7 +84,7 @@ def test_manager_restrictions():
         print(f"\n📋 ALL PROVINCE MANAGERS ({len(all_managers)}/25):")
         print("-" * 60)
         for mgr_username, mgr_province in all_managers:
-            cursor.execute("SELECT COUNT(*) FROM people WHERE province = ?", (mgr_province,))
+            cursor.execute("SELECT COUNT(*) FROM people_view WHERE province = ?", (mgr_province,))
             count = cursor.fetchone()[0]
             print(f"   {mgr_username:25} → {mgr_province:30} ({count:,} people)")
         
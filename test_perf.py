@@ -0,0 +1,118 @@
+"""
+Tests for the request timing and slow-query log (perf.py)
+"""
+import sqlite3
+
+import pytest
+from flask import Flask, jsonify
+
+import perf
+
+
+@pytest.fixture
+def monitored(app, tmp_path):
+    """
+    A small app whose route runs SQL on a monitored connection. The web
+    app comes first: the slow-query log handler goes to the first monitor
+    created with a log path
+    """
+    monitor = perf.PerfMonitor(slow_ms=10 ** 6, log_path=None)
+    conn = sqlite3.connect(str(tmp_path / 'perf.db'), factory=monitor.connection_class,
+                           check_same_thread=False)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO t (name) VALUES (?)", [(f"name {i}",) for i in range(50)])
+    conn.commit()
+
+    small = Flask(__name__)
+    monitor.init_app(small)
+
+    @small.route('/rows')
+    def rows():
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name FROM t WHERE id > ?", (10,))
+        first = cursor.fetchmany(5)
+        rest = cursor.fetchall()
+        total = conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+        return jsonify({'rows': len(first) + len(rest), 'total': total,
+                        'cursor': type(cursor).__name__})
+
+    yield monitor, conn, small.test_client()
+    conn.close()
+
+
+def test_describe_params():
+    assert perf.describe_params(None) == '(executemany)'
+    assert perf.describe_params(('Sok', 31, None)) == '(str, int, NoneType)'
+    assert perf.describe_params({'name': 'Sok', 'age': 31}) == '{name: str, age: int}'
+    assert perf.describe_params(()) == '()'
+
+
+def test_plain_cursors_outside_requests(monitored):
+    _, conn, _ = monitored
+    assert type(conn.cursor()) is sqlite3.Cursor
+    assert type(conn.execute("SELECT 1")) is sqlite3.Cursor
+
+
+def test_request_stats(monitored):
+    monitor, _, client = monitored
+    for _ in range(3):
+        response = client.get('/rows')
+        assert response.get_json() == {'rows': 40, 'total': 50, 'cursor': 'InstrumentedCursor'}
+        assert response.headers['Server-Timing'].startswith('app;dur=')
+        assert 'desc="2 queries"' in response.headers['Server-Timing']
+
+    (summary,) = monitor.summary()
+    assert summary['endpoint'] == 'rows' and summary['requests'] == 3
+    assert summary['avg_statements'] == 2 and summary['avg_rows'] == 41
+    assert summary['p50_ms'] <= summary['p95_ms'] <= summary['p99_ms'] <= summary['max_ms']
+    assert summary['slow_statements'] == 0
+    monitor.reset()
+    assert monitor.summary() == []
+
+
+def test_percentiles():
+    times = list(range(1, 101))
+    assert perf._percentile(times, 0.50) == 50
+    assert perf._percentile(times, 0.95) == 95
+    assert perf._percentile(times, 0.99) == 99
+    assert perf._percentile([7], 0.99) == 7
+
+
+def test_explain(db_path):
+    monitor = perf.PerfMonitor(log_path=None)
+    plan = monitor.explain(db_path, "SELECT id FROM people WHERE id = ?", (5,))
+    assert any('people' in line for line in plan)
+    assert monitor.explain(db_path, "SELECT nothing FROM nowhere", ())[0].startswith('(no plan: ')
+    assert monitor.explain(db_path, "INSERT INTO people VALUES (?)", None) == ['(executemany, no plan)']
+
+
+def test_slow_queries_are_logged_without_values(login, app, monkeypatch):
+    import app as app_module
+    monitor = app_module.perf_monitor
+    monkeypatch.setattr(monitor, 'slow_seconds', 0.0)
+    client = login('admin')
+    assert client.get('/search?name=Secretname&gender=female').status_code == 200
+    monkeypatch.undo()
+
+    with open(app.config['PERF_SLOW_QUERY_LOG'], encoding='utf-8') as f:
+        log = f.read()
+    assert ' search ' in log and 'SQL: SELECT' in log and 'plan:' in log
+    assert 'params: (str, str, int, int)' in log
+    assert 'Secretname' not in log
+
+
+def test_admin_perf_page(login):
+    admin = login('admin')
+    admin.get('/search?gender=male')
+    response = admin.get('/admin/perf')
+    assert response.status_code == 200
+    assert 'search' in response.get_data(as_text=True)
+    assert 'Server-Timing' in response.headers
+    assert admin.get('/admin/perf?reset=1').status_code == 302
+
+    manager = login('kampong_cham').get('/admin/perf')
+    assert manager.status_code == 302
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
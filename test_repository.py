@@ -0,0 +1,156 @@
+"""
+Tests for the shared people query builder and connection pool (repository.py)
+"""
+import sqlite3
+
+import pytest
+
+import repository
+import search_index
+
+SEARCHES = [
+    {},
+    {'name': 'Sok'},
+    {'name': 'ok'},
+    {'name': "Sok' OR 1=1 --"},
+    {'gender': 'female', 'age': '30'},
+    {'province': 'Kampong', 'gender': 'male'},
+    {'province': 'Takeo', 'district': 'a', 'commune': 'a', 'village': 'a'},
+    {'id': '42'},
+]
+
+
+def expected_ids(db_path, filters, manager_province=None):
+    """The same search written out by hand against people_view"""
+    conditions, params = [], []
+    if filters.get('id'):
+        conditions.append("id = ?")
+        params.append(int(filters['id']))
+    if filters.get('name'):
+        conditions.append("(name LIKE ? OR first_name LIKE ? OR last_name LIKE ?)")
+        params += [f"%{filters['name']}%"] * 3
+    if filters.get('gender'):
+        conditions.append("gender = ?")
+        params.append(filters['gender'])
+    if filters.get('age'):
+        conditions.append("age = ?")
+        params.append(int(filters['age']))
+    for field in repository.LOCATION_FIELDS:
+        if filters.get(field):
+            conditions.append(f"{field} LIKE ?")
+            params.append(f"%{filters[field]}%")
+    if manager_province:
+        conditions.append("province = ?")
+        params.append(manager_province)
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute(
+            f"SELECT id FROM people_view WHERE {' AND '.join(conditions) or '1=1'} ORDER BY id", params)]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def people(db_path):
+    people = repository.PeopleRepository(repository.SQLiteBackend(db_path, read_only=True))
+    yield people
+    people.backend.close()
+
+
+def test_normalize_filters():
+    filters = repository.normalize_filters({'name': ' Sok ', 'age': '31', 'id': 'abc', 'gender': None},
+                                           manager_province='Kep')
+    assert filters['name'] == 'Sok' and filters['age'] == 31 and filters['id'] is None
+    assert filters['gender'] == '' and filters['manager_province'] == 'Kep'
+    assert 'manager_province' not in repository.normalize_filters({})
+
+
+@pytest.mark.parametrize('search', SEARCHES)
+def test_search_matches_hand_written_sql(people, db_path, search):
+    filters = repository.normalize_filters(search)
+    ids = [row[0] for row in people.iter_rows(filters, batch_size=97)]
+    assert ids == expected_ids(db_path, search)
+    assert people.count(filters) == len(ids)
+    assert people.page(filters, limit=10) == list(people.iter_rows(filters))[:10]
+
+
+def test_rows_have_result_columns(people, db_path):
+    row = people.page(repository.normalize_filters({}), limit=1)[0]
+    conn = sqlite3.connect(db_path)
+    expected = conn.execute(f"SELECT {', '.join(repository.RESULT_COLUMNS)} FROM people_view "
+                            f"WHERE id = ?", (row[0],)).fetchone()
+    conn.close()
+    assert row == expected
+
+
+@pytest.mark.parametrize('search', [{}, {'province': 'Kampong'}, {'province': 'Battambang'}, {'name': 'Chan'}])
+def test_manager_province_restriction(people, db_path, search):
+    filters = repository.normalize_filters(search, manager_province='Kampong Cham')
+    rows = list(people.iter_rows(filters))
+    assert [row[0] for row in rows] == expected_ids(db_path, search, 'Kampong Cham')
+    assert {row[4] for row in rows} <= {'Kampong Cham'}
+    assert people.count(filters) == len(rows)
+
+
+def test_same_shape_same_sql(people):
+    first, first_params, _ = people.search_sql(repository.normalize_filters({'gender': 'male', 'name': 'Sok'}))
+    second, second_params, _ = people.search_sql(repository.normalize_filters({'gender': 'female', 'name': 'Dara'}))
+    # Values are bound, never pasted into the SQL text
+    assert first == second
+    assert first_params['name'] == '"Sok"' and second_params['name'] == '"Dara"'
+    assert 'Sok' not in first
+
+
+def test_results_without_fts(db_copy):
+    path = db_copy()
+    conn = sqlite3.connect(path)
+    search_index.drop_search_index(conn)
+    conn.close()
+    people = repository.PeopleRepository(repository.SQLiteBackend(path))
+    filters = repository.normalize_filters({'name': 'Chan', 'gender': 'male'})
+    query, params, _ = people.search_sql(filters)
+    assert 'LIKE' in query and params['name'] == '%Chan%'
+    assert [row[0] for row in people.iter_rows(filters)] == expected_ids(path, filters)
+    people.backend.close()
+
+
+def test_counts_are_cached(people):
+    filters = repository.normalize_filters({'gender': 'male'})
+    total = people.count(filters)
+    hits = people.count_cache.hits
+    assert people.count(filters) == total
+    assert people.count_cache.hits == hits + 1
+
+
+def test_pool_reuses_connections(db_path):
+    backend = repository.SQLiteBackend(db_path, read_only=True, pool_size=1)
+    with backend.connection() as conn:
+        first = conn
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM people")
+    with backend.connection() as conn:
+        assert conn is first
+        # A second connection while the first is out is opened fresh ...
+        other = backend.acquire()
+        assert other is not first
+    # ... and closed when the pool is already full
+    backend.release(other)
+    with pytest.raises(sqlite3.ProgrammingError):
+        other.execute("SELECT 1")
+    backend.close()
+
+
+def test_release_rolls_back(db_copy):
+    path = db_copy()
+    backend = repository.SQLiteBackend(path)
+    with backend.connection() as conn:
+        conn.execute("DELETE FROM people")
+        assert conn.in_transaction
+    with backend.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM people").fetchone()[0] > 0
+    backend.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
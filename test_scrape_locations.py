@@ -0,0 +1,214 @@
+"""
+Tests for the concurrent gazetteer scraper (scrape_locations.py), run
+against the local stand-in server of scrape_fixtures.py
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+from email.utils import formatdate
+
+import pytest
+
+pytest.importorskip('aiohttp')
+pytest.importorskip('bs4')
+
+from aiohttp import web
+
+import import_cambodia_locations as importer
+import scrape_fixtures
+import scrape_locations
+from scrape_locations import GazetteerScraper, ResponseCache, TokenBucket, page_key
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKBOOK = os.path.join(HERE, 'camboia.xlsx')
+
+
+@pytest.fixture(scope='module')
+def fixture_dir(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('scrape') / 'fixtures')
+    scrape_fixtures.build_fixtures(WORKBOOK, directory)
+    return directory
+
+
+def two_provinces(fixture_dir):
+    """The fixture pages, with only Kep and Pailin on the province list"""
+    served = ResponseCache(fixture_dir)
+    rows = scrape_locations.parse_rows(served.get(page_key())[1])
+    served.put(page_key(), scrape_fixtures.render_page('Provinces', [
+        (row['code'], row['khmer'], row['english']) for row in rows if row['english'] in ('Kep', 'Pailin')]))
+    return served
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def run_scraper(served, server=None, port=None, **options):
+    """Serve `served` locally and scrape it; returns (scraper, provinces, server stats)"""
+    app = scrape_fixtures.make_app(served, **(server or {}))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    # The checkpoint is tied to the base URL, so resumed runs need the same port
+    await web.TCPSite(runner, '127.0.0.1', port or 0).start()
+    host, port = runner.addresses[0][:2]
+    options = dict({'concurrency': 16, 'rate': 0, 'retries': 0}, **options)
+    scraper = GazetteerScraper(base_url=f"http://{host}:{port}{scrape_fixtures.VIEW_PATH}", **options)
+    try:
+        provinces = await scraper.run()
+    finally:
+        await runner.cleanup()
+    return scraper, provinces, app[scrape_fixtures.STATS_KEY]
+
+
+def scrape(served, server=None, **options):
+    return asyncio.run(run_scraper(served, server, **options))
+
+
+def village_paths(provinces):
+    return sorted((province['english'], district['english'], commune['english'], village['english'])
+                  for province in provinces for district in province['districts']
+                  for commune in district['communes'] for village in commune['villages'])
+
+
+def test_parse_rows():
+    body = scrape_fixtures.render_page('Kep', [('2301', 'ដំណាក់ចង្អើរ', 'Damnak Chang\'aeur'),
+                                               ('2302', 'កែប', 'Kaeb & Co')])
+    assert scrape_locations.parse_rows(body) == [
+        {'code': '2301', 'khmer': 'ដំណាក់ចង្អើរ', 'english': "Damnak Chang'aeur"},
+        {'code': '2302', 'khmer': 'កែប', 'english': 'Kaeb & Co'},
+    ]
+    assert scrape_locations.parse_rows(scrape_fixtures.render_page('Empty', [])) == []
+
+
+def test_page_key():
+    assert page_key() == 'index.castle'
+    assert page_key('districts', '01') == 'pro_district.castle?pv_code=01'
+    assert page_key('villages', '010201') == 'commune_village.castle?cm_code=010201'
+
+
+def test_retry_after():
+    assert scrape_locations._retry_after('3') == 3.0
+    assert scrape_locations._retry_after('-3') == 0.0
+    assert 8 < scrape_locations._retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert scrape_locations._retry_after('soon') is None
+    assert scrape_locations._retry_after(None) is None
+
+
+def test_token_bucket():
+    async def timed(bucket, requests):
+        start = time.monotonic()
+        for _ in range(requests):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(timed(TokenBucket(0), 1000)) < 0.1
+    # A burst of 5 goes straight through; the next 5 at 50 per second
+    assert 0.08 < asyncio.run(timed(TokenBucket(50, burst=5), 10)) < 0.3
+
+    async def paused():
+        bucket = TokenBucket(50, burst=5)
+        bucket.pause(0.2)
+        return await timed(bucket, 1)
+
+    assert asyncio.run(paused()) >= 0.2
+
+
+def test_response_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache'))
+    cache.put('a', b'same body', {'ETag': '"x"'})
+    cache.put('b', b'same body')
+    assert len(cache) == 2
+    assert len(os.listdir(tmp_path / 'cache' / 'objects')) == 1
+    cache.save()
+
+    reloaded = ResponseCache(str(tmp_path / 'cache'))
+    entry, body = reloaded.get('a')
+    assert body == b'same body' and entry['etag'] == '"x"'
+    assert reloaded.get('missing') == (None, None)
+    fetched = entry['fetched']
+    time.sleep(0.01)
+    reloaded.touch('a')
+    assert reloaded.get('a')[0]['fetched'] > fetched
+
+
+def test_scrape_matches_the_workbook(fixture_dir, tmp_path):
+    served = ResponseCache(fixture_dir)
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    scraper, provinces, stats = scrape(served, {'latency': 0.002}, checkpoint_path=checkpoint)
+
+    expected = sorted(row[1:] for row in importer.iter_villages(WORKBOOK))
+    assert village_paths(provinces) == expected
+    districts = [district for province in provinces for district in province['districts']]
+    communes = [commune for district in districts for commune in district['communes']]
+    assert (len(provinces), len(communes)) == (25, 1547)
+    # One page per province, district and commune, plus the index, each fetched once
+    assert 1 + len(provinces) + len(districts) + len(communes) == len(served)
+    assert scraper.missing == [] and scraper.stats['fetched'] == stats['requests'] == len(served)
+    assert 1 < stats['max_in_flight'] <= 16
+    assert not os.path.exists(checkpoint)
+
+
+def test_cached_rerun(fixture_dir, tmp_path):
+    served = two_provinces(fixture_dir)
+    cache_dir = str(tmp_path / 'cache')
+    scraper, provinces, _ = scrape(served, cache=ResponseCache(cache_dir))
+    pages = scraper.stats['fetched']
+    assert [province['english'] for province in provinces] == ['Kep', 'Pailin']
+    assert len(ResponseCache(cache_dir)) == pages
+
+    # Fresh pages come from the cache without a request
+    scraper, again, stats = scrape(served, cache=ResponseCache(cache_dir))
+    assert again == provinces
+    assert stats['requests'] == 0 and scraper.stats['cached'] == pages
+
+    # Stale ones are revalidated and answered with 304
+    scraper, again, stats = scrape(served, cache=ResponseCache(cache_dir), refresh=True)
+    assert again == provinces
+    assert stats['not_modified'] == scraper.stats['revalidated'] == pages
+
+    # An unreachable server leaves the cached copies in use
+    scraper, again, stats = scrape(served, {'error_rate': 1.0}, cache=ResponseCache(cache_dir), refresh=True)
+    assert again == provinces
+    assert scraper.stats['stale'] == stats['errors'] == pages
+
+
+def test_missing_page_keeps_the_checkpoint(fixture_dir, tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    port = free_port()
+    complete = two_provinces(fixture_dir)
+    _, expected, _ = scrape(complete, port=port, checkpoint_path=checkpoint)
+
+    incomplete = two_provinces(fixture_dir)
+    commune = expected[1]['districts'][0]['communes'][0]
+    key = page_key('villages', commune['code'])
+    del incomplete.index[key]
+    scraper, provinces, _ = scrape(incomplete, port=port, checkpoint_path=checkpoint)
+    assert scraper.missing == [key]
+    with open(checkpoint, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert key not in saved['pages'] and len(saved['pages']) == scraper.stats['fetched']
+    assert len(village_paths(provinces)) == len(village_paths(expected)) - len(commune['villages'])
+
+    # The next run fetches only the missing page and completes the tree
+    scraper, resumed, stats = scrape(complete, port=port, checkpoint_path=checkpoint)
+    assert scraper.missing == [] and stats['requests'] == 1
+    assert scraper.stats['resumed'] == len(saved['pages'])
+    assert resumed == expected
+    assert not os.path.exists(checkpoint)
+
+
+def test_retry_after_without_a_rate_limit(fixture_dir):
+    served = ResponseCache(fixture_dir)
+    start = time.monotonic()
+    scraper, provinces, stats = scrape(served, {'error_rate': 1.0, 'retry_after': 1}, retries=1)
+    assert time.monotonic() - start >= 1
+    assert provinces == [] and scraper.missing == [page_key()]
+    assert stats['requests'] == 2 and scraper.stats['retries'] == 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
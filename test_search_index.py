@@ -0,0 +1,82 @@
+"""
+Tests for the FTS5 name search index (search_index.py)
+Searches through the index must find exactly the rows LIKE '%term%' finds
+"""
+import sqlite3
+
+import pytest
+
+import search_index
+
+TERMS = ['Sok', 'sokha', 'Chan', 'ara', 'a Ch', 'xyz']
+
+
+def name_ids(conn, term):
+    sql, params = search_index.name_filter_sql(conn, term)
+    return {row[0] for row in conn.execute(f"SELECT id FROM people WHERE {sql}", params)}
+
+
+def like_ids(conn, term):
+    pattern = f"%{term}%"
+    return {row[0] for row in conn.execute(
+        "SELECT id FROM people WHERE name LIKE ? OR first_name LIKE ? OR last_name LIKE ?",
+        (pattern, pattern, pattern))}
+
+
+def test_match_expression():
+    assert search_index.match_expression('  Sok ') == '"Sok"'
+    assert search_index.match_expression('a"b') == '"a""b"'
+    assert search_index.match_expression('So') is None
+    assert search_index.match_expression(None) is None
+
+
+@pytest.mark.parametrize('term', TERMS)
+def test_index_matches_like(db_copy, term):
+    conn = sqlite3.connect(db_copy())
+    assert search_index.has_search_index(conn)
+    assert name_ids(conn, term) == like_ids(conn, term)
+    conn.close()
+
+
+def test_short_terms_fall_back_to_like(db_copy):
+    conn = sqlite3.connect(db_copy())
+    sql, params = search_index.name_filter_sql(conn, 'ok')
+    assert 'LIKE' in sql and params == ['%ok%'] * 3
+    assert name_ids(conn, 'ok') == like_ids(conn, 'ok')
+    conn.close()
+
+
+def test_triggers_keep_index_in_sync(db_copy):
+    conn = sqlite3.connect(db_copy())
+    person_id = conn.execute(
+        "INSERT INTO people (name, first_name, last_name, gender, age, village_id) "
+        "SELECT 'Zzyxa Qwop', 'Zzyxa', 'Qwop', 'female', 30, MIN(id) FROM locations"
+    ).lastrowid
+    assert name_ids(conn, 'zzyx') == {person_id}
+
+    conn.execute("UPDATE people SET name = 'Vvelo Qwop', first_name = 'Vvelo' WHERE id = ?", (person_id,))
+    assert name_ids(conn, 'zzyx') == set()
+    assert name_ids(conn, 'vvel') == {person_id}
+
+    conn.execute("DELETE FROM people WHERE id = ?", (person_id,))
+    assert name_ids(conn, 'qwop') == set()
+    conn.close()
+
+
+def test_drop_and_rebuild(db_copy):
+    conn = sqlite3.connect(db_copy())
+    expected = like_ids(conn, 'Sok')
+
+    search_index.drop_search_index(conn)
+    assert not search_index.has_search_index(conn)
+    assert 'LIKE' in search_index.name_filter_sql(conn, 'Sok')[0]
+    assert name_ids(conn, 'Sok') == expected
+
+    search_index.create_search_index(conn)
+    assert search_index.MATCH_SQL == search_index.name_filter_sql(conn, 'Sok')[0]
+    assert name_ids(conn, 'Sok') == expected
+    conn.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
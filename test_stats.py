@@ -0,0 +1,118 @@
+"""
+Tests for the people_stats aggregates (stats.py) and /api/stats
+The triggers must keep people_stats equal to a GROUP BY over people
+"""
+import sqlite3
+
+import pytest
+
+import stats
+
+GROUP_SQL = f"""
+    SELECT {', '.join(stats.KEY_COLUMNS)}, COUNT(*)
+    FROM people_view GROUP BY {', '.join(stats.KEY_COLUMNS)}
+"""
+
+
+def actual_groups(conn):
+    return {row[:-1]: row[-1] for row in conn.execute(GROUP_SQL)}
+
+
+def stats_groups(conn):
+    return {row[:-1]: row[-1] for row in conn.execute(
+        f"SELECT {', '.join(stats.KEY_COLUMNS)}, count FROM {stats.STATS_TABLE} WHERE count > 0")}
+
+
+@pytest.fixture
+def conn(db_copy):
+    conn = sqlite3.connect(db_copy())
+    yield conn
+    conn.close()
+
+
+def test_build_matches_people(conn):
+    assert stats.has_stats(conn)
+    assert stats_groups(conn) == actual_groups(conn)
+    assert stats.total_people(conn) == conn.execute("SELECT COUNT(*) FROM people").fetchone()[0]
+    assert stats.total_people(conn, 'Kampong Cham') == conn.execute(
+        "SELECT COUNT(*) FROM people_view WHERE province = 'Kampong Cham'").fetchone()[0]
+
+
+def test_triggers_follow_writes(conn):
+    villages = [row[0] for row in conn.execute("SELECT id FROM locations ORDER BY id LIMIT 2")]
+    conn.executemany(
+        "INSERT INTO people (name, gender, age, village_id) VALUES ('Test Person', ?, ?, ?)",
+        [('male', 30, villages[0]), ('female', 30, villages[0]), ('male', 30, villages[0])])
+    assert stats_groups(conn) == actual_groups(conn)
+
+    conn.execute("UPDATE people SET age = age + 1 WHERE id IN (SELECT id FROM people ORDER BY id LIMIT 50)")
+    conn.execute("UPDATE people SET village_id = ? WHERE id % 7 = 0", (villages[1],))
+    conn.execute("UPDATE people SET gender = 'female' WHERE gender = 'male' AND age = 31")
+    assert stats_groups(conn) == actual_groups(conn)
+
+    conn.execute("DELETE FROM people WHERE id % 5 = 0")
+    conn.commit()
+    assert stats_groups(conn) == actual_groups(conn)
+
+    # Name changes do not touch the aggregates
+    before = stats_groups(conn)
+    conn.execute("UPDATE people SET name = 'Renamed' WHERE id < 100")
+    assert stats_groups(conn) == before
+
+
+def test_add_people_after_bulk_load(conn):
+    last_id = conn.execute("SELECT MAX(id) FROM people").fetchone()[0]
+    for trigger in stats.TRIGGERS:
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("""
+        INSERT INTO people (name, gender, age, village_id)
+        SELECT name, gender, age, village_id FROM people WHERE id <= 500
+    """)
+    assert stats_groups(conn) != actual_groups(conn)
+
+    stats.add_people_after(conn, last_id)
+    stats.install_triggers(conn)
+    assert stats_groups(conn) == actual_groups(conn)
+
+
+def test_drop_and_empty_table(conn):
+    stats.drop_stats(conn)
+    # An empty people_stats (as db.create_all() leaves it) is not "built"
+    assert not stats.has_stats(conn)
+    assert stats.total_people(conn) == 0
+    stats.build_stats(conn)
+    assert stats.has_stats(conn)
+    assert stats_groups(conn) == actual_groups(conn)
+
+
+def test_api_stats(login, db_path):
+    conn = sqlite3.connect(db_path)
+    by_province = dict(conn.execute("SELECT province, COUNT(*) FROM people_view GROUP BY province"))
+    total = sum(by_province.values())
+    conn.close()
+
+    client = login('admin')
+    assert client.get('/api/stats').get_json() == {'total': total, 'groups': []}
+    data = client.get('/api/stats?group_by=province').get_json()
+    assert {g['province']: g['count'] for g in data['groups']} == by_province
+    assert data['total'] == total
+    assert client.get('/api/stats?group_by=name').status_code == 400
+
+    data = client.get('/api/stats?group_by=gender&min_age=20&max_age=29&province=Kampot').get_json()
+    assert {g['gender'] for g in data['groups']} <= {'male', 'female'}
+    assert data['total'] == sum(g['count'] for g in data['groups'])
+
+
+def test_api_stats_manager_province(login, db_path):
+    conn = sqlite3.connect(db_path)
+    own = conn.execute("SELECT COUNT(*) FROM people_view WHERE province = 'Kampong Cham'").fetchone()[0]
+    conn.close()
+
+    client = login('kampong_cham')
+    data = client.get('/api/stats?group_by=province').get_json()
+    assert data == {'total': own, 'groups': [{'province': 'Kampong Cham', 'count': own}]}
+    assert client.get('/api/stats?province=Battambang').get_json()['total'] == 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
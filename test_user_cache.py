@@ -0,0 +1,103 @@
+"""
+Tests for the in-process cache of logged-in users (user_cache.py)
+"""
+import warnings
+
+import pytest
+
+import user_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(user_cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_entries_expire(clock):
+    cache = user_cache.UserCache(ttl=60)
+    cache.set(1, {'id': 1})
+    clock.now += 59
+    assert cache.get(1) == {'id': 1}
+    clock.now += 2
+    assert cache.get(1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not cache._entries
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = user_cache.UserCache(max_entries=2)
+    cache.set(1, {'id': 1})
+    cache.set(2, {'id': 2})
+    cache.get(1)
+    cache.set(3, {'id': 3})
+    assert cache.get(2) is None
+    assert cache.get(1) == {'id': 1} and cache.get(3) == {'id': 3}
+
+
+def test_invalidate(clock):
+    cache = user_cache.UserCache()
+    for user_id in (1, 2, 3):
+        cache.set(user_id, {'id': user_id})
+    cache.invalidate(2)
+    assert cache.get(2) is None and cache.get(1) == {'id': 1}
+    cache.invalidate()
+    assert cache.get(1) is None and cache.get(3) is None
+    assert cache.invalidations == 2
+
+
+def test_load_user_hands_out_fresh_instances(app):
+    from sqlalchemy.exc import LegacyAPIWarning
+    from app import User
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        user_cache.invalidate()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', LegacyAPIWarning)
+            first = user_cache.load_user(User, str(admin.id))
+        hits = user_cache.cache_stats()['hits']
+        second = user_cache.load_user(User, admin.id)
+        third = user_cache.load_user(User, admin.id)
+        assert user_cache.cache_stats()['hits'] == hits + 2
+        assert first is not second and second is not third
+        for field in user_cache.USER_FIELDS:
+            assert getattr(second, field) == getattr(admin, field)
+        assert user_cache.load_user(User, 10 ** 9) is None
+
+
+def test_deleted_user_is_logged_out(login):
+    admin = login('admin')
+    response = admin.post('/users/create', data={'username': 'short_lived', 'password': 'pw', 'role': 'user'})
+    assert response.status_code == 302
+
+    client = admin.application.test_client()
+    assert client.post('/login', data={'username': 'short_lived', 'password': 'pw'}).status_code == 302
+    assert client.get('/history').status_code == 200
+    assert client.get('/history').status_code == 200
+
+    from app import User
+    with admin.application.app_context():
+        user_id = User.query.filter_by(username='short_lived').first().id
+    admin.get(f'/users/delete/{user_id}')
+    # The cached entry went with the user, well inside the TTL
+    response = client.get('/history')
+    assert response.status_code == 302 and '/login' in response.headers['Location']
+
+
+def test_cache_stats_endpoint(login):
+    stats = login('admin').get('/api/cache-stats').get_json()
+    assert set(stats['users']) == {'hits', 'misses', 'hit_rate', 'invalidations', 'entries'}
+    assert login('kampong_cham').get('/api/cache-stats').status_code == 403
+
+
+if __name__ == '__main__':
+    raise SystemExit(pytest.main([__file__, '-v']))
@@ -2,12 +2,20 @@
 Update all existing names in the database to authentic Khmer names
 This script will update all 10 million records with real Cambodian names
 """
+import sys
 from app import app
 from models import db, Person
 from khmer_names import get_random_khmer_name
-from sqlalchemy import text
+from batch_migration import BatchMigration
 
-def update_names_to_khmer(batch_size=10000):
+def set_khmer_names(cursor, rows):
+    """Give each (id, gender) row a random Khmer full name"""
+    cursor.executemany(
+        "UPDATE people SET name = ? WHERE id = ?",
+        [(get_random_khmer_name(gender), person_id) for person_id, gender in rows]
+    )
+
+def update_names_to_khmer(batch_size=10000, restart=False):
     """Update all existing names to Khmer names"""
     with app.app_context():
         print("Starting Khmer name update process...")
@@ -28,34 +36,20 @@ def update_names_to_khmer(batch_size=10000):
             return
         
         print("\nUpdating names in batches...")
-        updated_count = 0
+        print("Progress is checkpointed; if interrupted, run the script again to resume")
         
-        # Process in batches for better performance
-        offset = 0
-        while offset < total:
-            # Fetch batch of people
-            people = db.session.query(Person).offset(offset).limit(batch_size).all()
-            
-            if not people:
-                break
-            
-            # Update each person's name
-            for person in people:
-                # Generate Khmer name based on gender
-                khmer_name = get_random_khmer_name(person.gender)
-                person.name = khmer_name
-            
-            # Commit batch
-            db.session.commit()
-            updated_count += len(people)
-            offset += batch_size
-            
-            # Progress update
-            progress = (updated_count / total) * 100
-            print(f"Updated {updated_count:,} / {total:,} ({progress:.1f}%)")
+        connection = db.engine.raw_connection()
+        try:
+            migration = BatchMigration(connection, 'khmer_names', set_khmer_names,
+                                       columns=('id', 'gender'), batch_size=batch_size, repeatable=True)
+            if restart:
+                migration.reset()
+            updated_count = migration.run()
+        finally:
+            connection.close()
         
         print(f"\n✅ Successfully updated {updated_count:,} names to authentic Khmer names!")
         print("All people now have real Cambodian names.")
 
 if __name__ == '__main__':
-    update_names_to_khmer()
+    update_names_to_khmer(restart='--restart' in sys.argv)
@@ -0,0 +1,102 @@
+"""
+In-process cache of logged-in users
+Flask-Login's user_loader runs on every authenticated request, and each
+call used to be a users-table lookup. Users rarely change, so their
+column values are kept here for a short TTL and handed back as fresh User
+objects outside any session. create/delete in the web app invalidate
+entries explicitly; the TTL bounds how long a change made by another
+process (init_db.py, a second server) can go unnoticed. The web app has no
+route that edits a user, so role and province changes, which only the
+scripts make (migrate_db.py, fix_manager_provinces.py), take up to
+USER_CACHE_TTL seconds to reach logged-in sessions
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Columns copied out of a loaded User
+USER_FIELDS = ('id', 'username', 'password', 'role', 'province', 'created_at')
+
+
+class UserCache:
+    """Thread-safe LRU of user column values with a time-to-live"""
+
+    def __init__(self, ttl=60, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        """Cached column values for `user_id`, or None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (values, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Forget one user, or every user when `user_id` is None"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+            self.invalidations += 1
+
+
+_cache = UserCache()
+
+
+def configure(ttl=None, max_entries=None):
+    """Apply cache settings from the application config"""
+    if ttl is not None:
+        _cache.ttl = ttl
+    if max_entries is not None:
+        _cache.max_entries = max_entries
+
+
+def load_user(model, user_id):
+    """
+    The `model` row with primary key `user_id`, from the cache when
+    possible. Hits return a new, session-less instance built from the
+    cached values, so nothing is shared between requests or sessions.
+    """
+    user_id = int(user_id)
+    values = _cache.get(user_id)
+    if values is None:
+        user = model.query.session.get(model, user_id)
+        if user is None:
+            return None
+        values = {field: getattr(user, field) for field in USER_FIELDS}
+        _cache.set(user_id, values)
+        return user
+    return model(**values)
+
+
+def invalidate(user_id=None):
+    """Forget a cached user (after it changed or was deleted), or all of them"""
+    _cache.invalidate(user_id)
+
+
+def cache_stats():
+    """Hit/miss counters for the user cache"""
+    lookups = _cache.hits + _cache.misses
+    return {'hits': _cache.hits, 'misses': _cache.misses,
+            'hit_rate': round(_cache.hits / lookups, 3) if lookups else None,
+            'invalidations': _cache.invalidations, 'entries': len(_cache._entries)}
@@ -38,7 +38,7 @@ def verify_migration():
     print("-" * 80)
     cursor.execute("""
         SELECT id, first_name, last_name, gender, province 
-        FROM people 
+        FROM people_view 
         LIMIT 20
     """)
     